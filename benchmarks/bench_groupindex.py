@@ -0,0 +1,75 @@
+"""
+Compare boolean masking with GroupIndex selection.
+
+Selects every condition x plate group of a synthetic per-cell table, the
+access pattern of select_datapoints and the per-condition plot loops:
+
+    python benchmarks/bench_groupindex.py --rows 10000000 --conditions 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.groupindex import GroupIndex
+
+
+def synthetic_data(rows: int, conditions: int, plates: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "plate_id": rng.integers(0, plates, rows),
+            "condition": pd.Series(
+                [f"cond{i}" for i in range(conditions)]
+            ).take(rng.integers(0, conditions, rows)).to_numpy(),
+            "cell_line": "RPE-1_WT",
+            "area_nucleus": rng.normal(200, 30, rows),
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--conditions", type=int, default=50)
+    parser.add_argument("--plates", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_data(args.rows, args.conditions, args.plates)
+    conditions = sorted(df.condition.unique())
+    plates = sorted(df.plate_id.unique())
+
+    start = time.perf_counter()
+    masked = 0
+    for condition in conditions:
+        for plate_id in plates:
+            masked += len(
+                df[(df.condition == condition) & (df.plate_id == plate_id)]
+            )
+    mask_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = GroupIndex.from_frame(df, ["condition", "plate_id"])
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = 0
+    for condition in conditions:
+        for plate_id in plates:
+            indexed += len(
+                index.select(df, condition=condition, plate_id=plate_id)
+            )
+    select_time = time.perf_counter() - start
+    assert masked == indexed == len(df)
+
+    groups = len(conditions) * len(plates)
+    print(f"{args.rows:,} rows, {groups} condition x plate groups")
+    print(f"boolean masks      {mask_time:8.2f} s")
+    print(f"GroupIndex build   {build_time:8.2f} s")
+    print(f"GroupIndex select  {select_time:8.2f} s")
+    print(f"speed-up           {mask_time / (build_time + select_time):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
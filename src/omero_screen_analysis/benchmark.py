@@ -0,0 +1,325 @@
+"""
+Performance budgets of the public plot functions.
+
+Each benchmark runs one plot function on a fixed synthetic screen in a
+fresh worker process and records the median wall time of a few calls after
+a warm-up call, and how far the resident memory peaks during these calls
+above its level after the imports, the dataset and the warm-up, so that the
+interpreter and library overhead does not hide the memory of the plot
+itself. check_budget
+compares a result with a stored baseline. Wall times are scaled by a short
+NumPy/pandas calibration workload timed on both machines, so baselines
+recorded on a workstation remain usable on a slower CI runner::
+
+    results = [run_benchmark(name) for name in BENCHMARKS]
+    baselines = load_baselines("tests/perf/baselines.json")
+    for result in results:
+        print(check_budget(result, baselines))
+
+The tests in tests/perf run these with ``pytest --perf`` and record new
+baselines with ``pytest --perf --update-baselines``.
+"""
+
+import contextlib
+import gc
+import json
+import statistics
+import sys
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.profiling import current_rss
+
+CONDITIONS = ["NT", "SCR", "siCCNA2", "siCDK4"]
+PHASES = ["Sub-G1", "G1", "S", "G2/M", "Polyploid"]
+CLASSES = ["normal", "micro", "collapsed"]
+
+
+def synthetic_screen(
+    n_cells: int = 20_000,
+    conditions: Iterable[str] = CONDITIONS,
+    plates: int = 3,
+    wells: int = 2,
+    cell_line: str = "RPE-1_WT",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    A reproducible per-cell screen with the columns of the plot functions.
+
+    Cells are spread evenly over plates x conditions x wells; DAPI and EdU
+    intensities follow a G1/S/G2 mixture matching the phase of each cell.
+    """
+    rng = np.random.default_rng(seed)
+    conditions = list(conditions)
+    n_wells = plates * len(conditions) * wells
+    well = np.arange(n_cells) % n_wells
+    plate = well // (len(conditions) * wells)
+    condition = (well // wells) % len(conditions)
+    phase = rng.choice(len(PHASES), n_cells, p=[0.02, 0.55, 0.25, 0.15, 0.03])
+    dna = np.array([1.0, 2.0, 3.0, 4.0, 8.0])[phase]
+    dna = dna * rng.lognormal(0, 0.08, n_cells)
+    edu = np.where(phase == 2, 8.0, 1.0) * rng.lognormal(0, 0.3, n_cells)
+    return pd.DataFrame(
+        {
+            "experiment": "synthetic",
+            "plate_id": 1000 + plate,
+            "well": [f"{chr(65 + w // 12)}{w % 12 + 1}" for w in well],
+            "well_id": 50_000 + well,
+            "cell_line": cell_line,
+            "condition": np.array(conditions)[condition],
+            "area_nucleus": rng.lognormal(5.5, 0.3, n_cells),
+            "intensity_mean_p21_nucleus": rng.lognormal(7.5, 0.5, n_cells),
+            "integrated_int_DAPI_norm": dna,
+            "intensity_mean_EdU_nucleus_norm": edu,
+            "cell_cycle": np.array(PHASES)[phase],
+            "Class": np.array(CLASSES)[
+                rng.choice(3, n_cells, p=[0.8, 0.15, 0.05])
+            ],
+        }
+    )
+
+
+def synthetic_combination(
+    doses: int = 6, cells_per_well: int = 300, seed: int = 0
+) -> pd.DataFrame:
+    """A reproducible drug x inhibitor dose matrix, one well per dose pair."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for drug in range(doses):
+        for inhibitor in range(doses):
+            cells = int(cells_per_well * 0.9**drug * 0.85**inhibitor)
+            cells += int(rng.integers(0, 20))
+            rows.append(
+                pd.DataFrame(
+                    {
+                        "cell_line": "RPE-1_WT",
+                        "well": f"{drug}_{inhibitor}",
+                        "drug": drug,
+                        "inhibitor": inhibitor * 10,
+                    },
+                    index=range(cells),
+                )
+            )
+    return pd.concat(rows, ignore_index=True)
+
+
+_SCREEN = {"conditions": CONDITIONS, "selector_val": "RPE-1_WT"}
+
+# name -> (plot function, dataset factory, keyword arguments)
+BENCHMARKS: dict[str, tuple[str, Callable[[], pd.DataFrame], dict[str, Any]]] = {
+    "cellcycle_plot": ("cellcycle_plot", synthetic_screen, _SCREEN),
+    "count_plot": (
+        "count_plot",
+        synthetic_screen,
+        {"norm_control": "NT", **_SCREEN},
+    ),
+    "feature_plot": (
+        "feature_plot",
+        synthetic_screen,
+        {"feature": "intensity_mean_p21_nucleus", **_SCREEN},
+    ),
+    "comb_plot": (
+        "comb_plot",
+        synthetic_screen,
+        {
+            "feature_col": "intensity_mean_p21_nucleus",
+            "feature_y_lim": 8000,
+            "cell_number": 2000,
+            **_SCREEN,
+        },
+    ),
+    "plot_classification": (
+        "plot_classification",
+        synthetic_screen,
+        {"classes": CLASSES, **_SCREEN},
+    ),
+    "plot_synergies": (
+        "plot_synergies",
+        synthetic_combination,
+        {"agent1": "drug", "agent2": "inhibitor"},
+    ),
+}
+
+
+@dataclass
+class BenchmarkResult:
+    """Median wall time and peak memory increase of one benchmark."""
+
+    name: str
+    seconds: float
+    peak_increase_mb: float
+    calibration: float
+
+
+def _reset_peak_rss() -> None:
+    """Reset the peak resident memory of the process to the current one."""
+    # Linux only; elsewhere the peak since process start is kept
+    with contextlib.suppress(OSError):
+        Path("/proc/self/clear_refs").write_text("5")
+
+
+def _peak_rss() -> int:
+    try:
+        status = Path("/proc/self/status").read_text()
+    except OSError:
+        status = ""
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    try:
+        import resource
+    except ImportError:
+        return current_rss()
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def calibrate(repeat: int = 9) -> float:
+    """
+    Seconds of a fixed NumPy and pandas workload, the fastest of repeat
+    runs after a warm-up, which is the least affected by other load on the
+    machine.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=1_000_000)
+    keys = rng.integers(0, 1000, 1_000_000)
+    times = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        np.sort(values)
+        pd.Series(values).groupby(keys).median()
+        np.histogram(values, bins=256)
+        times.append(time.perf_counter() - start)
+    return min(times[1:])
+
+
+def _measure(name: str, repeat: int) -> BenchmarkResult:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from omero_screen_analysis.render import get_plot_function
+
+    plot, dataset, kwargs = BENCHMARKS[name]
+    func = get_plot_function(plot)
+    df = dataset()
+    # the first call warms up fonts and caches
+    func(df, **kwargs, save=False)
+    plt.close("all")
+    gc.collect()
+    baseline = current_rss()
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df, **kwargs, save=False)
+        times.append(time.perf_counter() - start)
+        plt.close("all")
+    return BenchmarkResult(
+        name=name,
+        seconds=statistics.median(times),
+        peak_increase_mb=max(_peak_rss() - baseline, 0) / 2**20,
+        calibration=calibrate(),
+    )
+
+
+def run_benchmark(name: str, repeat: int = 3) -> BenchmarkResult:
+    """Run a benchmark of BENCHMARKS in a fresh worker process."""
+    if name not in BENCHMARKS:
+        raise ValueError(
+            f"Unknown benchmark '{name}', expected one of {sorted(BENCHMARKS)}"
+        )
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_measure, name, repeat).result()
+
+
+def load_baselines(path: Path | str) -> dict[str, dict[str, float]]:
+    """Baselines by benchmark name, empty if the file does not exist."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())  # type: ignore[no-any-return]
+
+
+def save_baselines(
+    results: Iterable[BenchmarkResult], path: Path | str
+) -> None:
+    """Add or replace the baselines of results in the file at path."""
+    baselines = load_baselines(path)
+    for result in results:
+        record = asdict(result)
+        name = record.pop("name")
+        baselines[name] = {key: round(value, 4) for key, value in record.items()}
+    Path(path).write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+
+def check_budget(
+    result: BenchmarkResult,
+    baselines: dict[str, dict[str, float]],
+    time_tolerance: float = 1.5,
+    rss_tolerance: float = 1.5,
+    min_seconds: float = 0.25,
+    min_mb: float = 10.0,
+) -> list[str]:
+    """
+    Budgets exceeded by result, empty if it is within budget.
+
+    The time budget is the baseline times time_tolerance, scaled by the
+    ratio of the calibration times and at least min_seconds above the
+    baseline; the memory budget is the baseline peak increase times
+    rss_tolerance and at least min_mb above it.
+
+    Raises
+    ------
+    KeyError
+        If there is no baseline for the benchmark.
+    """
+    baseline = baselines[result.name]
+    speed = result.calibration / baseline["calibration"]
+    expected = baseline["seconds"] * speed
+    time_budget = max(expected * time_tolerance, expected + min_seconds)
+    rss_budget = max(
+        baseline["peak_increase_mb"] * rss_tolerance,
+        baseline["peak_increase_mb"] + min_mb,
+    )
+    exceeded = []
+    if result.seconds > time_budget:
+        exceeded.append(
+            f"{result.name} took {result.seconds:.2f} s, budget "
+            f"{time_budget:.2f} s (baseline {baseline['seconds']:.2f} s "
+            f"x {speed:.2f} machine speed)"
+        )
+    if result.peak_increase_mb > rss_budget:
+        exceeded.append(
+            f"{result.name} peaked {result.peak_increase_mb:.0f} MB above "
+            f"its baseline memory, budget {rss_budget:.0f} MB (baseline "
+            f"{baseline['peak_increase_mb']:.0f} MB)"
+        )
+    return exceeded
+
+
+def format_results(
+    results: Iterable[BenchmarkResult],
+    baselines: Optional[dict[str, dict[str, float]]] = None,
+) -> pd.DataFrame:
+    """Tabulate results, with the ratio to their baseline if given."""
+    table = pd.DataFrame([asdict(r) for r in results]).set_index("name")
+    if baselines:
+        base = pd.DataFrame(baselines).T.reindex(table.index)
+        table["time_ratio"] = (
+            table["seconds"] / table["calibration"]
+        ) / (base["seconds"] / base["calibration"])
+        table["rss_ratio"] = (
+            table["peak_increase_mb"] / base["peak_increase_mb"]
+        )
+    return table
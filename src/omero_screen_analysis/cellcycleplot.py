@@ -6,11 +6,15 @@ import pandas as pd
 import seaborn as sns
 from matplotlib.axes import Axes
 
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.profiling import profile_stage, profiled
 from omero_screen_analysis.stats import set_significance_marks
 from omero_screen_analysis.utils import (
     save_fig,
     selector_val_filter,
     show_repeat_points,
+    stacked_bars,
+    stacked_proportions,
 )
 
 # Define figure size in inches
@@ -26,6 +30,7 @@ COLORS = prop_cycle.by_key()["color"]
 pd.options.mode.chained_assignment = None
 
 
+@profiled
 def cc_phase(df: pd.DataFrame, condition: str = "condition") -> pd.DataFrame:
     """Calculate the percentage of cells in each cell cycle phase for each condition"""
     return (
@@ -43,6 +48,7 @@ def cc_phase(df: pd.DataFrame, condition: str = "condition") -> pd.DataFrame:
     )
 
 
+@profiled
 def cellcycle_plot(
     df: pd.DataFrame,
     conditions: list[str],
@@ -53,11 +59,16 @@ def cellcycle_plot(
     colors: list[str] = COLORS,
     save: bool = True,
     path: Path | None = None,
+    index: GroupIndex | None = None,
 ) -> None:
-    """Plot the cell cycle phases for each condition"""
+    """Plot the cell cycle phases for each condition
+
+    index is an optional GroupIndex of df by condition_col and selector_col,
+    built once and reused to select the rows of each call.
+    """
     print(f"Plotting cell cycle quantifications for {selector_val}")
     df1 = selector_val_filter(
-        df, selector_col, selector_val, condition_col, conditions
+        df, selector_col, selector_val, condition_col, conditions, index
     )
     assert df1 is not None
     df1 = cc_phase(df1, condition=condition_col)
@@ -71,30 +82,32 @@ def cellcycle_plot(
         ]
         # y_max = df_phase["percent"].max() * 1.2
 
-        sns.barplot(
-            data=df_phase,
-            x=condition_col,
-            y="percent",
-            color=colors[i + 1],
-            order=conditions,
-            ax=axes,
-        )
-        show_repeat_points(
-            df=df_phase,
-            conditions=conditions,
-            condition_col=condition_col,
-            y_col="percent",
-            ax=axes,
-        )
-        if df1.plate_id.nunique() >= 3:
-            set_significance_marks(
-                axes,
-                df_phase,
-                conditions,
-                condition_col,
-                "percent",
-                axes.get_ylim()[1],
+        with profile_stage("draw"):
+            sns.barplot(
+                data=df_phase,
+                x=condition_col,
+                y="percent",
+                color=colors[i + 1],
+                order=conditions,
+                ax=axes,
             )
+            show_repeat_points(
+                df=df_phase,
+                conditions=conditions,
+                condition_col=condition_col,
+                y_col="percent",
+                ax=axes,
+            )
+        if df1.plate_id.nunique() >= 3:
+            with profile_stage("significance"):
+                set_significance_marks(
+                    axes,
+                    df_phase,
+                    conditions,
+                    condition_col,
+                    "percent",
+                    axes.get_ylim()[1],
+                )
         axes.set_title(f"{phase}", fontsize=6, y=1.05)
         if i in [1, 3]:
             axes.set_ylabel(None)
@@ -120,6 +133,7 @@ def cellcycle_plot(
         )
 
 
+@profiled
 def prop_pivot(
     df: pd.DataFrame, condition, conditions: list[str], H3: bool = False
 ):
@@ -135,43 +149,16 @@ def prop_pivot(
         else ["Sub-G1", "G1", "S", "G2", "M", "Polyploid"]
     )
 
-    df_prop1 = df_prop.copy()
-    df_prop1[condition] = pd.Categorical(
-        df_prop1[condition], categories=conditions, ordered=True
+    proportions = stacked_proportions(
+        df_prop, condition, "cell_cycle", "percent", conditions, cc_phases
     )
-    # Make cell_cycle a categorical with ordered phases
-    df_prop1["cell_cycle"] = pd.Categorical(
-        df_prop1["cell_cycle"], categories=cc_phases, ordered=True
-    )
-
-    df_mean = (
-        df_prop1.groupby([condition, "cell_cycle"], observed=False)["percent"]
-        .mean()
-        .sort_index(level=condition)
-        .reset_index()
-        .pivot_table(columns=["cell_cycle"], index=[condition], observed=False)
-    )
-    df_mean.columns = df_mean.columns.droplevel(0)
-    df_mean = df_mean[cc_phases]
-    if len(df_prop1.plate_id.unique()) > 1:
-        df_std = (
-            df_prop1.groupby([condition, "cell_cycle"], observed=False)[
-                "percent"
-            ]
-            .std()
-            .sort_index(level=condition)
-            .reset_index()
-            .pivot_table(
-                columns=["cell_cycle"], index=[condition], observed=False
-            )
-        )
-        df_std.columns = df_std.columns.droplevel(0)
-        df_std = df_std[cc_phases]
-    else:
+    df_mean, df_std = proportions.frames(condition, "cell_cycle")
+    if df_prop.plate_id.nunique() <= 1:
         df_std = pd.DataFrame(0, index=df_mean.index, columns=df_mean.columns)
     return df_mean, df_std
 
 
+@profiled
 def stacked_barplot(
     df: pd.DataFrame,
     conditions: list[str],
@@ -190,7 +177,10 @@ def stacked_barplot(
     assert df1 is not None  # tells type checker df1 is definitely not None
     df_mean, df_std = prop_pivot(df1, condition_col, conditions, H3)
     fig, ax = plt.subplots()
-    df_mean.plot(kind="bar", stacked=True, yerr=df_std, width=0.75, ax=ax)
+    with profile_stage("draw"):
+        stacked_bars(
+            ax, df_mean.to_numpy(), df_std.to_numpy(), df_mean.columns, colors
+        )
     ax.set_ylim(0, 110)
     ax.set_xticklabels(conditions, rotation=30, ha="right")
     ax.set_xlabel("")  # Remove the x-axis label)
@@ -1,9 +1,17 @@
+from dataclasses import dataclass
 from pathlib import Path
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
-from omero_screen_analysis.utils import save_fig, selector_val_filter
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.utils import (
+    save_fig,
+    selector_val_filter,
+    stacked_bars,
+    stacked_proportions,
+)
 
 current_dir = Path(__file__).parent
 style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
@@ -13,42 +21,153 @@ COLORS = prop_cycle.by_key()["color"]
 pd.options.mode.chained_assignment = None
 
 
+@dataclass
+class ClassCounts:
+    """Dense matrix of cell counts per well and class."""
+
+    wells: pd.DataFrame
+    classes: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def percentages(self) -> np.ndarray:
+        """Percentage of each class among the cells of a well."""
+        totals = self.counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.counts / totals * 100
+
+
+def _codes(df: pd.DataFrame, cols: list[str]) -> tuple[np.ndarray, list]:
+    """Integer code per row for each column, -1 marking missing values."""
+    factorized = [pd.factorize(df[col], sort=True) for col in cols]
+    return np.stack([codes for codes, _ in factorized]), [
+        uniques for _, uniques in factorized
+    ]
+
+
+def _group_sum(
+    codes: np.ndarray, values: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """Sum the rows of a (rows x columns) matrix per group code."""
+    n_cols = values.shape[1]
+    flat = (codes[:, None] * n_cols + np.arange(n_cols)).ravel()
+    return np.bincount(
+        flat, weights=values.ravel(), minlength=n_groups * n_cols
+    ).reshape(n_groups, n_cols)
+
+
+@profiled
+def class_count_matrix(
+    df: pd.DataFrame,
+    condition_col: str,
+    class_col: str = "Class",
+    well_keys: tuple[str, ...] = ("plate_id", "cell_line", "well_id"),
+) -> ClassCounts:
+    """Count the cells of each class in every well in a single pass."""
+    keys = [*well_keys, condition_col]
+    key_codes, uniques = _codes(df, keys)
+    class_codes, classes = pd.factorize(df[class_col], sort=True)
+    valid = (key_codes >= 0).all(axis=0) & (class_codes >= 0)
+    shape = tuple(len(u) for u in uniques)
+    combined = np.ravel_multi_index(key_codes[:, valid], shape)
+    well_ids, well_codes = np.unique(combined, return_inverse=True)
+    n_classes = len(classes)
+    counts = np.bincount(
+        well_codes * n_classes + class_codes[valid],
+        minlength=len(well_ids) * n_classes,
+    ).reshape(len(well_ids), n_classes)
+    wells = pd.DataFrame(
+        {
+            key: unique.take(idx)
+            for key, unique, idx in zip(
+                keys, uniques, np.unravel_index(well_ids, shape), strict=True
+            )
+        }
+    )
+    return ClassCounts(wells, np.asarray(classes), counts)
+
+
+@profiled
+def classification_summary(
+    df: pd.DataFrame,
+    condition_col: str,
+    class_col: str = "Class",
+    group_keys: tuple[str, ...] = ("plate_id", "cell_line"),
+) -> pd.DataFrame:
+    """
+    Summarise the class percentages of each plate, cell line and condition.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-cell data with plate_id, cell_line, well_id and class columns.
+    condition_col : str
+        The column holding the conditions.
+    class_col : str, optional
+        The column holding the class labels (default is 'Class').
+    group_keys : tuple[str, ...], optional
+        Columns that together with condition_col define a group of wells.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group and class with the mean and standard deviation of
+        the per-well percentages, the cell-weighted percentage, and the
+        number of wells and cells. Wells without any cell of a class count
+        as 0%.
+    """
+    matrix = class_count_matrix(df, condition_col, class_col)
+    keys = [*group_keys, condition_col]
+    group_codes, uniques = _codes(matrix.wells, keys)
+    shape = tuple(len(u) for u in uniques)
+    combined = np.ravel_multi_index(group_codes, shape)
+    group_ids, codes = np.unique(combined, return_inverse=True)
+    n_groups = len(group_ids)
+
+    percentages = matrix.percentages
+    n_wells = np.bincount(codes, minlength=n_groups)[:, None]
+    sums = _group_sum(codes, percentages, n_groups)
+    squares = _group_sum(codes, percentages**2, n_groups)
+    mean = sums / n_wells
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (squares - n_wells * mean**2) / (n_wells - 1)
+    std = np.sqrt(np.clip(var, 0, None))
+    std[np.broadcast_to(n_wells < 2, std.shape)] = np.nan
+    cells = _group_sum(codes, matrix.counts.astype(float), n_groups)
+    total_cells = cells.sum(axis=1, keepdims=True)
+    weighted = cells / total_cells * 100
+
+    n_classes = len(matrix.classes)
+    summary = pd.DataFrame(
+        {
+            key: np.repeat(unique.take(idx), n_classes)
+            for key, unique, idx in zip(
+                keys, uniques, np.unravel_index(group_ids, shape), strict=True
+            )
+        }
+    )
+    summary[class_col] = np.tile(matrix.classes, n_groups)
+    summary["percentage"] = mean.ravel()
+    summary["std"] = std.ravel()
+    summary["weighted_percentage"] = weighted.ravel()
+    summary["wells"] = np.repeat(n_wells.ravel(), n_classes)
+    summary["cells"] = cells.ravel().astype(np.int64)
+    return summary
+
+
+@profiled
 def quantify_classification(
     df: pd.DataFrame, condition_col: str
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
-    df_class = (
-        df.groupby(
-            ["plate_id", "cell_line", "well_id", condition_col, "Class"]
-        )["experiment"]
-        .count()
-        .reset_index()
-        .rename(columns={"experiment": "class count"})
-    )
-    df_class["percentage"] = (
-        df_class["class count"]
-        / df_class.groupby(["plate_id", "cell_line", "well_id"])[
-            "class count"
-        ].transform("sum")
-        * 100
-    )
-    df_class_mean = (
-        df_class.groupby(["plate_id", "cell_line", condition_col, "Class"])[
-            "percentage"
-        ]
-        .mean()
-        .reset_index()
-    )
+    """Mean and standard deviation of the per-well class percentages."""
+    summary = classification_summary(df, condition_col)
+    keys = ["plate_id", "cell_line", condition_col, "Class"]
+    df_class_mean = summary[[*keys, "percentage"]]
+    df_class_std = summary[keys].copy()
     if len(df.plate_id.unique()) > 1:
-        df_class_std = (
-            df_class.groupby(
-                ["plate_id", "cell_line", condition_col, "Class"]
-            )["percentage"]
-            .std()
-            .reset_index()
-        )
+        df_class_std["percentage"] = summary["std"]
     else:
         # Copy df_class_mean structure but set only percentage values to 0
-        df_class_std = df_class_mean.copy()
         df_class_std["percentage"] = 0
     return df_class_mean, df_class_std
 
@@ -56,6 +175,7 @@ def quantify_classification(
 height = 3 / 2.54  # 2 cm
 
 
+@profiled
 def plot_classification(
     df: pd.DataFrame,
     classes: list[str],
@@ -75,40 +195,17 @@ def plot_classification(
     assert df1 is not None, "df1 is None"
     assert len(df1) > 0, "df1 is empty"
     df_class_mean, df_class_std = quantify_classification(df1, condition_col)
-    # Set categorical dtype to enforce order
-    df_class_mean[condition_col] = pd.Categorical(
-        df_class_mean[condition_col], categories=conditions, ordered=True
-    )
-    df_class_std[condition_col] = pd.Categorical(
-        df_class_std[condition_col], categories=conditions, ordered=True
-    )
-    plot_data = df_class_mean.pivot_table(
-        index=condition_col,
-        columns="Class",
-        values="percentage",
-        observed=False,
-    ).reset_index()
-    std_data = df_class_std.pivot_table(
-        index=condition_col,
-        columns="Class",
-        values="percentage",
-        observed=False,
-    ).reset_index()
-    yerr = std_data[classes].values.T
+    mean = stacked_proportions(
+        df_class_mean, condition_col, "Class", "percentage", conditions, classes
+    ).mean
+    # mean spread of the wells over plates; single-well groups have none
+    yerr = stacked_proportions(
+        df_class_std, condition_col, "Class", "percentage", conditions, classes
+    ).mean
     fig, ax = plt.subplots(figsize=(height, height))
-    plot_data.plot(
-        x=condition_col,
-        y=classes,
-        kind="bar",
-        stacked=True,
-        yerr=yerr,
-        width=0.75,
-        legend=False,
-        ax=ax,
-    )
-    ax.set_xticklabels(
-        ax.get_xticklabels(), rotation=45, ha="right", fontsize=7
-    )
+    with profile_stage("draw"):
+        stacked_bars(ax, mean, np.nan_to_num(yerr), classes, colors)
+    ax.set_xticklabels(conditions, rotation=45, ha="right", fontsize=7)
     ax.set_xlabel("")
     ax.set_ylabel("% of total cells")
     ax.set_ylim(y_lim)
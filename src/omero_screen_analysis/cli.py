@@ -0,0 +1,372 @@
+"""
+Command line tool to produce the figures and summary tables of a screen.
+
+    omero-screen-analysis data.csv --config report.toml --output figures -j 4
+
+The report config is a TOML (or, with PyYAML installed, YAML) file::
+
+    condition_col = "condition"
+    conditions = ["NT", "SCR", "CCNA2"]
+    cell_lines = ["RPE-1_WT"]        # optional, default all cell lines
+    formats = ["pdf", "png"]
+
+    [count]
+    norm_control = "NT"
+
+    [cellcycle]
+
+    [feature]
+    features = ["intensity_mean_p21_nucleus"]
+
+    [combplot]
+    feature_col = "intensity_mean_p21_nucleus"
+    feature_y_lim = 8000
+    cell_number = 1000
+
+    [classification]
+    classes = ["normal", "micronuclei"]
+
+    [export]
+    screen = "siRNA_screen_01"      # optional, default the first data file
+    format = "parquet"
+
+    [qc]
+    gates = { area_nucleus = [50, 2000], intensity_max_DAPI_nucleus = [0, 6e4] }
+    min_cells = 50
+
+Each figure section switches on one figure per cell line; its keys are passed
+to the plot function. The export section also writes the summary tables with
+their provenance to output/export (see export.py). The qc section filters
+the cells and wells before anything is computed (see qc.py) and records the
+excluded wells in output/summary. Finished figures are recorded in a
+manifest in the output directory, so an interrupted run picks up where it
+stopped; changing the input files or the qc section renders them again.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from collections.abc import Iterator, Sequence
+from concurrent.futures import Future, as_completed
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+import tomllib
+
+from omero_screen_analysis.cellcycleplot import cc_phase
+from omero_screen_analysis.classification_plot import quantify_classification
+from omero_screen_analysis.countplot import norm_count
+from omero_screen_analysis.export import export_summaries
+from omero_screen_analysis.qc import Gate, qc_filter
+from omero_screen_analysis.render import PlotSpec, RenderPool, RenderResult
+from omero_screen_analysis.shared import SharedFrame
+
+MANIFEST = "report_manifest.json"
+
+# config section -> plot function and figure name
+FIGURES = {
+    "count": ("count_plot", "counts"),
+    "cellcycle": ("cellcycle_plot", "cellcycle"),
+    "stacked_barplot": ("stacked_barplot", "stacked_barplot"),
+    "combplot": ("comb_plot", "combplot"),
+    "classification": ("plot_classification", "classification"),
+}
+
+
+@dataclass
+class ReportConfig:
+    """Figures and summary tables to produce for a screen."""
+
+    conditions: list[str]
+    condition_col: str = "condition"
+    cell_lines: Optional[list[str]] = None
+    formats: list[str] = field(default_factory=lambda: ["pdf"])
+    figures: dict[str, dict[str, Any]] = field(default_factory=dict)
+    export: Optional[dict[str, Any]] = None
+    qc: Optional[dict[str, Any]] = None
+
+    @classmethod
+    def from_file(cls, path: Path) -> "ReportConfig":
+        """Read a TOML or YAML report config."""
+        if path.suffix in {".yaml", ".yml"}:
+            try:
+                import yaml
+            except ImportError as err:
+                raise ImportError(
+                    "Reading YAML configs requires PyYAML, "
+                    "install it or use a TOML config"
+                ) from err
+            raw = yaml.safe_load(path.read_text())
+        else:
+            with path.open("rb") as f:
+                raw = tomllib.load(f)
+        sections = set(FIGURES) | {"feature"}
+        unknown = {
+            key
+            for key, value in raw.items()
+            if isinstance(value, dict)
+            and key not in sections | {"export", "qc"}
+        }
+        if unknown:
+            raise ValueError(f"Unknown report sections: {sorted(unknown)}")
+        return cls(
+            conditions=raw["conditions"],
+            condition_col=raw.get("condition_col", "condition"),
+            cell_lines=raw.get("cell_lines"),
+            formats=raw.get("formats", ["pdf"]),
+            figures={
+                key: value or {}
+                for key, value in raw.items()
+                if key in sections
+            },
+            export=(raw["export"] or {}) if "export" in raw else None,
+            qc=(raw["qc"] or {}) if "qc" in raw else None,
+        )
+
+
+def load_data(paths: Sequence[Path]) -> pd.DataFrame:
+    """Read and concatenate per-cell CSV or Parquet exports."""
+    frames = [
+        pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+        for path in paths
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def data_fingerprint(
+    paths: Sequence[Path], qc: Optional[dict[str, Any]] = None
+) -> str:
+    """
+    Identify the input files by name, size and modification time, and the
+    qc options the cells were filtered with.
+    """
+    stats = [
+        (str(path.resolve()), path.stat().st_size, path.stat().st_mtime_ns)
+        for path in paths
+    ]
+    payload = [stats, qc]
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def spec_hash(spec: PlotSpec, fingerprint: str) -> str:
+    """Hash everything that determines a figure except the data itself."""
+    kwargs = {k: v for k, v in spec.kwargs.items() if k != "df"}
+    payload = [spec.plot, kwargs, spec.formats, fingerprint]
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def build_specs(
+    data: dict[str, pd.DataFrame | SharedFrame],
+    config: ReportConfig,
+    output: Path,
+) -> Iterator[PlotSpec]:
+    """Yield one PlotSpec per figure and cell line, from the data of each."""
+    for cell_line, df_line in data.items():
+        common = {
+            "df": df_line,
+            "conditions": config.conditions,
+            "condition_col": config.condition_col,
+            "selector_col": "cell_line",
+            "selector_val": cell_line,
+        }
+        for section, options in config.figures.items():
+            if section == "feature":
+                features = options.get("features", [])
+                extra = {k: v for k, v in options.items() if k != "features"}
+                for feature in features:
+                    yield PlotSpec(
+                        plot="feature_plot",
+                        kwargs={**common, **extra, "feature": feature},
+                        fig_id=f"{cell_line}_{feature}",
+                        path=output,
+                        formats=tuple(config.formats),
+                    )
+                continue
+            plot, name = FIGURES[section]
+            yield PlotSpec(
+                plot=plot,
+                kwargs={**common, **options},
+                fig_id=f"{cell_line}_{name}",
+                path=output,
+                formats=tuple(config.formats),
+            )
+
+
+def write_summaries(
+    df: pd.DataFrame, config: ReportConfig, output: Path
+) -> list[Path]:
+    """Write the summary tables behind the figures as CSV files."""
+    summary_dir = output / "summary"
+    summary_dir.mkdir(parents=True, exist_ok=True)
+    df = df[df[config.condition_col].isin(config.conditions)]
+    if config.cell_lines:
+        df = df[df.cell_line.isin(config.cell_lines)]
+    tables: dict[str, pd.DataFrame] = {}
+    if "cell_cycle" in df:
+        tables["cell_cycle"] = cc_phase(df, condition=config.condition_col)
+    if "count" in config.figures:
+        control = config.figures["count"]["norm_control"]
+        tables["counts"] = pd.concat(
+            [
+                norm_count(group, control, condition=config.condition_col)
+                .assign(cell_line=cell_line)
+                for cell_line, group in df.groupby("cell_line")
+            ],
+            ignore_index=True,
+        )
+    if "classification" in config.figures and "Class" in df:
+        tables["classification"], _ = quantify_classification(
+            df, config.condition_col
+        )
+    written = []
+    for name, table in tables.items():
+        dest = summary_dir / f"{name}.csv"
+        table.to_csv(dest, index=False)
+        written.append(dest)
+    return written
+
+
+def _read_manifest(output: Path) -> dict[str, Any]:
+    manifest = output / MANIFEST
+    if not manifest.exists():
+        return {}
+    return json.loads(manifest.read_text())  # type: ignore[no-any-return]
+
+
+def _write_manifest(output: Path, manifest: dict[str, Any]) -> None:
+    tmp = output / f"{MANIFEST}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2))
+    tmp.replace(output / MANIFEST)
+
+
+def run_report(
+    data: Sequence[Path],
+    config: ReportConfig,
+    output: Path,
+    jobs: int = 1,
+    force: bool = False,
+) -> list[RenderResult]:
+    """Render all figures not yet in the manifest and write the summaries."""
+    output.mkdir(parents=True, exist_ok=True)
+    df = load_data(data)
+    if config.qc is not None:
+        options = dict(config.qc)
+        gates = [
+            Gate(column, *bounds)
+            for column, bounds in options.pop("gates", {}).items()
+        ]
+        df, report = qc_filter(
+            df, gates, condition_col=config.condition_col, **options
+        )
+        report.save(output / "summary")
+    fingerprint = data_fingerprint(data, config.qc)
+    manifest = {} if force else _read_manifest(output)
+    cell_lines = config.cell_lines or sorted(df.cell_line.unique())
+    results = []
+    with ExitStack() as stack:
+        # workers attach to one shared copy of each cell line instead of
+        # unpickling its data for every figure
+        shared = {
+            cell_line: stack.enter_context(
+                SharedFrame(df[df.cell_line == cell_line])
+            )
+            for cell_line in cell_lines
+        }
+        pending = []
+        for spec in build_specs(shared, config, output):
+            key = spec_hash(spec, fingerprint)
+            done = manifest.get(spec.fig_id)
+            if (
+                done
+                and done["hash"] == key
+                and all(Path(f).exists() for f in done["files"])
+            ):
+                print(f"Skipping {spec.fig_id}, already rendered")
+                continue
+            pending.append((spec, key))
+
+        write_summaries(df, config, output)
+        if config.export is not None:
+            export_summaries(
+                df[df.cell_line.isin(config.cell_lines)]
+                if config.cell_lines
+                else df,
+                output / "export",
+                screen=config.export.get("screen", data[0].stem),
+                conditions=config.conditions,
+                condition_col=config.condition_col,
+                norm_control=config.figures.get("count", {}).get("norm_control"),
+                input_hash=fingerprint,
+                fmt=config.export.get("format", "parquet"),
+            )
+        pool = stack.enter_context(RenderPool(workers=jobs, prewarm=False))
+        futures: dict[Future[RenderResult], tuple[PlotSpec, str]] = {
+            pool.submit(spec): (spec, key) for spec, key in pending
+        }
+        for future in as_completed(futures):
+            spec, key = futures[future]
+            error = future.exception()
+            if error is not None:
+                print(f"Failed {spec.fig_id}: {error}", file=sys.stderr)
+                results.append(
+                    RenderResult(
+                        fig_id=spec.fig_id,
+                        error=f"{type(error).__name__}: {error}",
+                    )
+                )
+                continue
+            result = future.result()
+            results.append(result)
+            manifest[spec.fig_id] = {
+                "hash": key,
+                "files": [str(f) for f in result.files],
+            }
+            _write_manifest(output, manifest)
+            print(f"Rendered {spec.fig_id} in {result.seconds:.2f}s")
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omero-screen-analysis",
+        description="Produce the figures and summary tables of a screen.",
+    )
+    parser.add_argument(
+        "data", nargs="+", type=Path, help="per-cell CSV or Parquet files"
+    )
+    parser.add_argument(
+        "-c", "--config", type=Path, required=True, help="report config"
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path("figures")
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of figures rendered concurrently",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="re-render figures that are already in the manifest",
+    )
+    args = parser.parse_args(argv)
+    config = ReportConfig.from_file(args.config)
+    results = run_report(
+        args.data, config, args.output, jobs=args.jobs, force=args.force
+    )
+    return 1 if any(r.error for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
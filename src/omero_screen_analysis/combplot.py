@@ -2,16 +2,26 @@
 Plot a combined histogram and scatter plot from omero screen cell cycle data.
 """
 
+from collections.abc import Iterable
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib import ticker
 from matplotlib.axes import Axes
 from matplotlib.gridspec import GridSpec
 
+from omero_screen_analysis.featurestore import FeatureStore
+from omero_screen_analysis.gating import GatingFile
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.kde import kde_contours
+from omero_screen_analysis.preview import preview_cell_number, preview_kde
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.sampling import StratifiedReservoir
+from omero_screen_analysis.sketch import QuantileSketch
 from omero_screen_analysis.utils import save_fig, selector_val_filter
 
 current_dir = Path(__file__).parent
@@ -117,15 +127,16 @@ def scatter_plot(
     ax.set_xlabel("")
     ax.axvline(x=3, color="black", linestyle="--")
     ax.axhline(y=3, color="black", linestyle="--")
-    sns.kdeplot(
-        data=data,
-        x="integrated_int_DAPI_norm",
-        y="intensity_mean_EdU_nucleus_norm",
-        fill=True,
-        alpha=0.3,
-        cmap="rocket_r",
-        ax=ax,
-    )
+    if preview_kde():  # skipped in preview mode
+        with profile_stage("kde"):
+            kde_contours(
+                ax,
+                data["integrated_int_DAPI_norm"],
+                data["intensity_mean_EdU_nucleus_norm"],
+                fill=True,
+                alpha=0.3,
+                cmap="rocket_r",
+            )
     ax.tick_params(axis="both", which="major", labelsize=6)
     ax.set_xlabel("")
 
@@ -208,8 +219,9 @@ width = 10 / 2.54  # 10 cm
 height = 7 / 2.54  # 4 cm
 
 
+@profiled
 def comb_plot(
-    df: pd.DataFrame,
+    df: pd.DataFrame | Iterable[pd.DataFrame] | FeatureStore | GatingFile,
     conditions: list[str],
     feature_col: str,
     feature_y_lim: float,
@@ -221,42 +233,115 @@ def comb_plot(
     colors: list[str] = COLORS,
     save: bool = True,
     path: Path | None = None,
+    index: GroupIndex | None = None,
 ) -> None:
-    """ Plot a combined histogram and scatter plot."""
+    """Plot a combined histogram and scatter plot.
+
+    df may also be an iterable of DataFrame chunks, a FeatureStore or a
+    GatingFile, from which only the columns needed here are read; a
+    GatingFile streams only the chunks of the selected rows, plate by
+    plate. The data is read once: each condition is subsampled to at most
+    cell_number cells with a stratified reservoir, and the same sample is
+    used for the histogram, EdU scatter and feature scatter rows. Axis
+    limits are taken from quantile sketches over all rows. index is an
+    optional GroupIndex of a DataFrame df by condition_col and
+    selector_col, used to select its rows.
+    """
     col_number = len(conditions)
-    df1 = selector_val_filter(df, selector_col, selector_val, condition_col, conditions)
-    assert df1 is not None  # tells type checker df1 is definitely not None
+    if isinstance(df, FeatureStore):
+        columns = [
+            condition_col,
+            "integrated_int_DAPI_norm",
+            "intensity_mean_EdU_nucleus_norm",
+            "cell_cycle",
+            feature_col,
+        ]
+        if selector_col:
+            columns.append(selector_col)
+        df = df.iter_chunks(columns)
+    elif isinstance(df, GatingFile):
+        selection: dict[str, Any] = {condition_col: conditions}
+        if selector_col and selector_val:
+            selection[selector_col] = selector_val
+        df = df.iter_chunks(
+            [
+                condition_col,
+                "integrated_int_DAPI_norm",
+                "intensity_mean_EdU_nucleus_norm",
+                "cell_cycle",
+                feature_col,
+                *([selector_col] if selector_col else []),
+            ],
+            **selection,
+        )
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+    sampler = StratifiedReservoir(
+        condition_col, preview_cell_number(cell_number), random_state=42
+    )
+    edu_quantiles = QuantileSketch(random_state=42)
+    col_quantiles = QuantileSketch(random_state=42)
+    for chunk in chunks:
+        with profile_stage("quantiles"):
+            edu_quantiles.update(chunk["intensity_mean_EdU_nucleus_norm"])
+            col_quantiles.update(chunk[feature_col])
+        df1 = selector_val_filter(
+            chunk,
+            selector_col,
+            selector_val,
+            condition_col,
+            conditions,
+            index if chunk is df else None,
+        )
+        assert df1 is not None  # tells type checker df1 is definitely not None
+        with profile_stage("sample"):
+            sampler.update(df1)
+    samples = sampler.groups()
+    # conditions without cells, or no data at all, get empty panels
+    empty = pd.DataFrame(
+        {
+            condition_col: pd.Series(dtype=object),
+            "integrated_int_DAPI_norm": pd.Series(dtype=float),
+            "intensity_mean_EdU_nucleus_norm": pd.Series(dtype=float),
+            "cell_cycle": pd.Series(dtype=object),
+            feature_col: pd.Series(dtype=float),
+        }
+    )
     condition_list = conditions * 3
 
     fig = plt.figure(figsize=(width, height))
     gs = GridSpec(3, col_number, height_ratios=[1, 3, 3], hspace=0.05)
     ax_list = [(i, j) for i in range(3) for j in range(col_number)]
-    y_max = df["intensity_mean_EdU_nucleus_norm"].quantile(0.99) * 1.5
-    y_min = df["intensity_mean_EdU_nucleus_norm"].quantile(0.01) * 0.8
-    y_max_col = df[feature_col].quantile(0.99) * 1.5
-    y_min_col = df[feature_col].quantile(0.01) * 0.8
+    y_max = edu_quantiles.quantile(0.99) * 1.5
+    y_min = edu_quantiles.quantile(0.01) * 0.8
+    y_max_col = col_quantiles.quantile(0.99) * 1.5
+    y_min_col = col_quantiles.quantile(0.01) * 0.8
 
     for i, pos in enumerate(ax_list):
-        data = df1[df1[condition_col] == condition_list[i]]
-        if cell_number and len(data) >= cell_number:
-            data_red = pd.DataFrame(
-                data.sample(n=cell_number, random_state=42)
-            )
-        else:
-            data_red = pd.DataFrame(data)
+        data_red = samples.get(condition_list[i], empty)
         ax = fig.add_subplot(gs[pos[0], pos[1]])
 
         if i < len(conditions):
-            histogram_plot(ax, i, data_red, colors)
+            with profile_stage("histogram"):
+                histogram_plot(ax, i, data_red, colors)
             ax.set_title(f"{condition_list[i]}", size=6, weight="regular")
         elif i < 2 * len(conditions):
-            scatter_plot(ax, i, data_red, conditions, colors)
-            ax.set_ylim(y_min, y_max)
+            with profile_stage("scatter"):
+                scatter_plot(ax, i, data_red, conditions, colors)
+            if np.isfinite([y_min, y_max]).all():
+                ax.set_ylim(y_min, y_max)
         else:
-            scatter_plot_feature(
-                ax, i, data_red, conditions, feature_col, feature_y_lim, colors
-            )
-            ax.set_ylim(y_min_col, y_max_col)
+            with profile_stage("scatter_feature"):
+                scatter_plot_feature(
+                    ax,
+                    i,
+                    data_red,
+                    conditions,
+                    feature_col,
+                    feature_y_lim,
+                    colors,
+                )
+            if np.isfinite([y_min_col, y_max_col]).all():
+                ax.set_ylim(y_min_col, y_max_col)
 
         ax.grid(visible=False)
 
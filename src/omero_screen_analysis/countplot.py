@@ -1,12 +1,15 @@
+import warnings
 from enum import Enum, auto
 from pathlib import Path
 from typing import Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib.axes import Axes
 
+from omero_screen_analysis.profiling import profile_stage, profiled
 from omero_screen_analysis.stats import set_significance_marks
 from omero_screen_analysis.utils import (
     save_fig,
@@ -29,45 +32,179 @@ class PlotType(Enum):
     ABSOLUTE = "absolute"
 
 
+class NormMode(Enum):
+    FOLD = "fold"  # count / control
+    PERCENT = "percent"  # 100 * count / control
+    ZSCORE = "zscore"  # (count - control) / sd of the control wells
+
+
+class ControlScope(Enum):
+    PLATE = "plate"  # control of the same plate
+    POOLED = "pooled"  # mean control over all plates
+
+
+class MissingControl(Enum):
+    WARN = "warn"  # normalised values NaN, with a warning
+    RAISE = "raise"
+    DROP = "drop"  # leave the plate out
+    POOLED = "pooled"  # fall back to the pooled control
+
+
+def _well_count_arrays(
+    df: pd.DataFrame, condition: str
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dense plate x condition arrays of the number of wells and the sum and
+    sum of squares of the cells per well, with the plates and conditions.
+    """
+    plate_codes, plates = pd.factorize(df["plate_id"], sort=True)
+    cond_codes, conds = pd.factorize(df[condition], sort=True)
+    well_codes, wells = pd.factorize(df["well"])
+    valid = (plate_codes >= 0) & (cond_codes >= 0) & (well_codes >= 0)
+    if "experiment" in df:
+        # cells are counted by their experiment entry, as before
+        valid &= df["experiment"].notna().to_numpy()
+    n_cells = len(plates) * len(conds)
+    group = plate_codes[valid] * len(conds) + cond_codes[valid]
+    well_keys, cells = np.unique(
+        group.astype(np.int64) * len(wells) + well_codes[valid],
+        return_counts=True,
+    )
+    group = well_keys // len(wells)
+    shape = (len(plates), len(conds))
+    n_wells = np.bincount(group, minlength=n_cells).reshape(shape)
+    total = np.bincount(group, weights=cells, minlength=n_cells).reshape(shape)
+    squares = np.bincount(
+        group, weights=cells.astype(float) ** 2, minlength=n_cells
+    ).reshape(shape)
+    return n_wells, total, squares, np.asarray(plates), np.asarray(conds)
+
+
+@profiled
 def norm_count(
-    df: pd.DataFrame, norm_control: str, condition: str = "condition"
+    df: pd.DataFrame,
+    norm_control: str,
+    condition: str = "condition",
+    mode: NormMode | str = NormMode.FOLD,
+    control_scope: ControlScope | str = ControlScope.PLATE,
+    missing_control: MissingControl | str = MissingControl.WARN,
 ) -> pd.DataFrame:
-    """Normalize count by control condition and return both raw and normalized counts"""
-    # First count experiments per well
-    well_counts = (
-        df.groupby(["plate_id", condition, "well"])["experiment"]
-        .count()  # Count experiments per well
-        .reset_index()
-        .rename(columns={"experiment": "well_count"})
-    )
+    """
+    Normalize count by control condition and return both raw and
+    normalized counts.
 
-    # Then calculate mean count across wells with same condition
-    grouped = (
-        well_counts.groupby(["plate_id", condition])["well_count"]
-        .mean()  # Average the counts across wells
-        .reset_index()
-        .rename(columns={"well_count": "count"})
-    )
+    The count of a plate and condition is the mean number of cells per well.
+    All plates are normalised at once on dense plate x condition arrays.
 
-    # Rest of the function remains the same
-    pivot_df = grouped.pivot(
-        index="plate_id", columns=condition, values="count"
-    )
-    normalized_df = pivot_df.div(pivot_df[norm_control], axis=0)
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-cell data with plate_id, well and condition columns.
+    norm_control : str
+        The control condition.
+    condition : str, optional
+        The column holding the conditions (default is 'condition').
+    mode : NormMode or str, optional
+        'fold' (default), 'percent' of control or 'zscore' against the
+        spread of the control wells.
+    control_scope : ControlScope or str, optional
+        Normalise to the control of the same 'plate' (default) or to the
+        'pooled' control of all plates: the mean and sd of the cells per
+        well over all control wells.
+    missing_control : MissingControl or str, optional
+        What to do with plates without the control: 'warn' (default, their
+        normalized counts are NaN), 'raise', 'drop' or 'pooled'. In zscore
+        mode a control with fewer than two wells has no sd; 'raise' then
+        raises and the other options warn and leave the z-scores NaN.
 
-    count_df = pivot_df.reset_index().melt(
-        id_vars="plate_id", value_name="count", var_name=condition
-    )
-    norm_df = normalized_df.reset_index().melt(
-        id_vars="plate_id", value_name="normalized_count", var_name=condition
-    )
+    Returns
+    -------
+    pd.DataFrame
+        plate_id, condition, count and normalized_count for every plate and
+        condition, ordered by condition and then plate.
+    """
+    mode = NormMode(mode)
+    control_scope = ControlScope(control_scope)
+    missing_control = MissingControl(missing_control)
+    n_wells, total, squares, plates, conds = _well_count_arrays(df, condition)
+    matches = np.flatnonzero(conds == norm_control)
+    if not len(matches):
+        raise ValueError(f"Control {norm_control} not found in {condition}")
+    k = matches[0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        count = total / n_wells
+        # sample variance of the cells per control well, per plate
+        ctrl_n = n_wells[:, k]
+        ctrl_var = (squares[:, k] - ctrl_n * count[:, k] ** 2) / (ctrl_n - 1)
+        has_control = ctrl_n > 0
+        # mean and variance over all control wells, about the same centre
+        pooled_n = ctrl_n.sum()
+        pooled_mean = total[:, k].sum() / pooled_n
+        pooled_var = (squares[:, k].sum() - pooled_n * pooled_mean**2) / (
+            pooled_n - 1
+        )
+
+    if control_scope == ControlScope.POOLED:
+        control = np.full(len(plates), pooled_mean)
+        control_sd = np.full(len(plates), np.sqrt(pooled_var))
+    else:
+        control = count[:, k].copy()
+        control_sd = np.sqrt(ctrl_var)
+        missing = ~has_control
+        if missing.any():
+            names = ", ".join(map(str, plates[missing]))
+            if missing_control == MissingControl.RAISE:
+                raise ValueError(f"Plates without {norm_control}: {names}")
+            if missing_control == MissingControl.WARN:
+                warnings.warn(
+                    f"Plates without {norm_control} are not normalised: "
+                    f"{names}",
+                    stacklevel=2,
+                )
+            elif missing_control == MissingControl.POOLED:
+                control[missing] = pooled_mean
+                control_sd[missing] = np.sqrt(pooled_var)
+            else:
+                keep = ~missing
+                count, control, control_sd = (
+                    count[keep], control[keep], control_sd[keep]
+                )
+                plates = plates[keep]
 
-    return pd.merge(
-        count_df,
-        norm_df[["plate_id", condition, "normalized_count"]],
-        on=["plate_id", condition],
+    if mode == NormMode.ZSCORE:
+        no_sd = ~np.isnan(control) & ~(control_sd > 0)
+        if no_sd.any():
+            message = (
+                f"{norm_control} has fewer than two wells or no spread on "
+                f"plates {', '.join(map(str, plates[no_sd]))}; "
+                "their z-scores are NaN"
+            )
+            if missing_control == MissingControl.RAISE:
+                raise ValueError(message)
+            warnings.warn(message, stacklevel=2)
+            control_sd = np.where(no_sd, np.nan, control_sd)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if mode == NormMode.ZSCORE:
+            normalized = (count - control[:, None]) / control_sd[:, None]
+        else:
+            normalized = count / control[:, None]
+            if mode == NormMode.PERCENT:
+                normalized *= 100
+
+    # condition-major, as the columns of a plate x condition pivot
+    return pd.DataFrame(
+        {
+            "plate_id": np.tile(plates, len(conds)),
+            condition: np.repeat(conds, len(plates)),
+            "count": count.T.ravel(),
+            "normalized_count": normalized.T.ravel(),
+        }
     )
 
+
+@profiled
 def count_plot(
     df: pd.DataFrame,
     norm_control: str,
@@ -81,8 +218,13 @@ def count_plot(
     save: bool = True,
     path: Optional[Path] = None,
     ax: Optional[Axes] = None,
+    pvalues: Optional[list[float]] = None,
 ) -> None:
-    """Plot normalized counts"""
+    """Plot normalized counts
+
+    pvalues of conditions[1:] against conditions[0] replace the t-tests of
+    the plate counts and are shown whatever the number of plates.
+    """
     count_col = (
         "normalized_count" if plot_type == PlotType.NORMALISED else "count"
     )
@@ -95,27 +237,30 @@ def count_plot(
     )
     assert df1 is not None
     counts = norm_count(df1, norm_control, condition=condition_col)
-    sns.barplot(
-        data=counts,
-        x=condition_col,
-        y=count_col,
-        order=conditions,
-        color=colors[-1],
-        ax=ax,
-    )
-    ax.set_xticks(range(len(conditions)))  #
-    ax.set_xticklabels(conditions, rotation=45, ha="right")
-
-    show_repeat_points(counts, conditions, condition_col, count_col, ax)
-    if df1.plate_id.nunique() >= 3:
-        set_significance_marks(
-            ax,
-            counts,
-            conditions,
-            condition_col,
-            count_col,
-            ax.get_ylim()[1],
+    with profile_stage("draw"):
+        sns.barplot(
+            data=counts,
+            x=condition_col,
+            y=count_col,
+            order=conditions,
+            color=colors[-1],
+            ax=ax,
         )
+        ax.set_xticks(range(len(conditions)))  #
+        ax.set_xticklabels(conditions, rotation=45, ha="right")
+
+        show_repeat_points(counts, conditions, condition_col, count_col, ax)
+    if pvalues is not None or df1.plate_id.nunique() >= 3:
+        with profile_stage("significance"):
+            set_significance_marks(
+                ax,
+                counts,
+                conditions,
+                condition_col,
+                count_col,
+                ax.get_ylim()[1],
+                pvalues,
+            )
     ax.set_xlabel("")
     if not title:
         title = f"counts {selector_val}"
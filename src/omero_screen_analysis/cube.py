@@ -0,0 +1,409 @@
+"""
+Summary cube of library-scale screens for hit picking.
+
+With thousands of compounds or siRNAs, plotting every condition is neither
+possible nor useful. build_cube summarises a screen once into a dense
+condition x cell line x metric array: cell counts, phase and class
+percentages and feature medians. Slicing, ranking and top-k selection then
+work on the array, and only the selected hits are passed on to the per-cell
+plots::
+
+    cube = build_cube(df, features=["area_nucleus"], norm_control="NT")
+    cube = cube.add_robust_z(["relative_count", "phase_S"], control="NT")
+    hits = cube.top_k("phase_S_z", 20, cell_line="RPE-1_WT", ascending=True)
+    plot_hits(cube, "phase_S_z", "RPE-1_WT", hits=hits, path=path)
+    cellcycle_plot(df, ["NT", *hits], selector_val="RPE-1_WT", path=path)
+"""
+
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.normalise import MAD_SCALE, group_medians
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.utils import save_fig
+
+current_dir = Path(__file__).parent
+style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
+plt.style.use(style_path)
+prop_cycle = plt.rcParams["axes.prop_cycle"]
+COLORS = prop_cycle.by_key()["color"]
+
+PHASES = ["Sub-G1", "G1", "S", "G2/M", "G2", "M", "Polyploid"]
+
+
+@dataclass
+class ScreenCube:
+    """Metrics per condition and cell line as a dense array."""
+
+    values: np.ndarray  # conditions x cell lines x metrics
+    conditions: pd.Index
+    cell_lines: pd.Index
+    metrics: pd.Index
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.values.shape  # type: ignore[return-value]
+
+    def _positions(self, index: pd.Index, labels: Any, axis: str) -> Any:
+        if labels is None:
+            return slice(None)
+        if isinstance(labels, str) or np.ndim(labels) == 0:
+            labels = [labels]
+        positions = index.get_indexer(labels)
+        if (positions < 0).any():
+            missing = [x for x, p in zip(labels, positions) if p < 0]
+            raise KeyError(f"Unknown {axis}: {missing}")
+        return positions
+
+    def sel(
+        self,
+        conditions: Any = None,
+        cell_lines: Any = None,
+        metrics: Any = None,
+    ) -> "ScreenCube":
+        """The sub-cube of the given labels, in the order given."""
+        cond = self._positions(self.conditions, conditions, "conditions")
+        line = self._positions(self.cell_lines, cell_lines, "cell lines")
+        met = self._positions(self.metrics, metrics, "metrics")
+        return ScreenCube(
+            self.values[cond][:, line][:, :, met],
+            self.conditions[cond],
+            self.cell_lines[line],
+            self.metrics[met],
+        )
+
+    def metric(self, metric: str) -> pd.DataFrame:
+        """One metric as a conditions x cell lines table."""
+        m = self._positions(self.metrics, metric, "metrics")[0]
+        return pd.DataFrame(
+            self.values[:, :, m],
+            index=self.conditions,
+            columns=self.cell_lines,
+        )
+
+    def frame(self, cell_line: Optional[str] = None) -> pd.DataFrame:
+        """
+        The cube as a table, conditions x metrics for one cell line, or one
+        row per condition and cell line.
+        """
+        if cell_line is not None:
+            line = self._positions(self.cell_lines, cell_line, "cell lines")[0]
+            return pd.DataFrame(
+                self.values[:, line, :],
+                index=self.conditions,
+                columns=self.metrics,
+            )
+        n_cond, n_lines, n_metrics = self.shape
+        index = pd.MultiIndex.from_product(
+            [self.conditions, self.cell_lines],
+            names=[self.conditions.name, self.cell_lines.name],
+        )
+        return pd.DataFrame(
+            self.values.reshape(n_cond * n_lines, n_metrics),
+            index=index,
+            columns=self.metrics,
+        )
+
+    def rank(
+        self, metric: str, cell_line: str, ascending: bool = False
+    ) -> pd.Series:
+        """Conditions sorted by metric in one cell line, NaN last."""
+        values = self.metric(metric)[cell_line]
+        return values.sort_values(ascending=ascending, na_position="last")
+
+    def top_k(
+        self,
+        metric: str,
+        k: int,
+        cell_line: str,
+        ascending: bool = False,
+        exclude: Sequence[str] = (),
+    ) -> list[str]:
+        """
+        The k conditions with the highest (lowest if ascending) metric in a
+        cell line, best first, ignoring NaN and the excluded conditions.
+        """
+        values = self.metric(metric)[cell_line].to_numpy(dtype=float)
+        score = values if ascending else -values
+        score = np.where(np.isnan(score), np.inf, score)
+        excluded = self.conditions.get_indexer(list(exclude))
+        score[excluded[excluded >= 0]] = np.inf
+        k = min(k, int(np.isfinite(score).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(score, k - 1)[:k]
+        top = top[np.argsort(score[top], kind="stable")]
+        return self.conditions[top].tolist()
+
+    def add_robust_z(
+        self, metrics: Sequence[str], control: Optional[str] = None
+    ) -> "ScreenCube":
+        """
+        Add ``<metric>_z`` robust z-scores per cell line.
+
+        The centre and spread are the median and scaled MAD over all
+        conditions, which suits libraries where most conditions have no
+        effect; with control, the centre is the control condition instead.
+        """
+        added = []
+        for metric in metrics:
+            m = self._positions(self.metrics, metric, "metrics")[0]
+            values = self.values[:, :, m]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                median = np.nanmedian(values, axis=0)
+                mad = MAD_SCALE * np.nanmedian(np.abs(values - median), axis=0)
+                if control is not None:
+                    c = self._positions(self.conditions, control, "conditions")
+                    median = values[c[0]]
+                added.append((values - median) / np.where(mad > 0, mad, np.nan))
+        return ScreenCube(
+            np.concatenate([self.values, np.stack(added, axis=2)], axis=2),
+            self.conditions,
+            self.cell_lines,
+            self.metrics.append(pd.Index([f"{m}_z" for m in metrics])),
+        )
+
+    def save(self, path: Path | str) -> None:
+        """Write the cube to a .npz file."""
+        labels = {
+            "conditions": self.conditions.tolist(),
+            "cell_lines": self.cell_lines.tolist(),
+            "metrics": self.metrics.tolist(),
+            "names": [self.conditions.name, self.cell_lines.name],
+        }
+        np.savez_compressed(
+            path, values=self.values, labels=np.array(json.dumps(labels))
+        )
+
+    @classmethod
+    def load(cls, path: Path | str) -> "ScreenCube":
+        """Read a cube written by save."""
+        with np.load(path) as data:
+            labels = json.loads(str(data["labels"]))
+            values = data["values"]
+        condition_name, cell_line_name = labels["names"]
+        return cls(
+            values,
+            pd.Index(labels["conditions"], name=condition_name),
+            pd.Index(labels["cell_lines"], name=cell_line_name),
+            pd.Index(labels["metrics"]),
+        )
+
+
+def _percentages(
+    group: np.ndarray,
+    labels: pd.Series,
+    cells: np.ndarray,
+    order: Optional[Sequence[str]] = None,
+) -> tuple[np.ndarray, list[str]]:
+    """Percentage of the cells of each group with each label."""
+    codes, uniques = pd.factorize(labels, sort=True)
+    uniques = list(uniques)
+    valid = (group >= 0) & (codes >= 0)
+    n_labels = len(uniques)
+    counts = np.bincount(
+        group[valid] * n_labels + codes[valid],
+        minlength=len(cells) * n_labels,
+    ).reshape(len(cells), n_labels)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percent = counts / cells[:, None] * 100
+    if order is not None:
+        # known labels in their usual order, others after them
+        rank = {label: i for i, label in enumerate(order)}
+        ranked = sorted(
+            range(n_labels), key=lambda i: rank.get(uniques[i], len(order))
+        )
+        percent, uniques = percent[:, ranked], [uniques[i] for i in ranked]
+    return percent, uniques
+
+
+@profiled
+def build_cube(
+    df: pd.DataFrame,
+    features: Sequence[str] = (),
+    condition_col: str = "condition",
+    selector_col: str = "cell_line",
+    norm_control: Optional[str] = None,
+    phase_col: Optional[str] = "cell_cycle",
+    class_col: Optional[str] = "Class",
+) -> ScreenCube:
+    """
+    Summarise a screen into a condition x cell line x metric cube.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-cell data with plate_id and well columns.
+    features : sequence of str, optional
+        Features whose median per condition is added as ``median_<feature>``.
+    condition_col : str, optional
+        The column holding the conditions (default is 'condition').
+    selector_col : str, optional
+        The column holding the cell lines (default is 'cell_line').
+    norm_control : str, optional
+        Add ``relative_count``, the cells per well relative to this control
+        condition of the same cell line.
+    phase_col : str, optional
+        Add ``phase_<phase>`` percentages if df has this column.
+    class_col : str, optional
+        Add ``class_<class>`` percentages if df has this column.
+
+    Returns
+    -------
+    ScreenCube
+        Always with the metrics cells, wells, plates and cells_per_well.
+        Percentages and medians pool the cells of all plates; combinations
+        of condition and cell line without cells are NaN.
+    """
+    cond_codes, conditions = pd.factorize(df[condition_col], sort=True)
+    line_codes, cell_lines = pd.factorize(df[selector_col], sort=True)
+    n_cond, n_lines = len(conditions), len(cell_lines)
+    n_groups = n_cond * n_lines
+    group = np.where(
+        (cond_codes >= 0) & (line_codes >= 0),
+        cond_codes * n_lines + line_codes,
+        -1,
+    )
+    valid = group >= 0
+    metrics: dict[str, np.ndarray] = {}
+
+    with profile_stage("counts"):
+        cells = np.bincount(group[valid], minlength=n_groups).astype(float)
+        wells = pd.DataFrame(
+            {
+                "group": group[valid],
+                "plate_id": df["plate_id"].to_numpy()[valid],
+                "well": df["well"].to_numpy()[valid],
+            }
+        ).drop_duplicates()
+        plates = wells.drop_duplicates(["group", "plate_id"])
+        metrics["cells"] = cells
+        for name, table in (("wells", wells), ("plates", plates)):
+            metrics[name] = np.bincount(
+                table["group"], minlength=n_groups
+            ).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            per_well = cells / metrics["wells"]
+        metrics["cells_per_well"] = per_well
+        if norm_control is not None:
+            control = conditions.get_indexer([norm_control])[0]
+            if control < 0:
+                raise ValueError(f"Control {norm_control} not in {condition_col}")
+            reference = per_well.reshape(n_cond, n_lines)[control]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                metrics["relative_count"] = (
+                    per_well.reshape(n_cond, n_lines) / reference
+                ).ravel()
+    cells = np.where(cells > 0, cells, np.nan)
+
+    for col, prefix, order in (
+        (phase_col, "phase", PHASES),
+        (class_col, "class", None),
+    ):
+        if col is not None and col in df:
+            with profile_stage(prefix):
+                percent, labels = _percentages(group, df[col], cells, order)
+            for k, label in enumerate(labels):
+                metrics[f"{prefix}_{label}"] = percent[:, k]
+
+    if features:
+        rows = np.flatnonzero(valid)
+        order = rows[np.argsort(group[valid], kind="stable")]
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(group[valid], minlength=n_groups))]
+        )
+        index = GroupIndex(
+            pd.DataFrame({"group": np.arange(n_groups)}), order, offsets
+        )
+        for feature in features:
+            with profile_stage("medians"):
+                metrics[f"median_{feature}"] = group_medians(
+                    df[feature].to_numpy(dtype=float), index
+                )
+
+    values = np.stack(list(metrics.values()), axis=1).reshape(
+        n_cond, n_lines, len(metrics)
+    )
+    print(
+        f"Built cube of {n_cond} conditions, {n_lines} cell lines "
+        f"and {len(metrics)} metrics"
+    )
+    return ScreenCube(
+        values,
+        pd.Index(conditions, name=condition_col),
+        pd.Index(cell_lines, name=selector_col),
+        pd.Index(list(metrics)),
+    )
+
+
+@profiled
+def plot_hits(
+    cube: ScreenCube,
+    metric: str,
+    cell_line: str,
+    hits: Optional[Sequence[str]] = None,
+    k: int = 10,
+    ascending: bool = False,
+    controls: Sequence[str] = (),
+    title: Optional[str] = None,
+    save: bool = True,
+    path: Optional[Path] = None,
+) -> None:
+    """
+    Rank plot of a metric over all conditions of a cell line.
+
+    The hits, by default the top k conditions, are highlighted and
+    labelled, and the controls marked, so thousands of conditions fit in
+    one figure.
+    """
+    ranked = cube.rank(metric, cell_line, ascending=ascending).dropna()
+    if hits is None:
+        hits = cube.top_k(metric, k, cell_line, ascending, exclude=controls)
+    position = pd.Series(np.arange(1, len(ranked) + 1), index=ranked.index)
+    fig, ax = plt.subplots(figsize=(10 / 2.54, 7 / 2.54))
+    with profile_stage("draw"):
+        ax.scatter(position, ranked, s=4, color="lightgray", linewidths=0)
+        shown = [h for h in hits if h in position.index]
+        ax.scatter(
+            position[shown], ranked[shown], s=10, color=COLORS[1], zorder=3
+        )
+        for hit in shown:
+            ax.annotate(
+                str(hit),
+                (position[hit], ranked[hit]),
+                xytext=(3, 0),
+                textcoords="offset points",
+                fontsize=5,
+            )
+        for i, control in enumerate(c for c in controls if c in position.index):
+            ax.axhline(
+                ranked[control],
+                color=COLORS[(i + 2) % len(COLORS)],
+                linestyle="--",
+                linewidth=0.5,
+                label=str(control),
+            )
+    if controls:
+        ax.legend(fontsize=6, frameon=False)
+    ax.set_xlabel("rank")
+    ax.set_ylabel(metric)
+    ax.grid(False)
+    if not title:
+        title = f"hits {metric} {cell_line}"
+    fig.suptitle(title, fontsize=8, weight="bold", x=0, y=1.05, ha="left")
+    if save and path:
+        save_fig(
+            fig,
+            path,
+            title.replace(" ", "_").replace("/", "_"),
+            tight_layout=False,
+            fig_extension="pdf",
+        )
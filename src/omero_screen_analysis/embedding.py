@@ -0,0 +1,349 @@
+"""
+Phenotype embedding of per-cell features.
+
+PhenotypeEmbedding standardises a set of feature columns, projects them onto
+their principal components and clusters the cells with mini-batch k-means,
+reading the data in chunks so that hundreds of features of millions of cells
+never have to be held as one dense matrix::
+
+    embedding = PhenotypeEmbedding(features, n_components=10, n_clusters=12)
+    embedding.fit(FeatureStore("screen.fs"))
+    cells = embedding.embed(FeatureStore("screen.fs"))
+    plot_density_maps(cells, ["NT", "CCNA2", "CDK4"], control="NT")
+
+Fitting takes two passes over the data: the first accumulates the means and
+the covariance of the features, chunk by chunk, the second runs k-means on
+the principal component scores. Only the chunk being processed and a
+features x features matrix are held in memory.
+"""
+
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.featurestore import FeatureStore
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.utils import save_fig
+
+current_dir = Path(__file__).parent
+style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
+plt.style.use(style_path)
+
+height = 3 / 2.54  # 3 cm
+
+Source = pd.DataFrame | FeatureStore | Path | str
+
+
+def _iter_chunks(
+    source: Source, columns: Sequence[str], chunksize: int
+) -> Iterator[pd.DataFrame]:
+    """A new pass over the columns of source."""
+    if isinstance(source, FeatureStore):
+        yield from source.iter_chunks(columns, chunksize)
+    elif isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start : start + chunksize][list(columns)]
+    else:
+        yield from pd.read_csv(source, usecols=list(columns), chunksize=chunksize)
+
+
+class PhenotypeEmbedding:
+    """
+    Chunked standardisation, PCA and mini-batch k-means of cell features.
+
+    Parameters
+    ----------
+    features : sequence of str
+        The feature columns to embed.
+    n_components : int, optional
+        Number of principal components kept (default is 10).
+    n_clusters : int, optional
+        Number of k-means clusters; 0 skips clustering (default is 8).
+    batch_size : int, optional
+        Cells per k-means update (default is 4096).
+    chunksize : int, optional
+        Rows read per chunk (default is 500,000).
+    random_state : int, optional
+        Seed for the k-means initialisation and batches.
+    """
+
+    def __init__(
+        self,
+        features: Sequence[str],
+        n_components: int = 10,
+        n_clusters: int = 8,
+        batch_size: int = 4096,
+        chunksize: int = 500_000,
+        random_state: Optional[int] = None,
+    ) -> None:
+        self.features = list(features)
+        self.n_components = min(n_components, len(self.features))
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.chunksize = chunksize
+        self._rng = np.random.default_rng(random_state)
+        p = len(self.features)
+        self.n_cells = 0
+        self.mean_ = np.zeros(p)
+        self._comoment = np.zeros((p, p))
+        self.scale_: Optional[np.ndarray] = None
+        self.components_: Optional[np.ndarray] = None
+        self.explained_variance_ratio_: Optional[np.ndarray] = None
+        self.cluster_centers_: Optional[np.ndarray] = None
+        self._cluster_counts: Optional[np.ndarray] = None
+
+    def _values(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Feature matrix of the complete rows of chunk, as float64."""
+        values = chunk[self.features].to_numpy(dtype=np.float64)
+        return values[~np.isnan(values).any(axis=1)]
+
+    def partial_fit_pca(self, chunk: pd.DataFrame) -> None:
+        """Add chunk to the running mean and covariance."""
+        values = self._values(chunk)
+        n = len(values)
+        if not n:
+            return
+        mean = values.mean(axis=0)
+        centred = values - mean
+        comoment = centred.T @ centred
+        # Chan et al. update of the co-moment of the merged samples
+        delta = mean - self.mean_
+        total = self.n_cells + n
+        self._comoment += comoment + np.outer(delta, delta) * (
+            self.n_cells * n / total
+        )
+        self.mean_ += delta * n / total
+        self.n_cells = total
+
+    def finish_pca(self) -> None:
+        """Derive the principal axes from the accumulated covariance."""
+        if self.n_cells < 2:
+            raise ValueError("At least two complete cells are needed")
+        covariance = self._comoment / (self.n_cells - 1)
+        scale = np.sqrt(np.diag(covariance))
+        # constant features carry no information but must not divide by 0
+        self.scale_ = np.where(scale > 0, scale, 1.0)
+        correlation = covariance / np.outer(self.scale_, self.scale_)
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        order = np.argsort(eigenvalues)[::-1][: self.n_components]
+        components = eigenvectors[:, order].T
+        # fix the sign so that results do not depend on the solver
+        largest = np.abs(components).argmax(axis=1)
+        signs = np.sign(components[np.arange(len(order)), largest])
+        self.components_ = components * signs[:, None]
+        total = max(eigenvalues.clip(min=0).sum(), np.finfo(float).tiny)
+        self.explained_variance_ratio_ = eigenvalues[order].clip(min=0) / total
+
+    def transform(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Principal component scores of chunk, NaN for incomplete rows."""
+        if self.components_ is None or self.scale_ is None:
+            raise RuntimeError("The embedding has not been fitted")
+        values = chunk[self.features].to_numpy(dtype=np.float32)
+        mean = self.mean_.astype(np.float32)
+        scale = self.scale_.astype(np.float32)
+        return ((values - mean) / scale) @ self.components_.T.astype(np.float32)
+
+    def _init_centers(self, scores: np.ndarray) -> np.ndarray:
+        """k-means++ seeding on one batch of scores."""
+        centers = [scores[self._rng.integers(len(scores))]]
+        distance = ((scores - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, self.n_clusters):
+            total = distance.sum()
+            if total > 0:
+                idx = self._rng.choice(len(scores), p=distance / total)
+            else:
+                idx = self._rng.integers(len(scores))
+            centers.append(scores[idx])
+            distance = np.minimum(distance, ((scores - scores[idx]) ** 2).sum(axis=1))
+        return np.array(centers, dtype=np.float64)
+
+    @staticmethod
+    def _nearest(scores: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distance = (
+            (scores**2).sum(axis=1)[:, None]
+            - 2 * scores @ centers.T
+            + (centers**2).sum(axis=1)[None, :]
+        )
+        return np.asarray(distance.argmin(axis=1))
+
+    def partial_fit_clusters(self, chunk: pd.DataFrame) -> None:
+        """Run mini-batch k-means updates on the scores of chunk."""
+        scores = self.transform(chunk)
+        scores = scores[~np.isnan(scores).any(axis=1)].astype(np.float64)
+        if not len(scores):
+            return
+        scores = scores[self._rng.permutation(len(scores))]
+        for start in range(0, len(scores), self.batch_size):
+            batch = scores[start : start + self.batch_size]
+            if self.cluster_centers_ is None:
+                if len(batch) < self.n_clusters:
+                    continue
+                self.cluster_centers_ = self._init_centers(batch)
+                self._cluster_counts = np.zeros(self.n_clusters)
+            assert self._cluster_counts is not None
+            labels = self._nearest(batch, self.cluster_centers_)
+            counts = np.bincount(labels, minlength=self.n_clusters)
+            sums = np.zeros_like(self.cluster_centers_)
+            np.add.at(sums, labels, batch)
+            self._cluster_counts += counts
+            # per-center learning rate 1 / cells seen (Sculley, 2010)
+            hit = counts > 0
+            rate = counts[hit] / self._cluster_counts[hit]
+            means = sums[hit] / counts[hit, None]
+            self.cluster_centers_[hit] += rate[:, None] * (
+                means - self.cluster_centers_[hit]
+            )
+
+    def predict(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Nearest cluster of each row of chunk, -1 for incomplete rows."""
+        if self.cluster_centers_ is None:
+            raise RuntimeError("The clusters have not been fitted")
+        scores = self.transform(chunk)
+        complete = ~np.isnan(scores).any(axis=1)
+        labels = np.full(len(scores), -1)
+        labels[complete] = self._nearest(
+            scores[complete].astype(np.float64), self.cluster_centers_
+        )
+        return labels
+
+    @profiled
+    def fit(self, source: Source) -> "PhenotypeEmbedding":
+        """Fit the PCA and, if n_clusters, the k-means clusters to source."""
+        with profile_stage("pca"):
+            for chunk in _iter_chunks(source, self.features, self.chunksize):
+                self.partial_fit_pca(chunk)
+            self.finish_pca()
+        if self.n_clusters:
+            with profile_stage("kmeans"):
+                for chunk in _iter_chunks(source, self.features, self.chunksize):
+                    self.partial_fit_clusters(chunk)
+        return self
+
+    @profiled
+    def embed(
+        self,
+        source: Source,
+        keep: Sequence[str] = ("plate_id", "cell_line", "condition"),
+    ) -> pd.DataFrame:
+        """
+        The principal component scores (float32) and cluster of every cell
+        of source, with the keep columns.
+        """
+        keep = list(keep)
+        names = [f"PC{i + 1}" for i in range(self.n_components)]
+        parts = []
+        for chunk in _iter_chunks(source, [*keep, *self.features], self.chunksize):
+            part = pd.DataFrame(
+                self.transform(chunk), columns=names, index=chunk.index
+            )
+            if self.cluster_centers_ is not None:
+                part["cluster"] = self.predict(chunk)
+            parts.append(pd.concat([chunk[keep], part], axis=1))
+        return pd.concat(parts)
+
+
+def cluster_profile(
+    embedded: pd.DataFrame,
+    condition_col: str = "condition",
+    by: Sequence[str] = ("cell_line",),
+) -> pd.DataFrame:
+    """Percentage of the cells of each condition in each cluster."""
+    cells = embedded[embedded["cluster"] >= 0]
+    counts = cells.groupby([*by, condition_col, "cluster"]).size()
+    percent = counts / counts.groupby(level=[*by, condition_col]).transform("sum")
+    return (percent * 100).unstack("cluster", fill_value=0)
+
+
+def density_maps(
+    embedded: pd.DataFrame,
+    conditions: list[str],
+    condition_col: str = "condition",
+    x: str = "PC1",
+    y: str = "PC2",
+    bins: int = 100,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Density of the cells of each condition on a common grid.
+
+    Returns an array of shape (conditions, bins, bins) whose maps sum to 1,
+    and the x and y bin edges. The grid spans the 0.5 to 99.5 percentiles
+    of all cells.
+    """
+    x_edges = np.linspace(*np.nanpercentile(embedded[x], [0.5, 99.5]), bins + 1)
+    y_edges = np.linspace(*np.nanpercentile(embedded[y], [0.5, 99.5]), bins + 1)
+    maps = np.zeros((len(conditions), bins, bins))
+    for i, condition in enumerate(conditions):
+        cells = embedded[embedded[condition_col] == condition]
+        hist, _, _ = np.histogram2d(cells[x], cells[y], bins=[x_edges, y_edges])
+        maps[i] = hist / max(hist.sum(), 1)
+    return maps, x_edges, y_edges
+
+
+@profiled
+def plot_density_maps(
+    embedded: pd.DataFrame,
+    conditions: list[str],
+    condition_col: str = "condition",
+    control: Optional[str] = None,
+    x: str = "PC1",
+    y: str = "PC2",
+    bins: int = 100,
+    title: Optional[str] = None,
+    save: bool = True,
+    path: Optional[Path] = None,
+) -> None:
+    """
+    Plot the embedding density of each condition.
+
+    With a control, the maps show the log2 ratio of each condition's density
+    to the control density instead.
+    """
+    maps, x_edges, y_edges = density_maps(
+        embedded, conditions, condition_col, x, y, bins
+    )
+    extent = (x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
+    fig, axes = plt.subplots(
+        ncols=len(conditions),
+        figsize=(height * len(conditions), height),
+        squeeze=False,
+    )
+    if control is not None:
+        # a pseudo-count keeps empty bins finite
+        floor = 1 / max(len(embedded), 1)
+        reference = maps[conditions.index(control)] + floor
+        images = np.log2((maps + floor) / reference)
+        limit = np.nanmax(np.abs(images)) or 1
+        style = {"cmap": "RdBu_r", "vmin": -limit, "vmax": limit}
+    else:
+        images = np.log10(maps + 1e-6)
+        style = {"cmap": "magma_r"}
+    for ax, condition, image in zip(axes[0], conditions, images):
+        with profile_stage("draw"):
+            ax.imshow(
+                image.T,
+                origin="lower",
+                extent=extent,
+                aspect="auto",
+                interpolation="nearest",
+                **style,
+            )
+        ax.set_title(condition, size=6, weight="regular")
+        ax.set_xlabel(x, fontsize=6)
+        ax.tick_params(axis="both", which="major", labelsize=6)
+        ax.grid(False)
+    axes[0][0].set_ylabel(y, fontsize=6)
+    if not title:
+        title = "embedding density" if control is None else f"embedding vs {control}"
+    fig.suptitle(title, fontsize=7, weight="bold", x=0, y=1.05, ha="left")
+    if save and path:
+        save_fig(
+            fig,
+            path,
+            title.replace(" ", "_"),
+            tight_layout=False,
+            fig_extension="pdf",
+        )
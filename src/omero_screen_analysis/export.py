@@ -0,0 +1,367 @@
+"""
+Export of the summary tables behind the figures.
+
+Every summary (normalised counts, cell cycle percentages, classifications,
+feature statistics, synergy scores) is written as compressed Parquet,
+Feather or gzipped CSV, partitioned Hive-style by screen and cell line, next
+to a provenance record of the input, the parameters and the package
+versions::
+
+    export_summaries(df, "exports", screen="siRNA_screen_01",
+                     conditions=["NT", "SCR"], norm_control="NT")
+    counts = read_summary("exports", "counts", cell_line="RPE-1_WT")
+
+    exports/counts/screen=siRNA_screen_01/cell_line=RPE-1_WT/part-0.parquet
+    exports/counts/screen=siRNA_screen_01/provenance.json
+
+Parquet and Feather need pyarrow
+(``pip install omero-screen-analysis[export]``); without it the tables are
+written as gzipped CSV, with a warning.
+"""
+
+import hashlib
+import json
+import platform
+import warnings
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+import omero_screen_analysis
+from omero_screen_analysis.cellcycleplot import cc_phase, prop_pivot
+from omero_screen_analysis.classification_plot import classification_summary
+from omero_screen_analysis.countplot import norm_count
+from omero_screen_analysis.profiling import profiled
+from omero_screen_analysis.synergy import bliss_analysis, hsa_analysis
+
+PROVENANCE = "provenance.json"
+
+# format -> file suffix and default compression
+FORMATS = {
+    "parquet": (".parquet", "zstd"),
+    "feather": (".feather", "zstd"),
+    "csv": (".csv.gz", "gzip"),
+}
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash the contents of a DataFrame."""
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha256(hashes.tobytes())
+    digest.update(json.dumps(list(map(str, df.columns))).encode())
+    return digest.hexdigest()
+
+
+def provenance(
+    input_hash: str, parameters: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """Describe where a summary table came from."""
+    return {
+        "input_hash": input_hash,
+        "parameters": parameters or {},
+        "versions": {
+            "omero_screen_analysis": omero_screen_analysis.__version__,
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+        },
+        "created": datetime.now(UTC).isoformat(timespec="seconds"),
+    }
+
+
+def _writable_format(fmt: str) -> str:
+    """fmt, or csv if it needs pyarrow and pyarrow is not installed."""
+    if fmt == "csv":
+        return fmt
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        warnings.warn(
+            f"Writing {fmt} files requires pyarrow, writing gzipped CSV "
+            "instead (pip install omero-screen-analysis[export])",
+            stacklevel=3,
+        )
+        return "csv"
+    return fmt
+
+
+def _write_table(
+    table: pd.DataFrame, dest: Path, fmt: str, compression: str
+) -> None:
+    if fmt == "parquet":
+        table.to_parquet(dest, index=False, compression=compression)
+    elif fmt == "feather":
+        table.reset_index(drop=True).to_feather(dest, compression=compression)
+    else:
+        table.to_csv(dest, index=False, compression=compression)
+
+
+def _read_table(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    if path.suffix == ".feather":
+        return pd.read_feather(path)
+    return pd.read_csv(path)
+
+
+@profiled
+def export_summary(
+    table: pd.DataFrame,
+    root: Path | str,
+    name: str,
+    screen: str,
+    record: dict[str, Any],
+    partition_by: Sequence[str] = ("cell_line",),
+    fmt: str = "parquet",
+    compression: Optional[str] = None,
+) -> list[Path]:
+    """
+    Write one summary table, partitioned by screen and partition_by.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        The summary table.
+    root : Path or str
+        Export directory; the table is written to root/name.
+    name : str
+        Name of the table.
+    screen : str
+        Screen the table belongs to, the first partition level.
+    record : dict
+        Provenance record, see provenance.
+    partition_by : sequence of str, optional
+        Further partition columns (default is cell_line); columns missing
+        from table are skipped.
+    fmt : str, optional
+        'parquet' (default), 'feather' or 'csv'; Parquet and Feather fall
+        back to CSV with a warning if pyarrow is not installed.
+    compression : str, optional
+        Codec, defaulting to zstd for Parquet and Feather and gzip for CSV;
+        ignored on the CSV fallback.
+
+    Returns
+    -------
+    list of Path
+        The files written, followed by the provenance record.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, use one of {list(FORMATS)}")
+    requested, fmt = fmt, _writable_format(fmt)
+    if fmt != requested:
+        compression = None
+    suffix, default_compression = FORMATS[fmt]
+    compression = compression or default_compression
+    base = Path(root) / name / f"screen={quote(str(screen), safe='')}"
+    # replace an earlier export of the same table
+    for old in base.rglob("part-*"):
+        old.unlink()
+    base.mkdir(parents=True, exist_ok=True)
+
+    partition_by = [col for col in partition_by if col in table]
+    if partition_by:
+        parts = table.groupby(partition_by, sort=True, dropna=False)
+    else:
+        parts = [((), table)]  # type: ignore[assignment]
+    written = []
+    for key, part in parts:
+        values = key if isinstance(key, tuple) else (key,)
+        directory = base.joinpath(
+            *(
+                f"{col}={quote(str(value), safe='')}"
+                for col, value in zip(partition_by, values, strict=True)
+            )
+        )
+        directory.mkdir(parents=True, exist_ok=True)
+        dest = directory / f"part-0{suffix}"
+        _write_table(part.drop(columns=partition_by), dest, fmt, compression)
+        written.append(dest)
+
+    meta = {
+        **record,
+        "table": name,
+        "screen": screen,
+        "format": fmt,
+        "compression": compression,
+        "partition_by": ["screen", *partition_by],
+        "columns": list(map(str, table.columns)),
+        "rows": len(table),
+        "files": [str(path.relative_to(base)) for path in written],
+    }
+    (base / PROVENANCE).write_text(json.dumps(meta, indent=2, default=str))
+    return [*written, base / PROVENANCE]
+
+
+def read_summary(
+    root: Path | str, name: str, **selection: Any
+) -> pd.DataFrame:
+    """
+    Read an exported summary table across screens and partitions.
+
+    Each keyword names a partition column (screen, cell_line, ...) and
+    gives one value or a list of values; only matching files are read.
+    """
+    wanted = {
+        col: {str(v) for v in (value if isinstance(value, list) else [value])}
+        for col, value in selection.items()
+    }
+    frames = []
+    for path in sorted((Path(root) / name).rglob("part-*")):
+        keys = dict(
+            part.split("=", 1)
+            for part in path.parent.relative_to(Path(root) / name).parts
+        )
+        keys = {col: unquote(value) for col, value in keys.items()}
+        if any(keys.get(col) not in values for col, values in wanted.items()):
+            continue
+        frames.append(_read_table(path).assign(**keys))
+    if not frames:
+        raise FileNotFoundError(f"No exported {name} tables in {root}")
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_provenance(root: Path | str, name: str) -> list[dict[str, Any]]:
+    """The provenance records of an exported table, one per screen."""
+    return [
+        json.loads(path.read_text())
+        for path in sorted((Path(root) / name).glob(f"*/{PROVENANCE}"))
+    ]
+
+
+def _per_cell_line(df: pd.DataFrame, func: Any, **kwargs: Any) -> pd.DataFrame:
+    return pd.concat(
+        [
+            func(group, **kwargs).assign(cell_line=cell_line)
+            for cell_line, group in df.groupby("cell_line", sort=True)
+        ],
+        ignore_index=True,
+    )
+
+
+def _long_pivot(pivot: pd.DataFrame, value_name: str) -> pd.DataFrame:
+    long = pivot.stack(future_stack=True).rename(value_name)
+    return long.reset_index()
+
+
+def _cell_cycle_summary(
+    df: pd.DataFrame, condition_col: str, conditions: list[str], H3: bool
+) -> pd.DataFrame:
+    df_mean, df_std = prop_pivot(df, condition_col, conditions, H3)
+    return _long_pivot(df_mean, "percent_mean").merge(
+        _long_pivot(df_std, "percent_std")
+    )
+
+
+def _feature_summary(
+    df: pd.DataFrame, condition_col: str, features: Sequence[str]
+) -> pd.DataFrame:
+    grouped = df.groupby(["plate_id", condition_col], observed=True, sort=True)[
+        list(features)
+    ]
+    stats = pd.concat(
+        {
+            "cells": grouped.count().stack(future_stack=True),
+            "mean": grouped.mean().stack(future_stack=True),
+            "median": grouped.median().stack(future_stack=True),
+            "std": grouped.std().stack(future_stack=True),
+        },
+        axis=1,
+    )
+    stats.index.names = ["plate_id", condition_col, "feature"]
+    return stats.reset_index()
+
+
+def _synergy(df: pd.DataFrame, agent1: str, agent2: str) -> pd.DataFrame:
+    bliss = _long_pivot(bliss_analysis(df, agent1, agent2), "bliss")
+    hsa = _long_pivot(hsa_analysis(df, agent1, agent2), "hsa")
+    return bliss.merge(hsa)
+
+
+@profiled
+def export_summaries(
+    df: pd.DataFrame,
+    root: Path | str,
+    screen: str,
+    conditions: list[str],
+    condition_col: str = "condition",
+    norm_control: Optional[str] = None,
+    H3: bool = False,
+    features: Optional[Sequence[str]] = None,
+    synergy: Optional[tuple[str, str]] = None,
+    input_hash: Optional[str] = None,
+    fmt: str = "parquet",
+) -> dict[str, list[Path]]:
+    """
+    Compute and export every summary table of a screen.
+
+    Writes counts (if norm_control is given), cell_cycle (per plate),
+    cell_cycle_summary (mean and std over plates), classification (if the
+    data has a Class column), features (cells, mean, median and std of each
+    of features per plate) and synergy (if synergy names the two agent
+    columns). input_hash identifies the input and defaults to a hash of df.
+    Returns the files written per table.
+    """
+    input_hash = input_hash or frame_fingerprint(df)
+    parameters: dict[str, Any] = {
+        "conditions": conditions,
+        "condition_col": condition_col,
+    }
+    data, df = df, df[df[condition_col].isin(conditions)]
+    tables: dict[str, tuple[pd.DataFrame, dict[str, Any]]] = {}
+    if norm_control is not None:
+        tables["counts"] = (
+            _per_cell_line(
+                df, norm_count, norm_control=norm_control, condition=condition_col
+            ),
+            {**parameters, "norm_control": norm_control},
+        )
+    if "cell_cycle" in df:
+        tables["cell_cycle"] = (
+            _per_cell_line(df, cc_phase, condition=condition_col),
+            parameters,
+        )
+        tables["cell_cycle_summary"] = (
+            _per_cell_line(
+                df,
+                _cell_cycle_summary,
+                condition_col=condition_col,
+                conditions=conditions,
+                H3=H3,
+            ),
+            {**parameters, "H3": H3},
+        )
+    if "Class" in df:
+        tables["classification"] = (
+            classification_summary(df, condition_col),
+            parameters,
+        )
+    if features:
+        tables["features"] = (
+            _per_cell_line(
+                df,
+                _feature_summary,
+                condition_col=condition_col,
+                features=features,
+            ),
+            {**parameters, "features": list(features)},
+        )
+    if synergy is not None:
+        agent1, agent2 = synergy
+        tables["synergy"] = (
+            # the combinations are encoded in the agent columns
+            _per_cell_line(data, _synergy, agent1=agent1, agent2=agent2),
+            {**parameters, "agent1": agent1, "agent2": agent2},
+        )
+    fmt = _writable_format(fmt)  # warn once, not per table
+    written = {}
+    for name, (table, params) in tables.items():
+        written[name] = export_summary(
+            table, root, name, screen, provenance(input_hash, params), fmt=fmt
+        )
+        print(f"Exported {name}: {len(table)} rows")
+    return written
@@ -9,6 +9,10 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+from omero_screen_analysis.featurestore import FeatureStore
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.preview import preview_sample
+from omero_screen_analysis.profiling import profile_stage, profiled
 from omero_screen_analysis.stats import set_significance_marks
 from omero_screen_analysis.utils import (
     save_fig,
@@ -25,8 +29,9 @@ prop_cycle = plt.rcParams["axes.prop_cycle"]
 COLORS = prop_cycle.by_key()["color"]
 
 
+@profiled
 def feature_plot(
-    df: pd.DataFrame,
+    df: pd.DataFrame | FeatureStore,
     feature: str,
     conditions: list[str],
     ymax: float | tuple[float, float] | None = None,
@@ -37,38 +42,62 @@ def feature_plot(
     colors: list[str] = COLORS,
     save: bool = True,
     path: Optional[Path] = None,
+    index: Optional[GroupIndex] = None,
+    pvalues: Optional[list[float]] = None,
 ) -> None:
-    """Plot a feature plot"""
-    df_filtered = selector_val_filter(df, selector_col, selector_val, condition_col, conditions)
+    """Plot a feature plot
+
+    df may be a FeatureStore, in which case only the rows of the selected
+    conditions and cell line and the columns needed here are loaded.
+    index is an optional GroupIndex of a DataFrame df by condition_col and
+    selector_col, built once and reused to select the rows of each call.
+    pvalues of conditions[1:] against conditions[0], e.g. from
+    hierarchical.condition_pvalues, replace the t-tests of the plate medians
+    and are shown whatever the number of plates.
+    """
+    if isinstance(df, FeatureStore):
+        selection: dict[str, str | list[str]] = {condition_col: conditions}
+        columns = ["plate_id", condition_col, feature]
+        if selector_col and selector_val:
+            selection[selector_col] = selector_val
+        if selector_col:
+            columns.append(selector_col)
+        df = df.frame(columns, **selection)
+    df_filtered = selector_val_filter(
+        df, selector_col, selector_val, condition_col, conditions, index
+    )
     assert df_filtered is not None, "No data found"
+    df_filtered = preview_sample(df_filtered, ["plate_id", condition_col])
 
     fig, ax = plt.subplots(figsize=(height, height))
-    sns.boxenplot(
-        data=df_filtered,
-        x=condition_col,
-        y=feature,
-        color=colors[-1],
-        order=conditions,
-        showfliers=False,
-        ax=ax,
-    )
-    color_list = [colors[2], colors[3], colors[4], colors[5]]
-    plate_ids = df_filtered.plate_id.unique()
-    df_sampled = select_datapoints(df_filtered, conditions, condition_col)
-    for idx, plate_id in enumerate(plate_ids):
-        plate_data = df_sampled[df_sampled.plate_id == plate_id]
-        sns.swarmplot(
-            data=plate_data,
+    with profile_stage("boxenplot"):
+        sns.boxenplot(
+            data=df_filtered,
             x=condition_col,
             y=feature,
-            color=color_list[idx],  # Use color from palette
-            alpha=1,
-            size=2,
-            edgecolor="white",
-            dodge=True,
+            color=colors[-1],
             order=conditions,
+            showfliers=False,
             ax=ax,
         )
+    color_list = [colors[2], colors[3], colors[4], colors[5]]
+    plate_ids = df_filtered.plate_id.unique()
+    df_sampled = select_datapoints(df_filtered, conditions, condition_col)
+    for idx, plate_id in enumerate(plate_ids):
+        plate_data = df_sampled[df_sampled.plate_id == plate_id]
+        with profile_stage("swarmplot"):
+            sns.swarmplot(
+                data=plate_data,
+                x=condition_col,
+                y=feature,
+                color=color_list[idx],  # Use color from palette
+                alpha=1,
+                size=2,
+                edgecolor="white",
+                dodge=True,
+                order=conditions,
+                ax=ax,
+            )
     if ymax:
         if isinstance(ymax, tuple):
             ax.set_ylim(ymax[0], ymax[1])  # unpack tuple into min and max
@@ -76,17 +105,25 @@ def feature_plot(
             ax.set_ylim(
                 0, ymax
             )  # assume 0 as minimum if single value provided
-    df_median = (
-        df_filtered.groupby(["plate_id", condition_col])[feature]
-        .median()
-        .reset_index()
-    )
+    with profile_stage("medians"):
+        df_median = (
+            df_filtered.groupby(["plate_id", condition_col])[feature]
+            .median()
+            .reset_index()
+        )
 
     show_repeat_points(df_median, conditions, condition_col, feature, ax)
-    if len(df.plate_id.unique()) >= 3:
-        set_significance_marks(
-            ax, df_median, conditions, condition_col, feature, ax.get_ylim()[1]
-        )
+    if pvalues is not None or len(df.plate_id.unique()) >= 3:
+        with profile_stage("significance"):
+            set_significance_marks(
+                ax,
+                df_median,
+                conditions,
+                condition_col,
+                feature,
+                ax.get_ylim()[1],
+                pvalues,
+            )
     ax.set_ylabel(feature)
     ax.set_xlabel("")
     ax.set_xticks(range(len(conditions)))
@@ -0,0 +1,255 @@
+"""
+On-disk columnar store of per-cell features.
+
+Each numeric column is stored as a raw binary file and opened as a memory
+mapped NumPy array; text and key columns are dictionary encoded as int32
+codes with their categories in ``meta.json``. Rows are indexed by the key
+columns (plate, condition and cell line by default), so a selection reads
+only the rows and columns it needs::
+
+    store = FeatureStore.build("export.csv", "screen.fs")
+    df = store.frame(
+        ["plate_id", "condition", "intensity_mean_p21_nucleus"],
+        cell_line="RPE-1_WT",
+        condition=["NT", "SCR"],
+    )
+"""
+
+import json
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.groupindex import GroupIndex
+
+KEYS = ("plate_id", "condition", "cell_line")
+META = "meta.json"
+
+
+def _to_json(value: Any) -> Any:
+    """Convert NumPy scalars to plain Python values."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _chunks(
+    source: Path | str | pd.DataFrame | Iterable[pd.DataFrame],
+    chunksize: int,
+) -> Iterator[pd.DataFrame]:
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start : start + chunksize]
+    elif isinstance(source, (str, Path)):
+        yield from pd.read_csv(source, chunksize=chunksize)
+    else:
+        yield from source
+
+
+class FeatureStore:
+    """
+    Memory-mapped per-cell feature table.
+
+    Parameters
+    ----------
+    path : Path
+        Directory of a store written by FeatureStore.build.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        meta = json.loads((self.path / META).read_text())
+        self.n_rows: int = meta["n_rows"]
+        self.keys: list[str] = meta["keys"]
+        self._columns: dict[str, dict[str, Any]] = meta["columns"]
+        group_codes = np.load(self.path / "index_groups.npy")
+        groups = pd.DataFrame(
+            {
+                key: self._decode(key, group_codes[:, k])
+                for k, key in enumerate(self.keys)
+            }
+        )
+        self.index = GroupIndex(
+            groups,
+            np.load(self.path / "index_order.npy", mmap_mode="r"),
+            np.load(self.path / "index_offsets.npy"),
+        )
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def categories(self, column: str) -> pd.Index:
+        """The values of a dictionary-encoded column."""
+        return pd.Index(self._columns[column]["categories"])
+
+    def _array(self, column: str) -> np.ndarray:
+        spec = self._columns[column]
+        if not self.n_rows:
+            return np.empty(0, dtype=spec["dtype"])
+        return np.memmap(
+            self.path / f"{column}.bin",
+            dtype=spec["dtype"],
+            mode="r",
+            shape=(self.n_rows,),
+        )
+
+    def _decode(self, column: str, values: np.ndarray) -> Any:
+        if "categories" not in self._columns[column]:
+            return np.asarray(values)
+        return np.asarray(
+            pd.Categorical.from_codes(
+                np.asarray(values), categories=self.categories(column)
+            )
+        )
+
+    def rows(self, **selection: Any) -> np.ndarray:
+        """
+        Positions of the rows matching selection, in file order.
+
+        Each keyword names a column and gives one value or a list of values.
+        Key columns are resolved through the row index; other columns are
+        matched against their memory-mapped values.
+        """
+        keys, others = {}, {}
+        for column, value in selection.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if column in self.keys:
+                keys[column] = list(values)
+            else:
+                others[column] = list(values)
+        positions = self.index.positions(**keys)
+        for column, values in others.items():
+            if "categories" in self._columns[column]:
+                codes = self.categories(column).get_indexer(values)
+                # unknown values are -1, the code of missing values
+                codes = codes[codes >= 0]
+                match = np.isin(self._array(column)[positions], codes)
+            else:
+                match = np.isin(self._array(column)[positions], values)
+            positions = positions[match]
+        return positions
+
+    def frame(
+        self, columns: Optional[Sequence[str]] = None, **selection: Any
+    ) -> pd.DataFrame:
+        """Load the selected rows of columns into a DataFrame."""
+        columns = list(columns) if columns is not None else self.columns
+        if not selection:
+            return pd.DataFrame(
+                {c: self._decode(c, self._array(c)) for c in columns}
+            )
+        positions = self.rows(**selection)
+        return pd.DataFrame(
+            {c: self._decode(c, self._array(c)[positions]) for c in columns},
+            index=positions,
+        )
+
+    def iter_chunks(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        chunksize: int = 1_000_000,
+    ) -> Iterator[pd.DataFrame]:
+        """Yield consecutive row ranges of columns as DataFrames."""
+        columns = list(columns) if columns is not None else self.columns
+        arrays = {c: self._array(c) for c in columns}
+        for start in range(0, self.n_rows, chunksize):
+            stop = min(start + chunksize, self.n_rows)
+            yield pd.DataFrame(
+                {c: self._decode(c, a[start:stop]) for c, a in arrays.items()},
+                index=pd.RangeIndex(start, stop),
+            )
+
+    @classmethod
+    def build(
+        cls,
+        source: Path | str | pd.DataFrame | Iterable[pd.DataFrame],
+        path: Path | str,
+        keys: Sequence[str] = KEYS,
+        chunksize: int = 500_000,
+        float_dtype: str = "float64",
+    ) -> "FeatureStore":
+        """
+        Write a feature store from a CSV file, a DataFrame or chunks.
+
+        Parameters
+        ----------
+        source : Path, str, pd.DataFrame or iterable of pd.DataFrame
+            The per-cell data; CSV files are read in chunks.
+        path : Path or str
+            Directory to write the store to.
+        keys : sequence of str, optional
+            Columns to index rows by (default is plate_id, condition and
+            cell_line).
+        chunksize : int, optional
+            Rows per chunk when reading a CSV file or a DataFrame.
+        float_dtype : str, optional
+            Storage type of numeric columns; 'float32' halves the size.
+
+        Returns
+        -------
+        FeatureStore
+            The store opened for reading.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        columns: dict[str, dict[str, Any]] = {}
+        lookups: dict[str, dict[Any, int]] = {}
+        files = {}
+        n_rows = 0
+        try:
+            for chunk in _chunks(source, chunksize):
+                chunk = chunk.loc[:, ~chunk.columns.str.startswith("Unnamed")]
+                if not columns:
+                    for col in chunk.columns:
+                        numeric = pd.api.types.is_numeric_dtype(chunk[col])
+                        if numeric and col not in keys:
+                            columns[col] = {"dtype": float_dtype}
+                        else:
+                            columns[col] = {"dtype": "int32", "categories": []}
+                            lookups[col] = {}
+                        files[col] = (path / f"{col}.bin").open("wb")
+                    missing = set(keys) - set(columns)
+                    if missing:
+                        raise ValueError(f"Key columns not found: {missing}")
+                for col, spec in columns.items():
+                    values = chunk[col]
+                    if "categories" in spec:
+                        lookup = lookups[col]
+                        for value in values.dropna().unique():
+                            if value not in lookup:
+                                lookup[value] = len(lookup)
+                                spec["categories"].append(_to_json(value))
+                        arr = (
+                            values.map(lookup)
+                            .fillna(-1)
+                            .to_numpy(dtype=np.int32)
+                        )
+                    else:
+                        arr = values.to_numpy(dtype=spec["dtype"])
+                    files[col].write(arr.tobytes())
+                n_rows += len(chunk)
+        finally:
+            for f in files.values():
+                f.close()
+
+        meta = {"n_rows": n_rows, "keys": list(keys), "columns": columns}
+        (path / META).write_text(json.dumps(meta))
+        cls._write_index(path, meta)
+        return cls(path)
+
+    @staticmethod
+    def _write_index(path: Path, meta: dict[str, Any]) -> None:
+        """Sort rows by their key codes and record where each group starts."""
+        keys = meta["keys"]
+        codes = [
+            np.fromfile(path / f"{key}.bin", dtype=np.int32) for key in keys
+        ]
+        # index on the codes themselves; the store decodes them when opened
+        sizes = [len(meta["columns"][key]["categories"]) for key in keys]
+        index = GroupIndex.from_codes(keys, codes, [np.arange(n) for n in sizes])
+        group_codes = index.groups_table.fillna(-1).to_numpy(dtype=np.int32)
+        np.save(path / "index_order.npy", index.order)
+        np.save(path / "index_offsets.npy", index.offsets)
+        np.save(path / "index_groups.npy", group_codes.reshape(-1, len(keys)))
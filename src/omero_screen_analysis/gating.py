@@ -0,0 +1,440 @@
+"""
+Compact binary files of per-cell cell cycle gating results.
+
+Redoing cc_phase, cellcycle_plot or comb_plot only needs the keys, the
+normalised DAPI and EdU intensities and the phase of each cell. A gating
+file holds just these columns:
+
+- keys and text columns dictionary encoded, with uint8 codes for up to 256
+  values (phases, conditions, cell lines) and wider codes beyond;
+- float columns as float32 (float_dtype='float64' keeps them bit-exact);
+- one chunk per plate, each column compressed separately with zstd
+  (zlib without pyarrow) after shuffling the bytes of its values.
+
+A footer lists the dictionaries and the position of every column of every
+chunk, so a reader decompresses only the plates and columns it needs and can
+stream them plate by plate. Rows keep their position in the input as their
+index, and frame returns them in input order::
+
+    write_gating(df, "screen.gating", extra=["area_nucleus"])
+    gating = GatingFile("screen.gating")
+    cellcycle_plot(gating.frame(), conditions, selector_val="RPE-1_WT")
+    comb_plot(gating, conditions, "area_nucleus", 8000, selector_val="RPE-1_WT")
+
+The format is lossless for keys, phases and integer columns; missing keys
+have their own code and are read back as missing.
+"""
+
+import json
+import struct
+import zlib
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Any, BinaryIO, Optional
+
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.featurestore import _chunks, _to_json
+from omero_screen_analysis.profiling import profile_stage, profiled
+
+MAGIC = b"OSAGATE1"
+KEYS = ("plate_id", "well", "well_id", "cell_line", "condition", "experiment")
+COLUMNS = (
+    *KEYS,
+    "integrated_int_DAPI_norm",
+    "intensity_mean_EdU_nucleus_norm",
+    "cell_cycle",
+    "cell_cycle_detailed",
+)
+CODECS = ("zstd", "zlib")
+_FOOTER = struct.Struct("<Q")
+_MISSING = object()  # dictionary key of missing values
+
+
+def _codec(
+    name: str, level: Optional[int] = None
+) -> tuple[Callable[[bytes], bytes], Callable[[bytes, int], bytes]]:
+    """Compress and decompress functions of a codec."""
+    if name == "zlib":
+        zlib_level = 6 if level is None else level
+        return (
+            lambda data: zlib.compress(data, zlib_level),
+            lambda data, size: zlib.decompress(data, bufsize=max(size, 1)),
+        )
+    if name != "zstd":
+        raise ValueError(f"Unknown compression {name}, use one of {CODECS}")
+    try:
+        import pyarrow as pa
+    except ImportError as err:
+        raise ImportError(
+            "zstd compression requires pyarrow, "
+            "install it or use compression='zlib'"
+        ) from err
+    codec = pa.Codec("zstd", compression_level=3 if level is None else level)
+    return (
+        lambda data: codec.compress(data, asbytes=True),
+        lambda data, size: codec.decompress(
+            data, decompressed_size=size, asbytes=True
+        ),
+    )
+
+
+def default_compression() -> str:
+    """zstd if pyarrow is installed, else zlib."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "zlib"
+    return "zstd"
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    """Group the n-th bytes of all values, which compresses far better."""
+    if values.itemsize == 1:
+        return values.tobytes()
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, dtype: np.dtype) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if dtype.itemsize == 1:
+        return raw.view(dtype)
+    return raw.reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+
+def _code_dtype(n_values: int) -> np.dtype:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_values <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+class GatingWriter:
+    """
+    Write per-cell gating results chunk by chunk.
+
+    Parameters
+    ----------
+    path : Path or str
+        The file to write.
+    keys : sequence of str, optional
+        Columns that are dictionary encoded even if numeric, e.g. plate_id;
+        text columns always are.
+    compression : str, optional
+        'zstd' or 'zlib' (default is zstd if pyarrow is installed).
+    level : int, optional
+        Compression level of the codec.
+    float_dtype : str, optional
+        Storage type of float columns (default is 'float32').
+    chunksize : int, optional
+        Split plates into chunks of at most this many rows.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        keys: Sequence[str] = KEYS,
+        compression: Optional[str] = None,
+        level: Optional[int] = None,
+        float_dtype: str = "float32",
+        chunksize: int = 2_000_000,
+    ) -> None:
+        self.path = Path(path)
+        self.keys = list(keys)
+        self.compression = compression or default_compression()
+        self._compress, _ = _codec(self.compression, level)
+        self.float_dtype = np.dtype(float_dtype)
+        self.chunksize = chunksize
+        self.n_rows = 0
+        self._columns: dict[str, dict[str, Any]] = {}
+        self._lookups: dict[str, dict[Any, int]] = {}
+        self._chunks: list[dict[str, Any]] = []
+        self._closed = False
+        # the file is reopened for appending by every write, so an
+        # abandoned writer does not hold it open
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+        self._size = len(MAGIC)
+
+    def _spec(self, column: str, series: pd.Series) -> dict[str, Any]:
+        if column not in self._columns:
+            kind = series.dtype.kind
+            if column in self.keys or kind not in "biuf":
+                spec: dict[str, Any] = {"kind": "dictionary", "categories": []}
+                self._lookups[column] = {}
+            elif kind == "f":
+                spec = {"kind": "float", "dtype": self.float_dtype.str}
+            else:
+                spec = {"kind": "plain", "dtype": series.dtype.str}
+            self._columns[column] = spec
+        return self._columns[column]
+
+    def _encode(self, column: str, series: pd.Series) -> np.ndarray:
+        spec = self._spec(column, series)
+        if spec["kind"] == "float":
+            return series.to_numpy(dtype=self.float_dtype)
+        if spec["kind"] == "plain":
+            return series.to_numpy(dtype=np.dtype(spec["dtype"]))
+        # dictionaries only grow, so the codes of earlier chunks stay valid
+        codes, uniques = pd.factorize(series)
+        lookup = self._lookups[column]
+        for value in (_to_json(u) for u in uniques):
+            if value not in lookup:
+                lookup[value] = len(spec["categories"])
+                spec["categories"].append(value)
+        mapping = np.array(
+            [lookup[_to_json(u)] for u in uniques], dtype=np.int64
+        )
+        if (codes < 0).any():
+            # missing values get a code of their own, stored as null
+            if _MISSING not in lookup:
+                lookup[_MISSING] = len(spec["categories"])
+                spec["categories"].append(None)
+            mapping = np.append(mapping, lookup[_MISSING])
+        dtype = _code_dtype(len(spec["categories"]))
+        return mapping[codes].astype(dtype)
+
+    @profiled
+    def write(self, df: pd.DataFrame) -> None:
+        """Append the rows of df, one chunk per plate."""
+        if self._chunks and set(df.columns) != set(self._chunks[0]["columns"]):
+            raise ValueError("All chunks must have the same columns")
+        if "plate_id" in df and len(df):
+            plates = df.groupby("plate_id", sort=False, dropna=False).indices
+            parts = [(_to_json(p), idx) for p, idx in plates.items()]
+        else:
+            parts = [(None, np.arange(len(df)))]
+        offset = self.n_rows
+        with open(self.path, "ab") as f:
+            for plate, positions in parts:
+                for start in range(0, max(len(positions), 1), self.chunksize):
+                    selected = positions[start : start + self.chunksize]
+                    if len(selected):
+                        self._write_chunk(
+                            f, plate, df.iloc[selected], offset + selected
+                        )
+        self.n_rows += len(df)
+
+    def _write_block(self, f: BinaryIO, values: np.ndarray) -> dict[str, Any]:
+        with profile_stage("compress"):
+            data = self._compress(_shuffle(values))
+        block = {"offset": self._size, "nbytes": len(data), "dtype": values.dtype.str}
+        f.write(data)
+        self._size += len(data)
+        return block
+
+    def _write_chunk(
+        self, f: BinaryIO, plate: Any, rows: pd.DataFrame, positions: np.ndarray
+    ) -> None:
+        chunk: dict[str, Any] = {"plate": plate, "rows": len(rows), "columns": {}}
+        if positions[-1] - positions[0] == len(positions) - 1:
+            # a contiguous run of the input, e.g. data sorted by plate
+            chunk["start"] = int(positions[0])
+        else:
+            dtype = _code_dtype(int(positions[-1]) + 1)
+            chunk["positions"] = self._write_block(f, positions.astype(dtype))
+        for column in rows.columns:
+            with profile_stage("encode"):
+                values = self._encode(column, rows[column])
+            chunk["columns"][column] = self._write_block(f, values)
+        self._chunks.append(chunk)
+
+    def close(self) -> None:
+        """Write the footer and close the file."""
+        if self._closed:
+            return
+        footer = json.dumps(
+            {
+                "n_rows": self.n_rows,
+                "compression": self.compression,
+                "columns": self._columns,
+                "chunks": self._chunks,
+            }
+        ).encode()
+        with open(self.path, "ab") as f:
+            f.write(footer)
+            f.write(_FOOTER.pack(len(footer)))
+            f.write(MAGIC)
+        self._closed = True
+
+    def abort(self) -> None:
+        """Delete the unfinished file."""
+        self._closed = True
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "GatingWriter":
+        return self
+
+    def __exit__(self, exc_type: Optional[type], *exc: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+@profiled
+def write_gating(
+    source: Path | str | pd.DataFrame | Iterable[pd.DataFrame],
+    path: Path | str,
+    columns: Optional[Sequence[str]] = None,
+    extra: Sequence[str] = (),
+    chunksize: int = 500_000,
+    **kwargs: Any,
+) -> "GatingFile":
+    """
+    Write the gating columns of a CSV file, a DataFrame or chunks.
+
+    columns defaults to those of COLUMNS present in the data; extra adds
+    further columns, e.g. the feature of a comb_plot. Further keyword
+    arguments are passed to GatingWriter. Returns the file opened for
+    reading.
+    """
+    with GatingWriter(path, **kwargs) as writer:
+        for chunk in _chunks(source, chunksize):
+            selected = (
+                list(columns)
+                if columns is not None
+                else [c for c in COLUMNS if c in chunk]
+            )
+            writer.write(chunk[[*selected, *extra]])
+    gating = GatingFile(path)
+    size = Path(path).stat().st_size
+    print(f"Wrote {gating.n_rows} cells to {path} ({size / 2**20:.1f} MB)")
+    return gating
+
+
+class GatingFile:
+    """
+    Reader of a file written by GatingWriter.
+
+    Parameters
+    ----------
+    path : Path or str
+        The gating file.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a gating file")
+            f.seek(-(len(MAGIC) + _FOOTER.size), 2)
+            (length,) = _FOOTER.unpack(f.read(_FOOTER.size))
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is incomplete")
+            f.seek(-(len(MAGIC) + _FOOTER.size + length), 2)
+            meta = json.loads(f.read(length))
+        self.n_rows: int = meta["n_rows"]
+        self.compression: str = meta["compression"]
+        self._columns: dict[str, dict[str, Any]] = meta["columns"]
+        self._chunks: list[dict[str, Any]] = meta["chunks"]
+        self._decompress = _codec(self.compression)[1]
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    @property
+    def plates(self) -> list[Any]:
+        return list(dict.fromkeys(chunk["plate"] for chunk in self._chunks))
+
+    def categories(self, column: str) -> pd.Index:
+        """The values of a dictionary-encoded column."""
+        return pd.Index(self._columns[column]["categories"])
+
+    def _read(self, f: BinaryIO, chunk: dict[str, Any], column: str) -> np.ndarray:
+        return self._read_block(f, chunk, chunk["columns"][column])
+
+    def _read_block(
+        self, f: BinaryIO, chunk: dict[str, Any], spec: dict[str, Any]
+    ) -> np.ndarray:
+        dtype = np.dtype(spec["dtype"])
+        f.seek(spec["offset"])
+        with profile_stage("decompress"):
+            data = self._decompress(f.read(spec["nbytes"]), chunk["rows"] * dtype.itemsize)
+        return _unshuffle(data, dtype)
+
+    def _decode(self, column: str, values: np.ndarray) -> Any:
+        if self._columns[column]["kind"] != "dictionary":
+            return values
+        return self.categories(column).take(values.astype(np.intp))
+
+    def _matches(
+        self, f: BinaryIO, chunk: dict[str, Any], selection: dict[str, list[Any]]
+    ) -> Optional[np.ndarray]:
+        """Rows of chunk matching selection, None for all of them."""
+        keep = None
+        for column, values in selection.items():
+            if self._columns[column]["kind"] == "dictionary":
+                codes = self.categories(column).get_indexer(values)
+                match = np.isin(self._read(f, chunk, column), codes[codes >= 0])
+            else:
+                match = np.isin(self._read(f, chunk, column), values)
+            keep = match if keep is None else keep & match
+        return keep
+
+    def iter_chunks(
+        self, columns: Optional[Sequence[str]] = None, **selection: Any
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield the selected rows of columns, one DataFrame per chunk.
+
+        Each keyword of selection names a column and gives one value or a
+        list of values; chunks of other plates are skipped unread. The index
+        is the position of each row in the written data.
+        """
+        columns = list(columns) if columns is not None else self.columns
+        selection = {
+            column: list(value) if isinstance(value, (list, tuple, set)) else [value]
+            for column, value in selection.items()
+        }
+        plates = selection.pop("plate_id", None)
+        with open(self.path, "rb") as f:
+            for chunk in self._chunks:
+                if plates is not None and chunk["plate"] not in plates:
+                    continue
+                if "positions" in chunk:
+                    index = pd.Index(
+                        self._read_block(f, chunk, chunk["positions"]).astype(
+                            np.int64
+                        )
+                    )
+                else:
+                    start = chunk["start"]
+                    index = pd.RangeIndex(start, start + chunk["rows"])
+                keep = self._matches(f, chunk, selection)
+                if keep is not None:
+                    index = index[keep]
+                frame = {}
+                for column in columns:
+                    values = self._read(f, chunk, column)
+                    if keep is not None:
+                        values = values[keep]
+                    frame[column] = self._decode(column, values)
+                yield pd.DataFrame(frame, index=index)
+
+    @profiled
+    def frame(
+        self, columns: Optional[Sequence[str]] = None, **selection: Any
+    ) -> pd.DataFrame:
+        """Load the selected rows of columns into one DataFrame, in the
+        order they were written."""
+        columns = list(columns) if columns is not None else self.columns
+        chunks = list(self.iter_chunks(columns, **selection))
+        if not chunks:
+            return pd.DataFrame(
+                {
+                    c: self._decode(
+                        c, np.empty(0, self._columns[c].get("dtype", "u1"))
+                    )
+                    for c in columns
+                }
+            )
+        df = pd.concat(chunks)
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        return df
@@ -0,0 +1,144 @@
+"""
+Row index of a dataset by combinations of key columns.
+
+Building a GroupIndex sorts the row positions by their key codes once; any
+later selection of plates, conditions, cell lines or phases then gathers the
+rows of the matching groups in O(group size) instead of comparing every row
+of the table::
+
+    index = GroupIndex.from_frame(df, ["plate_id", "condition"])
+    nt = index.select(df, condition="NT")
+    for (plate_id, condition), rows in index.groups():
+        ...
+"""
+
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+class GroupIndex:
+    """
+    Row positions grouped by the unique combinations of key columns.
+
+    Parameters
+    ----------
+    groups : pd.DataFrame
+        One row per group holding its key values, in group order.
+    order : np.ndarray
+        Row positions sorted by group, stable within a group.
+    offsets : np.ndarray
+        Start of each group in order, followed by the number of rows.
+    """
+
+    def __init__(
+        self, groups: pd.DataFrame, order: np.ndarray, offsets: np.ndarray
+    ) -> None:
+        self.groups_table = groups.reset_index(drop=True)
+        self.keys = list(groups.columns)
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def from_codes(
+        cls,
+        keys: Sequence[str],
+        codes: Sequence[np.ndarray],
+        uniques: Sequence[Any],
+    ) -> "GroupIndex":
+        """Build an index from integer codes per key, -1 marking missing."""
+        # missing values get their own code after the last unique value
+        sizes = [len(u) + 1 for u in uniques]
+        filled = [
+            np.where(np.asarray(c) < 0, size - 1, c)
+            for c, size in zip(codes, sizes, strict=True)
+        ]
+        n_rows = len(filled[0]) if filled else 0
+        combined = np.ravel_multi_index(filled, sizes)
+        order = np.argsort(combined, kind="stable")
+        group_ids, starts = np.unique(combined[order], return_index=True)
+        group_codes = np.unravel_index(group_ids, sizes)
+        groups = pd.DataFrame(
+            {
+                key: np.asarray(
+                    pd.Categorical.from_codes(
+                        np.where(gc == size - 1, -1, gc), categories=u
+                    )
+                )
+                for key, u, gc, size in zip(
+                    keys, uniques, group_codes, sizes, strict=True
+                )
+            }
+        )
+        offsets = np.append(starts, n_rows)
+        return cls(groups, order, offsets)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, keys: Sequence[str]) -> "GroupIndex":
+        """Index the rows of df by the key columns."""
+        factorized = [pd.factorize(df[key], sort=True) for key in keys]
+        # the uniques of a Categorical are a CategoricalIndex, whose own
+        # categories would be taken for them; index by the values instead
+        return cls.from_codes(
+            keys,
+            [codes for codes, _ in factorized],
+            [np.asarray(uniques) for _, uniques in factorized],
+        )
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.offsets[-1])
+
+    def __len__(self) -> int:
+        return len(self.groups_table)
+
+    def group_ids(self, **selection: Any) -> np.ndarray:
+        """Numbers of the groups matching selection."""
+        mask = np.ones(len(self.groups_table), dtype=bool)
+        for key, value in selection.items():
+            if key not in self.keys:
+                raise KeyError(f"{key} is not a key of this index")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= self.groups_table[key].isin(list(values)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def row_groups(self) -> np.ndarray:
+        """Group number of every row."""
+        codes = np.empty(self.n_rows, dtype=np.intp)
+        codes[self.order] = np.repeat(
+            np.arange(len(self)), np.diff(self.offsets)
+        )
+        return codes
+
+    def group_positions(self, group_id: int) -> np.ndarray:
+        """Row positions of one group, in their original order."""
+        start, stop = self.offsets[group_id], self.offsets[group_id + 1]
+        return np.asarray(self.order[start:stop])
+
+    def positions(self, **selection: Any) -> np.ndarray:
+        """
+        Row positions matching selection, in their original order.
+
+        Each keyword names a key column and gives one value or a list of
+        values; keys that are not given match every value.
+        """
+        ids = self.group_ids(**selection)
+        if len(ids) == len(self.groups_table):
+            return np.arange(self.n_rows)
+        if len(ids) == 1:
+            return self.group_positions(ids[0])
+        parts = [self.group_positions(g) for g in ids]
+        return np.sort(np.concatenate([np.empty(0, dtype=np.intp), *parts]))
+
+    def select(self, df: pd.DataFrame, **selection: Any) -> pd.DataFrame:
+        """Rows of the indexed DataFrame matching selection."""
+        return df.iloc[self.positions(**selection)]
+
+    def groups(self) -> Iterator[tuple[tuple[Any, ...], np.ndarray]]:
+        """Yield the key values and row positions of every group."""
+        for g, key in enumerate(
+            self.groups_table.itertuples(index=False, name=None)
+        ):
+            yield key, self.group_positions(g)
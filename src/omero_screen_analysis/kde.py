@@ -0,0 +1,198 @@
+"""
+Fast two-dimensional kernel density estimates for density overlays.
+
+scipy's gaussian_kde, used by seaborn's kdeplot, evaluates every cell
+against every grid point. fft_kde2d instead bins the cells onto a regular
+grid with linear binning and convolves the counts with the Gaussian kernel
+by FFT, which takes O(n + G log G) for n cells and G grid points and handles
+millions of cells in well under a second. It uses the same bandwidth (Scott's
+rule on the full covariance), grid and iso-proportion contour levels as
+seaborn, so kde_contours draws the same contours as::
+
+    sns.kdeplot(x=x, y=y, fill=True, alpha=0.3, cmap="rocket_r", ax=ax)
+
+on log-scaled axes. Densities are estimated on the log of the values when
+an axis is logarithmic, as seaborn does.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+import seaborn as sns
+from matplotlib.axes import Axes
+from matplotlib.contour import QuadContourSet
+
+TRUNCATE = 4.0  # kernel width in bandwidths on either side
+
+
+@dataclass
+class Density2D:
+    """A density on a grid; density[j, i] is the value at (x[i], y[j])."""
+
+    x: np.ndarray
+    y: np.ndarray
+    density: np.ndarray
+
+    def levels(self, levels: int = 10, thresh: float = 0.05) -> np.ndarray:
+        """
+        Iso-proportion levels: the density values enclosing 1 - thresh down
+        to none of the probability mass, from lowest to highest.
+        """
+        return iso_proportion_levels(
+            self.density, np.linspace(thresh, 1, levels)
+        )
+
+
+def iso_proportion_levels(
+    density: np.ndarray, proportions: Sequence[float] | np.ndarray
+) -> np.ndarray:
+    """Density values above which 1 - proportion of the mass lies."""
+    values = np.sort(density, axis=None)[::-1]
+    cumulative = np.cumsum(values) / values.sum()
+    positions = np.searchsorted(cumulative, 1 - np.asarray(proportions))
+    return np.take(values, positions, mode="clip")
+
+
+def _linear_binning(
+    gx: np.ndarray, gy: np.ndarray, weights: np.ndarray, shape: tuple[int, int]
+) -> np.ndarray:
+    """Spread each weight over the four grid points around it."""
+    ny, nx = shape
+    ix = np.clip(np.floor(gx).astype(np.intp), 0, nx - 2)
+    iy = np.clip(np.floor(gy).astype(np.intp), 0, ny - 2)
+    fx, fy = gx - ix, gy - iy
+    counts = np.zeros(ny * nx)
+    for dy, wy in ((0, 1 - fy), (1, fy)):
+        for dx, wx in ((0, 1 - fx), (1, fx)):
+            counts += np.bincount(
+                (iy + dy) * nx + ix + dx,
+                weights=weights * wy * wx,
+                minlength=ny * nx,
+            )
+    return counts.reshape(shape)
+
+
+def _fft_convolve(counts: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Convolve counts with a centred kernel, keeping the shape of counts."""
+    ky, kx = (s // 2 for s in kernel.shape)
+    shape = (counts.shape[0] + 2 * ky, counts.shape[1] + 2 * kx)
+    product = np.fft.rfft2(counts, shape) * np.fft.rfft2(kernel, shape)
+    full = np.fft.irfft2(product, shape)
+    return full[ky : ky + counts.shape[0], kx : kx + counts.shape[1]]
+
+
+def fft_kde2d(
+    x: Sequence[float] | np.ndarray,
+    y: Sequence[float] | np.ndarray,
+    log: tuple[bool, bool] = (False, False),
+    weights: Optional[Sequence[float] | np.ndarray] = None,
+    gridsize: int = 200,
+    cut: float = 3.0,
+    bw_adjust: float = 1.0,
+) -> Optional[Density2D]:
+    """
+    Gaussian kernel density estimate of (x, y) on a gridsize x gridsize grid.
+
+    Parameters
+    ----------
+    x, y : array-like
+        The coordinates of the points.
+    log : tuple[bool, bool], optional
+        Estimate the density of the log of x and/or y, for log-scaled axes;
+        points that are not positive are then dropped.
+    weights : array-like, optional
+        Weight of each point.
+    gridsize : int, optional
+        Grid points along each axis (default is 200, as in seaborn).
+    cut : float, optional
+        Extend the grid this many bandwidths past the extreme points.
+    bw_adjust : float, optional
+        Factor applied to the Scott's rule bandwidth.
+
+    Returns
+    -------
+    Density2D or None
+        The grid in the original units and the density there, or None if
+        fewer than two points remain or they have no spread.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tx = np.log(x) if log[0] else x
+        ty = np.log(y) if log[1] else y
+    keep = np.isfinite(tx) & np.isfinite(ty) & np.isfinite(w)
+    tx, ty, w = tx[keep], ty[keep], w[keep]
+    if len(tx) < 2 or w.sum() <= 0:
+        return None
+
+    # Scott's rule with the effective sample size, as gaussian_kde
+    n_eff = w.sum() ** 2 / (w**2).sum()
+    factor = n_eff ** (-1 / 6) * bw_adjust
+    cov = np.cov(np.vstack([tx, ty]), aweights=w) * factor**2
+    if not np.all(np.isfinite(cov)) or np.linalg.det(cov) <= 0:
+        return None
+    bw = np.sqrt(np.diag(cov))
+
+    gx = np.linspace(tx.min() - cut * bw[0], tx.max() + cut * bw[0], gridsize)
+    gy = np.linspace(ty.min() - cut * bw[1], ty.max() + cut * bw[1], gridsize)
+    step = np.array([gx[1] - gx[0], gy[1] - gy[0]])
+    counts = _linear_binning(
+        (tx - gx[0]) / step[0], (ty - gy[0]) / step[1], w, (gridsize, gridsize)
+    )
+
+    half = np.minimum(np.ceil(TRUNCATE * bw / step), gridsize - 1).astype(int)
+    ox = np.arange(-half[0], half[0] + 1) * step[0]
+    oy = np.arange(-half[1], half[1] + 1) * step[1]
+    dx, dy = np.meshgrid(ox, oy)
+    inv = np.linalg.inv(cov)
+    quad = inv[0, 0] * dx**2 + 2 * inv[0, 1] * dx * dy + inv[1, 1] * dy**2
+    kernel = np.exp(-0.5 * quad) / (2 * np.pi * np.sqrt(np.linalg.det(cov)))
+
+    density = np.clip(_fft_convolve(counts, kernel), 0, None) / w.sum()
+    return Density2D(
+        np.exp(gx) if log[0] else gx,
+        np.exp(gy) if log[1] else gy,
+        density,
+    )
+
+
+def kde_contours(
+    ax: Axes,
+    x: Sequence[float] | np.ndarray,
+    y: Sequence[float] | np.ndarray,
+    levels: int = 10,
+    thresh: float = 0.05,
+    fill: bool = True,
+    cmap: str = "rocket_r",
+    log: Optional[tuple[bool, bool]] = None,
+    **kwargs: Any,
+) -> Optional[QuadContourSet]:
+    """
+    Draw density contours of (x, y) on ax like seaborn's kdeplot.
+
+    log defaults to the scales of ax; further keyword arguments, e.g.
+    alpha or bw_adjust, go to contourf/contour or fft_kde2d. Returns the
+    contour set, or None if the density cannot be estimated.
+    """
+    if log is None:
+        log = (ax.get_xscale() == "log", ax.get_yscale() == "log")
+    estimate = {
+        key: kwargs.pop(key)
+        for key in ("weights", "gridsize", "cut", "bw_adjust")
+        if key in kwargs
+    }
+    result = fft_kde2d(x, y, log=log, **estimate)
+    if result is None:
+        return None
+    draw = ax.contourf if fill else ax.contour
+    return draw(
+        result.x,
+        result.y,
+        result.density,
+        levels=result.levels(levels, thresh),
+        cmap=sns.color_palette(cmap, as_cmap=True),
+        **kwargs,
+    )
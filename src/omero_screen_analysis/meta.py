@@ -0,0 +1,507 @@
+"""
+Meta-analysis of the same conditions across many screens.
+
+Screens are compared through their exported summary tables (see export),
+so no per-cell data is loaded. Each screen contributes, per cell line,
+condition and metric, the difference to its control on the same plate,
+averaged over its plates with the plate-to-plate variance as the error.
+These effects are pooled over screens with inverse-variance weights, both
+as a fixed effect and as a DerSimonian-Laird random effect, along with the
+heterogeneity between screens (Cochran's Q, I² and τ²). All pooling is done
+by grouped sums over one long table, so hundreds of screens and thousands
+of condition x metric pairs take a few aggregations::
+
+    export_summaries(df, "exports", screen="screen_01", conditions=...,
+                     norm_control="NT", features=["area_nucleus"])
+    ...
+    meta = meta_analysis("exports", aliases={"siCCNA2": "CCNA2"})
+    meta.pooled.query("metric == 'phase_S' and qvalue < 0.05")
+    forest_plot(meta, "phase_S", "CCNA2", "RPE-1_WT", path=path)
+
+Metrics are named as in cube: relative_count, phase_<phase> and
+<stat>_<feature>, e.g. median_area_nucleus.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from omero_screen_analysis.export import read_provenance, read_summary
+from omero_screen_analysis.hierarchical import fdr_bh
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.utils import save_fig
+
+current_dir = Path(__file__).parent
+style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
+plt.style.use(style_path)
+prop_cycle = plt.rcParams["axes.prop_cycle"]
+COLORS = prop_cycle.by_key()["color"]
+
+TABLES = ("counts", "cell_cycle", "features")
+KEYS = ["cell_line", "metric", "condition"]
+SCALES = ("difference", "log_ratio")
+
+
+@profiled
+def summary_index(root: Path | str) -> pd.DataFrame:
+    """
+    The exported tables of every screen under root, one row per table and
+    screen, from the provenance records only.
+    """
+    rows = []
+    for directory in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        for record in read_provenance(root, directory.name):
+            parameters = record.get("parameters", {})
+            rows.append(
+                {
+                    "table": record["table"],
+                    "screen": str(record["screen"]),
+                    "rows": record["rows"],
+                    "format": record["format"],
+                    "condition_col": parameters.get("condition_col", "condition"),
+                    "conditions": parameters.get("conditions"),
+                    "norm_control": parameters.get("norm_control"),
+                    "features": parameters.get("features"),
+                    "input_hash": record.get("input_hash"),
+                    "created": record.get("created"),
+                }
+            )
+    columns = [
+        "table",
+        "screen",
+        "rows",
+        "format",
+        "condition_col",
+        "conditions",
+        "norm_control",
+        "features",
+        "input_hash",
+        "created",
+    ]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _conditions(table: pd.DataFrame, index: pd.DataFrame) -> pd.Series:
+    """The condition of each row, from the condition column of its screen."""
+    condition_cols = index.set_index("screen")["condition_col"]
+    column = table["screen"].map(condition_cols).fillna("condition")
+    conditions = pd.Series(np.nan, index=table.index, dtype=object)
+    for col in column.unique():
+        rows = column == col
+        conditions[rows] = table.loc[rows, col]
+    return conditions.astype(str)
+
+
+@profiled
+def plate_values(
+    root: Path | str,
+    tables: Sequence[str] = TABLES,
+    screens: Optional[Sequence[str]] = None,
+    cell_lines: Optional[Sequence[str]] = None,
+    aliases: Optional[dict[str, str]] = None,
+    feature_stat: str = "median",
+) -> pd.DataFrame:
+    """
+    Per-plate values of every metric in the exported summaries.
+
+    Parameters
+    ----------
+    root : Path or str
+        Export directory of export_summaries.
+    tables : sequence of str, optional
+        Summary tables to read: counts, cell_cycle and/or features.
+    screens, cell_lines : sequence of str, optional
+        Only read these screens and cell lines (default is all); other
+        partitions are not opened.
+    aliases : dict, optional
+        Maps condition names to a common name, for screens that name the
+        same condition differently.
+    feature_stat : str, optional
+        Per-plate statistic of the features table, 'median' (default) or
+        'mean'.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per screen, cell line, plate, condition and metric with
+        its value.
+    """
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables {sorted(unknown)}, use {list(TABLES)}")
+    index = summary_index(root)
+    selection: dict[str, Any] = {}
+    if screens is not None:
+        selection["screen"] = [str(s) for s in screens]
+        index = index[index["screen"].isin(selection["screen"])]
+    if cell_lines is not None:
+        selection["cell_line"] = list(cell_lines)
+
+    frames = []
+    for name in tables:
+        if not (index["table"] == name).any():
+            continue
+        try:
+            table = read_summary(root, name, **selection)
+        except FileNotFoundError:
+            continue
+        conditions = _conditions(table, index[index["table"] == name])
+        if name == "counts":
+            metric = pd.Series("relative_count", index=table.index)
+            value = table["normalized_count"]
+        elif name == "cell_cycle":
+            metric = "phase_" + table["cell_cycle"].astype(str)
+            value = table["percent"]
+        else:
+            metric = f"{feature_stat}_" + table["feature"].astype(str)
+            value = table[feature_stat]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "screen": table["screen"].astype(str),
+                    "cell_line": table["cell_line"].astype(str),
+                    "plate_id": table["plate_id"],
+                    "condition": conditions,
+                    "metric": metric,
+                    "value": value.astype(float),
+                }
+            )
+        )
+    if not frames:
+        raise FileNotFoundError(f"No summaries of {list(tables)} in {root}")
+    values = pd.concat(frames, ignore_index=True)
+    if aliases:
+        values["condition"] = values["condition"].replace(aliases)
+    return values
+
+
+def _controls(
+    control: Optional[str | dict[str, str]],
+    screens: Sequence[str],
+    index: Optional[pd.DataFrame],
+) -> pd.Series:
+    """The control condition of every screen."""
+    if isinstance(control, str):
+        return pd.Series(control, index=list(screens))
+    if control is None and index is not None:
+        counts = index[index["table"] == "counts"]
+        control = dict(zip(counts["screen"], counts["norm_control"]))
+    controls = pd.Series(control or {}, dtype=object).reindex(list(screens))
+    missing = controls[controls.isna()].index.tolist()
+    if missing:
+        raise ValueError(f"No control condition given for screens {missing}")
+    return controls
+
+
+@profiled
+def screen_effects(
+    values: pd.DataFrame,
+    control: str | dict[str, str],
+    scale: str = "difference",
+) -> pd.DataFrame:
+    """
+    Effect of every condition against the control of its screen.
+
+    Each condition is compared with the control on the same plate, by the
+    difference or the log ratio of the plate values; the effect of a screen
+    is the mean over its plates and its variance the variance of the plate
+    differences over the number of plates. The variance is NaN for screens
+    with a single plate or no spread between plates, which are then left
+    out of the pooling.
+
+    Parameters
+    ----------
+    values : pd.DataFrame
+        Per-plate values, see plate_values.
+    control : str or dict
+        Control condition, or the control of each screen.
+    scale : str, optional
+        'difference' (default) or 'log_ratio'; values that are not positive
+        are dropped on the log scale.
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale}, use one of {list(SCALES)}")
+    screens = values["screen"].unique()
+    controls = _controls(control, screens, None)
+    is_control = values["condition"] == values["screen"].map(controls)
+    plate_keys = ["screen", "cell_line", "plate_id", "metric"]
+    reference = (
+        values[is_control]
+        .groupby(plate_keys, observed=True, sort=False)["value"]
+        .mean()
+        .rename("control_value")
+    )
+    paired = values[~is_control].join(reference, on=plate_keys)
+    if scale == "log_ratio":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diff = np.log(paired["value"]) - np.log(paired["control_value"])
+    else:
+        diff = paired["value"] - paired["control_value"]
+    paired = paired.assign(diff=diff.where(np.isfinite(diff)))
+    paired = paired.dropna(subset=["diff"])
+
+    effects = paired.groupby(
+        ["screen", *KEYS], observed=True, sort=True
+    ).agg(
+        effect=("diff", "mean"),
+        sd=("diff", "std"),
+        plates=("diff", "size"),
+        value=("value", "mean"),
+        control_value=("control_value", "mean"),
+    )
+    effects["variance"] = effects["sd"] ** 2 / effects["plates"]
+    effects.loc[~(effects["variance"] > 0), "variance"] = np.nan
+    effects = effects.drop(columns="sd").reset_index()
+    effects.insert(1, "control", effects["screen"].map(controls))
+    return effects
+
+
+def _weighted_sums(
+    effects: pd.DataFrame, weights: pd.Series
+) -> pd.DataFrame:
+    d = effects.assign(
+        w=weights, wy=weights * effects["effect"], w2=weights**2
+    ).assign(wy2=lambda d: d["wy"] * d["effect"])
+    return d.groupby(KEYS, observed=True, sort=True).agg(
+        k=("w", "size"),
+        w=("w", "sum"),
+        wy=("wy", "sum"),
+        wy2=("wy2", "sum"),
+        w2=("w2", "sum"),
+    )
+
+
+@profiled
+def pool_effects(
+    effects: pd.DataFrame, level: float = 0.95, min_screens: int = 2
+) -> pd.DataFrame:
+    """
+    Fixed and random effects estimates over screens, with heterogeneity.
+
+    Parameters
+    ----------
+    effects : pd.DataFrame
+        Effects per screen, see screen_effects.
+    level : float, optional
+        Confidence level of the interval of the random effect.
+    min_screens : int, optional
+        Only pool condition x metric pairs with at least this many screens
+        that have a variance (default is 2).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per cell line, metric and condition: the number of screens,
+        the random effect (effect, se, ci_low, ci_high, pvalue and the
+        Benjamini-Hochberg qvalue over all rows), the fixed effect
+        (fixed, fixed_se), Cochran's Q with its p-value, I² and τ².
+    """
+    valid = effects.dropna(subset=["effect", "variance"])
+    fixed = _weighted_sums(valid, 1 / valid["variance"])
+    fixed = fixed[fixed["k"] >= min_screens]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q = (fixed["wy2"] - fixed["wy"] ** 2 / fixed["w"]).clip(lower=0)
+        dof = fixed["k"] - 1
+        c = fixed["w"] - fixed["w2"] / fixed["w"]
+        tau2 = ((q - dof) / c).clip(lower=0).fillna(0)
+        i2 = ((q - dof) / q).clip(lower=0).fillna(0)
+
+    valid = valid.join(tau2.rename("tau2"), on=KEYS, how="inner")
+    random = _weighted_sums(valid, 1 / (valid["variance"] + valid["tau2"]))
+    z_crit = stats.norm.ppf(0.5 + level / 2)
+    pooled = pd.DataFrame(
+        {
+            "screens": fixed["k"],
+            "effect": random["wy"] / random["w"],
+            "se": np.sqrt(1 / random["w"]),
+        }
+    )
+    pooled["ci_low"] = pooled["effect"] - z_crit * pooled["se"]
+    pooled["ci_high"] = pooled["effect"] + z_crit * pooled["se"]
+    pooled["pvalue"] = 2 * stats.norm.sf(np.abs(pooled["effect"] / pooled["se"]))
+    pooled["qvalue"] = fdr_bh(pooled["pvalue"])
+    pooled["fixed"] = fixed["wy"] / fixed["w"]
+    pooled["fixed_se"] = np.sqrt(1 / fixed["w"])
+    pooled["Q"] = q
+    pooled["Q_pvalue"] = stats.chi2.sf(q, dof)
+    pooled["I2"] = i2
+    pooled["tau2"] = tau2
+    return pooled.reset_index()
+
+
+@dataclass
+class MetaAnalysis:
+    """Effects of every screen and their pooled estimates."""
+
+    effects: pd.DataFrame
+    pooled: pd.DataFrame
+    scale: str = "difference"
+
+    def select(
+        self, metric: str, condition: str, cell_line: str
+    ) -> tuple[pd.DataFrame, Optional[pd.Series]]:
+        """The screen effects and the pooled row of one comparison."""
+        key = {"metric": metric, "condition": condition, "cell_line": cell_line}
+
+        def matches(table: pd.DataFrame) -> pd.Series:
+            mask = pd.Series(True, index=table.index)
+            for col, value in key.items():
+                mask &= table[col] == value
+            return mask
+
+        effects = self.effects[matches(self.effects)]
+        pooled = self.pooled[matches(self.pooled)]
+        return effects, (pooled.iloc[0] if len(pooled) else None)
+
+
+@profiled
+def meta_analysis(
+    root: Path | str,
+    control: Optional[str | dict[str, str]] = None,
+    tables: Sequence[str] = TABLES,
+    screens: Optional[Sequence[str]] = None,
+    cell_lines: Optional[Sequence[str]] = None,
+    aliases: Optional[dict[str, str]] = None,
+    feature_stat: str = "median",
+    scale: str = "difference",
+    level: float = 0.95,
+    min_screens: int = 2,
+) -> MetaAnalysis:
+    """
+    Pool the effects of every condition over the screens exported to root.
+
+    control defaults to the norm_control each screen's counts were
+    exported with; give one name, or a dict of screen to control, for
+    screens without counts. aliases is applied before the controls are
+    matched. The other arguments are those of plate_values, screen_effects
+    and pool_effects.
+    """
+    with profile_stage("read"):
+        values = plate_values(
+            root, tables, screens, cell_lines, aliases, feature_stat
+        )
+        if not isinstance(control, str):
+            controls = _controls(
+                control, values["screen"].unique(), summary_index(root)
+            )
+            control = dict(controls.replace(aliases or {}))
+    with profile_stage("pool"):
+        effects = screen_effects(values, control, scale)
+        pooled = pool_effects(effects, level, min_screens)
+    return MetaAnalysis(effects, pooled, scale)
+
+
+@profiled
+def forest_plot(
+    meta: MetaAnalysis,
+    metric: str,
+    conditions: str | Sequence[str],
+    cell_line: str,
+    level: float = 0.95,
+    title: Optional[str] = None,
+    save: bool = True,
+    path: Optional[Path] = None,
+) -> None:
+    """
+    Forest plot of one metric, one panel per condition.
+
+    Every screen is drawn with its effect and confidence interval, sized by
+    its weight in the random effects pool, above the pooled effect as a
+    diamond; screens without a variance are drawn as open markers.
+    """
+    if isinstance(conditions, str):
+        conditions = [conditions]
+    z_crit = stats.norm.ppf(0.5 + level / 2)
+    screens = sorted(
+        meta.effects.loc[
+            (meta.effects["metric"] == metric)
+            & (meta.effects["cell_line"] == cell_line)
+            & meta.effects["condition"].isin(conditions),
+            "screen",
+        ].unique()
+    )
+    if not screens:
+        raise ValueError(f"No effects of {metric} for {cell_line}")
+    rows = pd.Series(np.arange(len(screens), 0, -1), index=screens)
+    fig, axes = plt.subplots(
+        1,
+        len(conditions),
+        figsize=(4 * len(conditions) / 2.54 + 3 / 2.54, (len(screens) + 3) / 2.54),
+        sharey=True,
+        squeeze=False,
+    )
+    with profile_stage("draw"):
+        for ax, condition in zip(axes[0], conditions):
+            effects, pooled = meta.select(metric, condition, cell_line)
+            y = rows[effects["screen"]].to_numpy()
+            half = z_crit * np.sqrt(effects["variance"].to_numpy())
+            ax.errorbar(
+                effects["effect"],
+                y,
+                xerr=np.nan_to_num(half),
+                fmt="none",
+                ecolor="black",
+                elinewidth=0.5,
+            )
+            has_var = effects["variance"].notna().to_numpy()
+            size = np.full(len(effects), 6.0)
+            if pooled is not None:
+                w = 1 / (effects["variance"].to_numpy() + pooled["tau2"])
+                size[has_var] = 6 + 30 * w[has_var] / np.nansum(w)
+            ax.scatter(
+                effects["effect"][has_var],
+                y[has_var],
+                s=size[has_var],
+                marker="s",
+                color=COLORS[0],
+                zorder=3,
+            )
+            ax.scatter(
+                effects["effect"][~has_var],
+                y[~has_var],
+                s=size[~has_var],
+                marker="s",
+                facecolors="none",
+                edgecolors=COLORS[0],
+                zorder=3,
+            )
+            if pooled is not None:
+                diamond_x = [
+                    pooled["ci_low"],
+                    pooled["effect"],
+                    pooled["ci_high"],
+                    pooled["effect"],
+                ]
+                ax.fill(diamond_x, [0, 0.3, 0, -0.3], color=COLORS[1], zorder=3)
+                ax.set_title(
+                    f"{condition}\nI² = {pooled['I2']:.0%}, "
+                    f"q = {pooled['qvalue']:.2g}",
+                    fontsize=7,
+                )
+            else:
+                ax.set_title(str(condition), fontsize=7)
+            ax.axvline(0, color="gray", linestyle="--", linewidth=0.5)
+            ax.set_xlabel(
+                f"{metric} vs control"
+                + (" (log ratio)" if meta.scale == "log_ratio" else "")
+            )
+            ax.grid(False)
+    axes[0, 0].set_yticks([*rows, 0], [*rows.index, "pooled"])
+    axes[0, 0].set_ylim(-1, len(screens) + 1)
+    if not title:
+        title = f"meta {metric} {cell_line}"
+    fig.suptitle(title, fontsize=8, weight="bold", x=0, y=1.05, ha="left")
+    if save and path:
+        save_fig(
+            fig,
+            path,
+            title.replace(" ", "_").replace("/", "_"),
+            tight_layout=False,
+            fig_extension="pdf",
+        )
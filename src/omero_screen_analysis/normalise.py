@@ -0,0 +1,218 @@
+"""
+Per-plate normalisation of intensity features.
+
+normalise writes a ``<feature>_norm`` column for each feature, scaled within
+each plate and cell line (or any other grouping, e.g. per well):
+
+- ``mode``: divide by the position of the main peak of the distribution,
+  found on a smoothed log-scale histogram, and multiply by target. With the
+  DAPI integrated intensity and target=2 this puts the G1 peak at 2, as in
+  ``integrated_int_DAPI_norm``; with EdU and target=1 non-replicating cells
+  sit at 1, as in ``intensity_mean_EdU_nucleus_norm``.
+- ``median``: divide by the median and multiply by target.
+- ``zscore``: robust z-score against the control cells of the same group,
+  (x - median) / (1.4826 * MAD).
+
+Rows are sorted by group once; the medians of every feature are then taken
+on contiguous slices and the modes from one histogram per feature covering
+all groups. Features are processed one at a time, so memory use stays at a
+few arrays of one column::
+
+    normalise(df, ["integrated_int_DAPI"], method="mode", target=2)
+    normalise(df, ["intensity_mean_p21_nucleus"], method="zscore",
+              control="NT")
+"""
+
+from collections.abc import Sequence
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter1d
+
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.profiling import profile_stage, profiled
+
+METHODS = ("mode", "median", "zscore")
+MAD_SCALE = 1.4826  # MAD of a normal distribution -> standard deviation
+
+
+def group_medians(
+    values: np.ndarray, index: GroupIndex, mask: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Median of values per group of index, ignoring NaN and the rows where
+    mask is False; NaN for groups without values.
+    """
+    ordered = values[index.order]
+    keep = ~np.isnan(ordered)
+    if mask is not None:
+        keep &= mask[index.order]
+    medians = np.full(len(index), np.nan)
+    for g in range(len(index)):
+        start, stop = index.offsets[g], index.offsets[g + 1]
+        group = ordered[start:stop][keep[start:stop]]
+        if len(group):
+            medians[g] = np.median(group)
+    return medians
+
+
+def group_modes(
+    values: np.ndarray,
+    codes: np.ndarray,
+    n_groups: int,
+    bins: int = 256,
+    smooth: float = 2.0,
+) -> np.ndarray:
+    """
+    Position of the highest peak of each group's distribution.
+
+    Positive values are binned on a log scale shared by all groups, one
+    histogram per group is accumulated with a single bincount and smoothed
+    with a Gaussian of smooth bins before taking the maximum.
+    """
+    valid = (values > 0) & np.isfinite(values) & (codes >= 0)
+    logs, codes = np.log(values[valid]), codes[valid]
+    modes = np.full(n_groups, np.nan)
+    if not len(logs):
+        return modes
+    low, high = np.quantile(logs, [0.001, 0.999])
+    if high <= low:
+        high = low + 1e-9
+    width = (high - low) / bins
+    idx = np.clip(((logs - low) / width).astype(np.intp), 0, bins - 1)
+    hist = np.bincount(codes * bins + idx, minlength=n_groups * bins)
+    hist = hist.reshape(n_groups, bins).astype(float)
+    if smooth:
+        hist = gaussian_filter1d(hist, smooth, axis=1, mode="constant")
+    has = hist.sum(axis=1) > 0
+    peak = hist.argmax(axis=1)
+    modes[has] = np.exp(low + (peak[has] + 0.5) * width)
+    return modes
+
+
+def _factors(
+    df: pd.DataFrame,
+    feature: str,
+    method: str,
+    index: GroupIndex,
+    codes: np.ndarray,
+    mask: Optional[np.ndarray],
+    target: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Centre and scale of one feature per group."""
+    values = df[feature].to_numpy(dtype=float)
+    n_groups = len(index)
+    with profile_stage(method):
+        if method == "mode":
+            scale = group_modes(values, codes, n_groups) / target
+            return np.zeros(n_groups), scale
+        if method == "median":
+            scale = group_medians(values, index) / target
+            return np.zeros(n_groups), scale
+        center = group_medians(values, index, mask)
+        deviation = np.abs(values - center[codes])
+        scale = MAD_SCALE * group_medians(deviation, index, mask)
+        return center, scale
+
+
+def _prepare(
+    df: pd.DataFrame,
+    method: str,
+    by: Sequence[str],
+    control: Optional[str],
+    condition_col: str,
+) -> tuple[GroupIndex, np.ndarray, Optional[np.ndarray]]:
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, use one of {METHODS}")
+    if method == "zscore" and control is None:
+        raise ValueError("zscore normalisation needs a control condition")
+    index = GroupIndex.from_frame(df, list(by))
+    # only the control cells define the centre and spread of a z-score
+    mask = None
+    if method == "zscore":
+        mask = df[condition_col].to_numpy() == control
+    return index, index.row_groups(), mask
+
+
+@profiled
+def normalisation_factors(
+    df: pd.DataFrame,
+    features: Sequence[str],
+    method: str = "mode",
+    by: Sequence[str] = ("plate_id", "cell_line"),
+    control: Optional[str] = None,
+    condition_col: str = "condition",
+    target: float = 1.0,
+) -> pd.DataFrame:
+    """
+    Centre and scale of each feature per group, one row per group and
+    feature; a normalised value is (x - center) / scale. See normalise for
+    the parameters.
+    """
+    index, codes, mask = _prepare(df, method, by, control, condition_col)
+    tables = []
+    for feature in features:
+        center, scale = _factors(
+            df, feature, method, index, codes, mask, target
+        )
+        tables.append(
+            index.groups_table.assign(
+                feature=feature, center=center, scale=scale
+            )
+        )
+    return pd.concat(tables, ignore_index=True)
+
+
+@profiled
+def normalise(
+    df: pd.DataFrame,
+    features: Sequence[str],
+    method: str = "mode",
+    by: Sequence[str] = ("plate_id", "cell_line"),
+    control: Optional[str] = None,
+    condition_col: str = "condition",
+    target: float = 1.0,
+    suffix: str = "_norm",
+) -> pd.DataFrame:
+    """
+    Add normalised copies of features to df, grouped by plate and cell line.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-cell data; the normalised columns are added in place.
+    features : sequence of str
+        The columns to normalise.
+    method : str, optional
+        'mode' (default), 'median' or 'zscore'.
+    by : sequence of str, optional
+        Columns defining the groups normalised separately (default is
+        plate_id and cell_line; add 'well' for per-well scaling).
+    control : str, optional
+        Control condition for 'zscore'.
+    condition_col : str, optional
+        The column holding the conditions (default is 'condition').
+    target : float, optional
+        Value the mode or median is scaled to (default is 1; use 2 for the
+        DAPI G1 peak).
+    suffix : str, optional
+        Appended to the feature names (default is '_norm').
+
+    Returns
+    -------
+    pd.DataFrame
+        df, with the normalised columns. Groups whose scale is zero or
+        could not be determined get NaN.
+    """
+    index, codes, mask = _prepare(df, method, by, control, condition_col)
+    for feature in features:
+        center, scale = _factors(
+            df, feature, method, index, codes, mask, target
+        )
+        scale = np.where(scale > 0, scale, np.nan)
+        normalised = df[feature].to_numpy(dtype=float) - center[codes]
+        normalised /= scale[codes]
+        df[f"{feature}{suffix}"] = normalised
+    print(f"Normalised {len(features)} features by {method} in {len(index)} groups")
+    return df
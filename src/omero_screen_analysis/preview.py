@@ -0,0 +1,114 @@
+"""
+Fast preview of the plots while iterating on a layout in a notebook.
+
+While preview mode is on, plots of per-cell data draw a stratified sample of
+the cells, density contours are skipped and figures are shown and saved at
+screen resolution. Aggregate plots (counts, cell cycle percentages,
+classifications) are already drawn from per-well summaries and only change
+resolution. Saved previews go to a preview subdirectory of the figure path,
+so they never overwrite the final figures. Switching preview off renders
+the full-fidelity figures from the same calls::
+
+    enable_preview()
+    comb_plot(df, conditions, "area_nucleus", 8000, selector_val="RPE-1_WT")
+    disable_preview()
+
+or, for a single cell, ``with preview(): ...``.
+"""
+
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from omero_screen_analysis.sampling import stratified_sample
+
+PREVIEW_DIR = "preview"
+
+@dataclass(frozen=True)
+class PreviewSettings:
+    """What preview mode trades for speed."""
+
+    cells: int = 1000  # per condition, or condition and plate
+    dpi: int = 72
+    kde: bool = False
+
+
+_settings: Optional[PreviewSettings] = None
+_saved_rc: dict[str, Any] = {}
+
+
+def enable_preview(cells: int = 1000, dpi: int = 72, kde: bool = False) -> None:
+    """Switch preview mode on."""
+    global _settings
+    if _settings is None:
+        _saved_rc.update({"figure.dpi": plt.rcParams["figure.dpi"]})
+    _settings = PreviewSettings(cells, dpi, kde)
+    plt.rcParams["figure.dpi"] = dpi
+
+
+def disable_preview() -> None:
+    """Switch preview mode off, restoring full-fidelity plots."""
+    global _settings
+    _settings = None
+    plt.rcParams.update(_saved_rc)
+    _saved_rc.clear()
+
+
+def preview_settings() -> Optional[PreviewSettings]:
+    """The current preview settings, None while preview mode is off."""
+    return _settings
+
+
+@contextmanager
+def preview(
+    cells: int = 1000, dpi: int = 72, kde: bool = False
+) -> Iterator[PreviewSettings]:
+    """Preview mode for the duration of a with block."""
+    previous = _settings
+    enable_preview(cells, dpi, kde)
+    try:
+        assert _settings is not None
+        yield _settings
+    finally:
+        if previous is None:
+            disable_preview()
+        else:
+            enable_preview(previous.cells, previous.dpi, previous.kde)
+
+
+def preview_sample(df: pd.DataFrame, by: Sequence[str]) -> pd.DataFrame:
+    """In preview mode at most settings.cells rows per group, else df."""
+    if _settings is None or len(df) <= _settings.cells:
+        return df
+    return stratified_sample(df, list(by), _settings.cells, random_state=42)
+
+
+def preview_cell_number(cell_number: Optional[int]) -> Optional[int]:
+    """Cap a per-condition cell number in preview mode."""
+    if _settings is None:
+        return cell_number
+    return min(cell_number or _settings.cells, _settings.cells)
+
+
+def preview_dpi(resolution: int) -> int:
+    """Cap a figure resolution in preview mode."""
+    return resolution if _settings is None else min(resolution, _settings.dpi)
+
+
+def preview_path(path: Path) -> Path:
+    """Where figures of path are saved: path/preview in preview mode."""
+    if _settings is None:
+        return path
+    path = path / PREVIEW_DIR
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def preview_kde() -> bool:
+    """Whether density contours are drawn."""
+    return _settings is None or _settings.kde
@@ -0,0 +1,216 @@
+"""
+Opt-in timing and memory instrumentation for the plotting pipeline.
+
+Public plot functions and their helpers are wrapped with ``profiled`` and
+their internal steps with ``profile_stage``. Both are no-ops until profiling
+is switched on with ``enable_profiling`` or the ``profiling`` context
+manager, after which every stage emits a StageRecord to the module logger,
+to an in-memory list and optionally to a JSON lines file::
+
+    with profiling("profile.jsonl"):
+        count_plot(df, "NT", conditions, path=out)
+    summarize_profile("profile.jsonl")
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any, Optional, TypeVar
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_enabled = False
+_sink: Optional[Path] = None
+_records: list["StageRecord"] = []
+_lock = threading.Lock()
+_stack: ContextVar[tuple[str, ...]] = ContextVar("profile_stack", default=())
+_NULL = nullcontext()
+
+
+def current_rss() -> int:
+    """Return the resident set size of the current process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # ru_maxrss is the peak RSS, in bytes on macOS and kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class StageRecord:
+    """Timing and memory of one stage of a profiled function."""
+
+    function: str
+    stage: str
+    seconds: float
+    rss: int
+    rss_delta: int
+    timestamp: float
+
+
+class _Stage:
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+
+    def __enter__(self) -> "_Stage":
+        self._rss = current_rss()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        seconds = time.perf_counter() - self._start
+        rss = current_rss()
+        _emit(
+            StageRecord(
+                function="/".join(_stack.get()) or "<module>",
+                stage=self.stage,
+                seconds=seconds,
+                rss=rss,
+                rss_delta=rss - self._rss,
+                timestamp=time.time(),
+            )
+        )
+
+
+def _emit(record: StageRecord) -> None:
+    logger.debug(
+        "%s %s %.4fs rss=%d",
+        record.function,
+        record.stage,
+        record.seconds,
+        record.rss,
+    )
+    with _lock:
+        _records.append(record)
+        if _sink is not None:
+            with _sink.open("a") as f:
+                f.write(json.dumps(asdict(record)) + "\n")
+
+
+def enable_profiling(path: Optional[Path | str] = None) -> None:
+    """Start recording stages, appending them to path if given."""
+    global _enabled, _sink
+    _sink = Path(path) if path is not None else None
+    _enabled = True
+
+
+def disable_profiling() -> list[StageRecord]:
+    """Stop recording and return the records collected so far."""
+    global _enabled, _sink
+    _enabled = False
+    _sink = None
+    return profile_records()
+
+
+def profiling_enabled() -> bool:
+    return _enabled
+
+
+def profile_records(clear: bool = False) -> list[StageRecord]:
+    """Return the records collected in this process."""
+    with _lock:
+        records = list(_records)
+        if clear:
+            _records.clear()
+    return records
+
+
+@contextmanager
+def profiling(path: Optional[Path | str] = None) -> Iterator[None]:
+    """Record stages for the duration of the block."""
+    enable_profiling(path)
+    try:
+        yield
+    finally:
+        disable_profiling()
+
+
+def profile_stage(stage: str) -> AbstractContextManager[Any]:
+    """Time a block as a named stage of the enclosing profiled function."""
+    return _Stage(stage) if _enabled else _NULL
+
+
+def profiled(func: F) -> F:
+    """Record the total time of func, and nest its stages under its name."""
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not _enabled:
+            return func(*args, **kwargs)
+        token = _stack.set((*_stack.get(), func.__name__))
+        try:
+            with _Stage("total"):
+                return func(*args, **kwargs)
+        finally:
+            _stack.reset(token)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def _load_records(path: Path | str) -> list[dict[str, Any]]:
+    with Path(path).open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize_profile(
+    records: Optional[Iterable[StageRecord] | Path | str] = None,
+) -> pd.DataFrame:
+    """
+    Aggregate stage costs across a batch run.
+
+    Parameters
+    ----------
+    records : list of StageRecord, Path or str, optional
+        The records to summarise, or a JSON lines file written while
+        profiling (default is the records collected in this process).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per function and stage with the number of calls, the total,
+        mean and maximum time, the share of the profiled time and the
+        largest RSS increase, sorted by total time.
+    """
+    if records is None:
+        records = profile_records()
+    if isinstance(records, (str, Path)):
+        rows = _load_records(records)
+    else:
+        rows = [asdict(r) for r in records]
+    df = pd.DataFrame(
+        rows, columns=[f.name for f in fields(StageRecord)]
+    )
+    summary = (
+        df.groupby(["function", "stage"])
+        .agg(
+            calls=("seconds", "size"),
+            total_s=("seconds", "sum"),
+            mean_s=("seconds", "mean"),
+            max_s=("seconds", "max"),
+            max_rss_delta_mb=("rss_delta", "max"),
+        )
+        .reset_index()
+    )
+    summary["max_rss_delta_mb"] /= 2**20
+    # top-level totals are the wall time of the batch
+    top_level = (summary.stage == "total") & ~summary.function.str.contains("/")
+    wall = summary.loc[top_level, "total_s"].sum() or summary.total_s.sum()
+    summary["share"] = summary.total_s / wall if wall else 0.0
+    return summary.sort_values("total_s", ascending=False, ignore_index=True)
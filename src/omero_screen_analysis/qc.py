@@ -0,0 +1,185 @@
+"""
+Quality control of per-cell data before aggregation.
+
+qc_filter removes segmented objects outside the gates of one or more
+columns (debris, clumps, out-of-focus nuclei) and then whole wells whose
+cell count is a robust outlier among the wells of the same plate and
+condition, or that have too few cells left. Every excluded well is listed
+with the reason, so the filter can run once per dataset and its result be
+passed to all plots::
+
+    gates = [
+        Gate("area_nucleus", min=50, max=2000),
+        Gate("intensity_max_DAPI_nucleus", max=60000),
+    ]
+    df, report = qc_filter(df, gates, min_cells=50)
+    report.wells[report.wells.excluded]
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.normalise import group_medians
+from omero_screen_analysis.profiling import profile_stage, profiled
+
+# scales the MAD so that the score is a z-score for normal data
+MODIFIED_Z = 0.6745
+
+
+@dataclass(frozen=True)
+class Gate:
+    """Keep the cells whose column lies within [min, max]."""
+
+    column: str
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.column} [{self.min}, {self.max}]"
+
+    def passes(self, df: pd.DataFrame) -> np.ndarray:
+        values = df[self.column].to_numpy(dtype=float)
+        keep = ~np.isnan(values)
+        if self.min is not None:
+            keep &= values >= self.min
+        if self.max is not None:
+            keep &= values <= self.max
+        return keep
+
+
+@dataclass
+class QCReport:
+    """Cells removed per gate and the QC outcome of every well."""
+
+    gates: pd.DataFrame
+    wells: pd.DataFrame
+
+    @property
+    def excluded_wells(self) -> pd.DataFrame:
+        return self.wells[self.wells["excluded"]]
+
+    def save(self, path: Path | str) -> None:
+        """Write the gate and well tables as CSV files to path."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.gates.to_csv(path / "qc_gates.csv", index=False)
+        self.wells.to_csv(path / "qc_wells.csv", index=False)
+
+
+@profiled
+def qc_filter(
+    df: pd.DataFrame,
+    gates: Sequence[Gate] = (),
+    condition_col: str = "condition",
+    by: Sequence[str] = ("cell_line",),
+    mad_threshold: Optional[float] = 3.5,
+    min_cells: int = 0,
+    max_gated_fraction: Optional[float] = None,
+    min_wells: int = 3,
+) -> tuple[pd.DataFrame, QCReport]:
+    """
+    Gate cells and exclude outlier wells.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-cell data with plate_id, well and condition columns.
+    gates : sequence of Gate, optional
+        Per-cell gates; cells with a missing value in a gated column fail.
+    condition_col : str, optional
+        The column holding the conditions (default is 'condition').
+    by : sequence of str, optional
+        Further columns whose wells are compared separately (default is
+        cell_line).
+    mad_threshold : float, optional
+        Exclude wells whose modified z-score of the cell count,
+        0.6745 * (count - median) / MAD over the wells of the same plate and
+        condition, exceeds this in absolute value (default is 3.5, the
+        Iglewicz-Hoaglin cut-off); None switches the test off.
+    min_cells : int, optional
+        Exclude wells with fewer cells after gating.
+    max_gated_fraction : float, optional
+        Exclude wells in which more than this fraction of the objects
+        failed the gates, e.g. out-of-focus wells.
+    min_wells : int, optional
+        Only test the counts of groups with at least this many wells
+        (default is 3).
+
+    Returns
+    -------
+    tuple[pd.DataFrame, QCReport]
+        The cells that passed the gates in the wells that were kept, and
+        the report.
+    """
+    keep = np.ones(len(df), dtype=bool)
+    removed = []
+    with profile_stage("gates"):
+        for gate in gates:
+            passes = gate.passes(df)
+            removed.append({"gate": gate.name, "cells": int((~passes).sum())})
+            keep &= passes
+    gate_table = pd.DataFrame(removed, columns=["gate", "cells"])
+
+    well_keys = [*by, "plate_id", condition_col, "well"]
+    index = GroupIndex.from_frame(df, well_keys)
+    codes = index.row_groups()
+    wells = index.groups_table.copy()
+    wells["cells"] = np.diff(index.offsets)
+    wells["kept_cells"] = np.bincount(codes[keep], minlength=len(index))
+    wells["gated_fraction"] = 1 - wells["kept_cells"] / wells["cells"]
+
+    with profile_stage("outliers"):
+        score = np.zeros(len(wells))
+        if mad_threshold is not None and len(wells):
+            groups = GroupIndex.from_frame(
+                wells, [*by, "plate_id", condition_col]
+            )
+            group_of = groups.row_groups()
+            counts = wells["kept_cells"].to_numpy(dtype=float)
+            median = group_medians(counts, groups)[group_of]
+            deviation = np.abs(counts - median)
+            mad = group_medians(deviation, groups)[group_of]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                score = MODIFIED_Z * (counts - median) / mad
+            # identical wells, or a MAD of 0 with no deviation
+            score = np.where(deviation == 0, 0.0, score)
+            enough = np.diff(groups.offsets)[group_of] >= min_wells
+            score = np.where(enough, score, 0.0)
+        wells["count_score"] = score
+
+    reasons = pd.Series("", index=wells.index)
+    if mad_threshold is not None:
+        reasons = reasons.mask(score > mad_threshold, "high count outlier")
+        reasons = reasons.mask(score < -mad_threshold, "low count outlier")
+    if min_cells:
+        few = wells["kept_cells"] < min_cells
+        reasons = _add_reason(reasons, few, f"fewer than {min_cells} cells")
+    if max_gated_fraction is not None:
+        gated = wells["gated_fraction"] > max_gated_fraction
+        reasons = _add_reason(
+            reasons, gated, f"over {max_gated_fraction:.0%} of objects gated"
+        )
+    wells["excluded"] = reasons != ""
+    wells["reason"] = reasons
+
+    keep &= ~wells["excluded"].to_numpy()[codes]
+    excluded = int(wells["excluded"].sum())
+    print(
+        f"QC kept {keep.sum()} of {len(df)} cells, "
+        f"excluded {excluded} of {len(wells)} wells"
+    )
+    return df[keep], QCReport(gates=gate_table, wells=wells)
+
+
+def _add_reason(
+    reasons: pd.Series, flag: pd.Series, reason: str
+) -> pd.Series:
+    joined = reasons.where(reasons == "", reasons + "; ") + reason
+    return reasons.mask(flag, joined)
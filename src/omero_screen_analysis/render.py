@@ -0,0 +1,206 @@
+"""
+Render figures in a pool of pre-warmed worker processes.
+
+Each worker imports matplotlib, seaborn and the package style once, so the
+fixed per-figure setup cost is paid at start-up rather than for every plot.
+Figures are saved by the worker and closed as soon as they are written.
+Pass the per-cell data as a SharedFrame to avoid pickling a copy of it
+into every task.
+"""
+
+import math
+import os
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from importlib import import_module
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from omero_screen_analysis.profiling import current_rss
+from omero_screen_analysis.shared import resolve_shared
+from omero_screen_analysis.utils import save_fig
+
+# Plot functions that can be rendered by name
+PLOTS = {
+    "cellcycle_plot": "omero_screen_analysis.cellcycleplot",
+    "stacked_barplot": "omero_screen_analysis.cellcycleplot",
+    "comb_plot": "omero_screen_analysis.combplot",
+    "count_plot": "omero_screen_analysis.countplot",
+    "feature_plot": "omero_screen_analysis.featureplot",
+    "plot_classification": "omero_screen_analysis.classification_plot",
+    "plot_synergies": "omero_screen_analysis.synergy",
+}
+
+
+@dataclass
+class PlotSpec:
+    """
+    A figure to render: the plot function, its arguments and the output.
+
+    SharedFrame arguments are passed to the plot function as DataFrames.
+    """
+
+    plot: str
+    kwargs: dict[str, Any]
+    fig_id: str
+    path: Path
+    formats: tuple[str, ...] = ("pdf",)
+    tight_layout: bool = False
+    resolution: int = 300
+
+
+@dataclass
+class RenderResult:
+    """Outcome of rendering a single figure."""
+
+    fig_id: str
+    files: list[Path] = field(default_factory=list)
+    seconds: float = math.nan
+    rss: int = 0
+    pid: int = 0
+    error: str | None = None
+
+
+def get_plot_function(name: str) -> Callable[..., Any]:
+    """Look up a public plot function by name."""
+    if name not in PLOTS:
+        raise ValueError(
+            f"Unknown plot '{name}', expected one of {sorted(PLOTS)}"
+        )
+    return getattr(import_module(PLOTS[name]), name)  # type: ignore[no-any-return]
+
+
+def warm_up() -> None:
+    """Import the plotting stack and draw a throwaway figure."""
+    matplotlib.use("Agg")
+    for module in set(PLOTS.values()):
+        import_module(module)
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.plot([0, 1], [0, 1])
+    ax.set_title("warm-up")
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def render(spec: PlotSpec) -> RenderResult:
+    """Render, save and close the figure described by spec."""
+    start = time.perf_counter()
+    func = get_plot_function(spec.plot)
+    try:
+        func(**resolve_shared(spec.kwargs), save=False)
+        fig = plt.gcf()
+        Path(spec.path).mkdir(parents=True, exist_ok=True)
+        files = [
+            save_fig(
+                fig,
+                Path(spec.path),
+                spec.fig_id,
+                tight_layout=spec.tight_layout,
+                fig_extension=ext,
+                resolution=spec.resolution,
+            )
+            for ext in spec.formats
+        ]
+    finally:
+        plt.close("all")
+    return RenderResult(
+        fig_id=spec.fig_id,
+        files=files,
+        seconds=time.perf_counter() - start,
+        rss=current_rss(),
+        pid=os.getpid(),
+    )
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    Pool of worker processes that render PlotSpecs.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker processes (default is the number of CPUs).
+    max_tasks_per_child : int, optional
+        Restart a worker after this many figures to bound its memory.
+    prewarm : bool, optional
+        Start all workers immediately instead of on first use
+        (default is True).
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_tasks_per_child: int | None = None,
+        prewarm: bool = True,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=warm_up,
+            max_tasks_per_child=max_tasks_per_child,
+        )
+        if prewarm:
+            list(self._executor.map(_worker_pid, range(self.workers)))
+
+    def submit(self, spec: PlotSpec) -> Future[RenderResult]:
+        """Queue a figure for rendering."""
+        return self._executor.submit(render, spec)
+
+    def map(self, specs: Iterable[PlotSpec]) -> list[RenderResult]:
+        """Render all specs and return their results in submission order.
+
+        Failed figures are reported through RenderResult.error rather than
+        raised, so one bad spec does not abort a batch.
+        """
+        submitted = [(spec, self.submit(spec)) for spec in specs]
+        results = []
+        for spec, future in submitted:
+            error = future.exception()
+            if error is None:
+                results.append(future.result())
+            else:
+                results.append(
+                    RenderResult(
+                        fig_id=spec.fig_id,
+                        error=f"{type(error).__name__}: {error}",
+                    )
+                )
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "RenderPool":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def results_frame(results: Iterable[RenderResult]) -> pd.DataFrame:
+    """Tabulate render results, one row per figure."""
+    return pd.DataFrame(
+        [
+            {
+                "fig_id": r.fig_id,
+                "files": len(r.files),
+                "seconds": r.seconds,
+                "rss_mb": r.rss / 2**20,
+                "pid": r.pid,
+                "error": r.error,
+            }
+            for r in results
+        ]
+    )
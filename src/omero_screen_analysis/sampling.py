@@ -0,0 +1,86 @@
+"""
+Memory-bounded sampling of per-cell data.
+
+StratifiedReservoir uses random-key reservoir sampling: every row receives a
+uniform random key and the rows with the smallest keys are kept. This draws a
+uniform sample without replacement in a single pass, and works the same
+whether the data arrives as one DataFrame or as a sequence of chunks.
+"""
+
+from collections.abc import Hashable
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+_KEY = "__reservoir_key"
+
+
+class StratifiedReservoir:
+    """
+    Keep a uniform random sample of at most n rows for every group.
+
+    Parameters
+    ----------
+    by : str or list[str]
+        The column(s) defining the strata.
+    n : int, optional
+        Maximum rows kept per group; None keeps every row.
+    random_state : int, optional
+        Seed for the random keys.
+    """
+
+    def __init__(
+        self,
+        by: str | list[str],
+        n: Optional[int],
+        random_state: Optional[int] = None,
+    ) -> None:
+        self.by = by
+        self.n = n
+        self._rng = np.random.default_rng(random_state)
+        self._parts: list[pd.DataFrame] = []
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Add the rows of chunk to the reservoir."""
+        if self.n is None:
+            self._parts.append(chunk)
+            return
+        chunk = chunk.assign(**{_KEY: self._rng.random(len(chunk))})
+        combined = pd.concat([*self._parts, chunk]) if self._parts else chunk
+        order = np.argsort(combined[_KEY].to_numpy(), kind="stable")
+        combined = combined.iloc[order]
+        rank = combined.groupby(self.by, sort=False, observed=True).cumcount()
+        self._parts = [combined[rank.to_numpy() < self.n]]
+
+    @property
+    def sample(self) -> pd.DataFrame:
+        """The sampled rows."""
+        if not self._parts:
+            return pd.DataFrame()
+        sample = (
+            pd.concat(self._parts) if len(self._parts) > 1 else self._parts[0]
+        )
+        if self.n is None:
+            self._parts = [sample]
+            return sample
+        return sample.drop(columns=_KEY)
+
+    def groups(self) -> dict[Hashable, pd.DataFrame]:
+        """The sampled rows split by group."""
+        sample = self.sample
+        if sample.empty:
+            return {}
+        return dict(tuple(sample.groupby(self.by, sort=False, observed=True)))
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    by: str | list[str],
+    n: int,
+    random_state: Optional[int] = None,
+) -> pd.DataFrame:
+    """Sample at most n rows per group of df in a single pass."""
+    reservoir = StratifiedReservoir(by, n, random_state=random_state)
+    reservoir.update(df)
+    return reservoir.sample
@@ -0,0 +1,268 @@
+"""
+Per-cell data shared between processes without copying.
+
+A SharedFrame copies the columns of a DataFrame once into a single block of
+shared memory, or into a memory-mapped file: numeric columns as they are,
+text and categorical columns as integer codes with their categories. Only a
+small handle (block name, column offsets and categories) is pickled when
+the frame is passed to another process, where the columns are attached as
+read-only NumPy arrays over the same memory. Ten workers plotting from the
+same screen therefore hold one copy of it, not ten::
+
+    with SharedFrame(df) as shared, RenderPool(workers=8) as pool:
+        pool.map(
+            PlotSpec("feature_plot", {"df": shared, ...}, fig_id, path)
+            for fig_id in ...
+        )
+
+render replaces SharedFrame arguments by their DataFrame in the worker; in
+any other function call ``shared.frame()``. Text columns come back as
+Categoricals over the shared codes, or with their original dtype from
+``shared.frame(decode=True)``, and the index as a RangeIndex. Nullable
+numbers are stored as NumPy numbers (floats if any value is missing); other
+extension dtypes such as tz-aware datetimes are rejected. The process that
+created the frame owns the memory and releases it on close (or at the end
+of the with block); frames attached in other processes only detach.
+"""
+
+import contextlib
+import os
+import tempfile
+from collections.abc import Sequence
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+ALIGN = 64  # bytes; column starts are aligned for vectorised access
+_NULLABLE = (
+    pd.arrays.IntegerArray,
+    pd.arrays.FloatingArray,
+    pd.arrays.BooleanArray,
+)
+
+
+@dataclass(frozen=True)
+class SharedColumn:
+    """Location and encoding of one column in the shared block."""
+
+    name: str
+    dtype: str
+    offset: int
+    categories: Optional[list[Any]] = None
+    ordered: bool = False
+    text_dtype: Optional[str] = None  # original dtype of a text column
+
+
+def _encode(
+    series: pd.Series,
+) -> tuple[np.ndarray, Optional[pd.Categorical], Optional[str]]:
+    """
+    Column values as a NumPy array, text as Categorical codes with the
+    dtype to decode them to.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.array, None
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return series.to_numpy(), None, None
+    if isinstance(series.array, _NULLABLE):
+        # nullable numbers become NumPy numbers, floats if any is missing
+        if series.hasnans:
+            return series.to_numpy(dtype=float, na_value=np.nan), None, None
+        return series.to_numpy(dtype=dtype.numpy_dtype), None, None
+    if dtype.kind in "biufcmM":
+        # tz-aware datetimes, Arrow and sparse columns would be object arrays
+        raise TypeError(
+            f"Column {series.name} of dtype {dtype} cannot be shared; "
+            "convert it to a NumPy dtype first"
+        )
+    categorical = pd.Categorical(series)
+    return categorical.codes, categorical, str(series.dtype)
+
+
+class SharedFrame:
+    """
+    Columns of a DataFrame in shared memory or a memory-mapped file.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The per-cell data to share.
+    columns : sequence of str, optional
+        Only share these columns (default is all).
+    path : Path or str, optional
+        Directory for a memory-mapped file instead of shared memory; use it
+        where /dev/shm is small or the data should outlive the session.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        columns: Optional[Sequence[str]] = None,
+        path: Optional[Path | str] = None,
+    ) -> None:
+        columns = list(columns) if columns is not None else list(df.columns)
+        encoded = [(c, *_encode(df[c])) for c in columns]
+        layout = []
+        size = 0
+        for name, values, categorical, text_dtype in encoded:
+            size = -(-size // ALIGN) * ALIGN
+            layout.append(
+                SharedColumn(
+                    name,
+                    values.dtype.str,
+                    size,
+                    None
+                    if categorical is None
+                    else categorical.categories.tolist(),
+                    False if categorical is None else categorical.ordered,
+                    text_dtype,
+                )
+            )
+            size += values.nbytes
+        self.n_rows = len(df)
+        self.layout = layout
+        self.owner = True
+        self._file: Optional[str] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._mmap: Optional[np.memmap] = None
+        if path is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            fd, self._file = tempfile.mkstemp(suffix=".frame", dir=path)
+            os.close(fd)
+            self._mmap = np.memmap(self._file, np.uint8, "w+", shape=(max(size, 1),))
+        for (_, values, _, _), column in zip(encoded, layout):
+            self._array(column, writeable=True)[:] = values
+        if self._mmap is not None:
+            self._mmap.flush()
+        self.nbytes = size
+
+    @property
+    def columns(self) -> list[str]:
+        return [column.name for column in self.layout]
+
+    @property
+    def _buffer(self) -> Any:
+        return self._shm.buf if self._shm is not None else self._mmap
+
+    def _array(self, column: SharedColumn, writeable: bool = False) -> np.ndarray:
+        array = np.ndarray(
+            (self.n_rows,),
+            dtype=np.dtype(column.dtype),
+            buffer=self._buffer,
+            offset=column.offset,
+        )
+        array.flags.writeable = writeable
+        return array
+
+    def array(self, column: str) -> np.ndarray:
+        """The stored values of column; codes for a text column."""
+        return self._array(self._column(column))
+
+    def _column(self, name: str) -> SharedColumn:
+        for column in self.layout:
+            if column.name == name:
+                return column
+        raise KeyError(name)
+
+    def frame(
+        self, columns: Optional[Sequence[str]] = None, decode: bool = False
+    ) -> pd.DataFrame:
+        """
+        The shared data as a DataFrame.
+
+        Columns are read-only views of the shared memory, text columns as
+        Categoricals over the shared codes; modifying one in place raises,
+        adding new columns is fine. With decode, text columns are decoded to
+        their original dtype instead, which makes a private copy of them.
+        """
+        names = list(columns) if columns is not None else self.columns
+        index = pd.RangeIndex(self.n_rows)
+        data = {}
+        for name in names:
+            column = self._column(name)
+            values = self._array(column)
+            if column.categories is not None:
+                values = pd.Categorical.from_codes(
+                    values,
+                    categories=column.categories,
+                    ordered=column.ordered,
+                )
+                if decode and column.text_dtype is not None:
+                    # a Series, as the DataFrame constructor would infer
+                    # str for object arrays of text
+                    values = pd.Series(
+                        values.astype(column.text_dtype),
+                        index=index,
+                        dtype=column.text_dtype,
+                    )
+            data[name] = values
+        return pd.DataFrame(data, index=index, copy=False)
+
+    def close(self) -> None:
+        """Detach from the memory, and release it if this process owns it."""
+        if self._shm is not None:
+            # arrays of frame() may still point into the block; the mapping
+            # is then released with them
+            with contextlib.suppress(BufferError):
+                self._shm.close()
+            if self.owner:
+                self._shm.unlink()
+            self._shm = None
+        if self._mmap is not None:
+            self._mmap = None
+            if self.owner and self._file is not None:
+                Path(self._file).unlink(missing_ok=True)
+
+    def __enter__(self) -> "SharedFrame":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        if self._shm is None and self._mmap is None:
+            raise ValueError("SharedFrame is closed")
+        return {
+            "n_rows": self.n_rows,
+            "layout": self.layout,
+            "nbytes": self.nbytes,
+            "shm": self._shm.name if self._shm is not None else None,
+            "file": self._file,
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.n_rows = state["n_rows"]
+        self.layout = state["layout"]
+        self.nbytes = state["nbytes"]
+        self.owner = False
+        self._file = state["file"]
+        self._shm = None
+        self._mmap = None
+        if state["shm"] is not None:
+            # spawned workers share the parent's resource tracker, which
+            # already holds the block; the owner unlinks it
+            self._shm = shared_memory.SharedMemory(name=state["shm"])
+        else:
+            self._mmap = np.memmap(self._file, np.uint8, "r")
+
+    def __repr__(self) -> str:
+        backing = "shared memory" if self._file is None else self._file
+        return (
+            f"SharedFrame({self.n_rows} rows, {len(self.layout)} columns, "
+            f"{self.nbytes / 2**20:.1f} MB in {backing})"
+        )
+
+
+def resolve_shared(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Replace SharedFrame values of kwargs by their DataFrame."""
+    return {
+        key: value.frame() if isinstance(value, SharedFrame) else value
+        for key, value in kwargs.items()
+    }
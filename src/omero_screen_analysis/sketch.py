@@ -0,0 +1,180 @@
+"""
+Mergeable quantile sketches for large screens.
+
+QuantileSketch is a KLL sketch: values are held in a stack of compactors,
+where an item at level h stands for 2**h original values. When the sketch
+grows past its capacity, the lowest full level is sorted and every other item
+is promoted to the level above. The sketch keeps O(k) items, answers any quantile with a rank error of
+roughly 1.7 / k, and two sketches built on different partitions of the data
+merge into a sketch of the union. Until the first compaction the quantiles
+are exact.
+"""
+
+from collections.abc import Hashable, Iterable, Mapping
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Values are fed to the compactors in blocks of this many items times k
+_BLOCK = 64
+
+
+class QuantileSketch:
+    """
+    KLL sketch of a stream of values.
+
+    Parameters
+    ----------
+    k : int, optional
+        Size of the top compactor; larger values are more accurate
+        (default is 512).
+    random_state : int, optional
+        Seed for the random compaction offsets.
+    """
+
+    def __init__(self, k: int = 512, random_state: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels: list[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(random_state)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        while len(self) > sum(map(self._capacity, range(len(self._levels)))):
+            level = next(
+                h
+                for h, items in enumerate(self._levels)
+                if len(items) >= self._capacity(h)
+            )
+            if level + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+            items = np.sort(self._levels[level])
+            # an odd item out stays behind at this level
+            keep = items[: len(items) % 2]
+            promoted = items[len(keep) :][self._rng.integers(2) :: 2]
+            self._levels[level] = keep
+            self._levels[level + 1] = np.concatenate(
+                [self._levels[level + 1], promoted]
+            )
+
+    def update(self, values: Iterable[float]) -> "QuantileSketch":
+        """Add values to the sketch, ignoring missing values."""
+        arr = np.asarray(values, dtype=float).ravel()
+        arr = arr[~np.isnan(arr)]
+        if not len(arr):
+            return self
+        self.count += len(arr)
+        self.min = min(self.min, float(arr.min()))
+        self.max = max(self.max, float(arr.max()))
+        block = self.k * _BLOCK
+        for start in range(0, len(arr), block):
+            self._levels[0] = np.concatenate(
+                [self._levels[0], arr[start : start + block]]
+            )
+            self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Fold other into this sketch and return it."""
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged")
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @property
+    def exact(self) -> bool:
+        """Whether the sketch still holds every value it has seen."""
+        return len(self._levels[0]) == self.count
+
+    def quantile(self, q: float | Iterable[float]) -> float | np.ndarray:
+        """Return the estimated q-quantile(s) of the values seen so far."""
+        qs = np.asarray(q, dtype=float)
+        if not self.count:
+            result = np.full(qs.shape, np.nan)
+        elif self.exact:
+            result = np.quantile(self._levels[0], qs)
+        else:
+            items = np.concatenate(self._levels)
+            weights = np.concatenate(
+                [np.full(len(v), 2.0**h) for h, v in enumerate(self._levels)]
+            )
+            order = np.argsort(items, kind="stable")
+            items, weights = items[order], weights[order]
+            positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+            result = np.interp(
+                qs,
+                np.concatenate([[0.0], positions, [1.0]]),
+                np.concatenate([[self.min], items, [self.max]]),
+            )
+        return float(result) if result.ndim == 0 else result
+
+    def median(self) -> float:
+        return float(self.quantile(0.5))
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._levels)
+
+
+def sketch_groups(
+    df: pd.DataFrame,
+    value_col: str,
+    by: list[str],
+    k: int = 512,
+    random_state: Optional[int] = None,
+) -> dict[Hashable, QuantileSketch]:
+    """Build one sketch of value_col per group of the by columns."""
+    codes = df.groupby(by, sort=True, observed=True).ngroup()
+    # rows with a missing key are not part of any group
+    codes = codes.to_numpy(dtype=float, na_value=-1).astype(np.int64)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    values = df[value_col].to_numpy(dtype=float)[order]
+    keys = df[by].to_numpy()[order]
+    sketches: dict[Hashable, QuantileSketch] = {}
+    for rows in np.split(np.arange(len(order)), bounds):
+        if not len(rows):
+            continue
+        key = tuple(keys[rows[0]])
+        sketches[key] = QuantileSketch(k, random_state).update(values[rows])
+    return sketches
+
+
+def merge_sketch_groups(
+    *groups: Mapping[Hashable, QuantileSketch],
+) -> dict[Hashable, QuantileSketch]:
+    """Merge per-group sketches built on different partitions of a screen."""
+    merged: dict[Hashable, QuantileSketch] = {}
+    for group in groups:
+        for key, sketch in group.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = QuantileSketch(sketch.k).merge(sketch)
+    return merged
+
+
+def grouped_quantiles(
+    sketches: Mapping[Hashable, QuantileSketch],
+    by: list[str],
+    q: float,
+    value_col: str,
+) -> pd.DataFrame:
+    """Tabulate the q-quantile of each group sketch, one row per group."""
+    keys = list(sketches)
+    df = pd.DataFrame(keys, columns=by)
+    df[value_col] = [sketches[key].quantile(q) for key in keys]
+    return df
@@ -1,3 +1,4 @@
+from typing import Optional
 
 import pandas as pd
 from matplotlib.axes import Axes
@@ -28,9 +29,14 @@ def get_significance_marker(p: float) -> str:
         case _:
             return "***"
 
-def set_significance_marks(axes: Axes, df: pd.DataFrame, conditions: list[str], condition_col: str, y_col: str, y_max: float):
-    """Set the significance marks on the axes."""
-    pvalues = calculate_pvalues(df, conditions, condition_col, y_col)
+def set_significance_marks(axes: Axes, df: pd.DataFrame, conditions: list[str], condition_col: str, y_col: str, y_max: float, pvalues: Optional[list[float]] = None):
+    """Set the significance marks on the axes.
+
+    pvalues of conditions[1:] against conditions[0] can be given, e.g. from
+    hierarchical.compare_conditions; otherwise they are calculated from df.
+    """
+    if pvalues is None:
+        pvalues = calculate_pvalues(df, conditions, condition_col, y_col)
     for i, _ in enumerate(conditions[1:], start=1):
         p_value = pvalues[i - 1]  # Adjust index for p-values list
         significance = get_significance_marker(p_value)
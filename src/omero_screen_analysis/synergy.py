@@ -2,9 +2,11 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
+from omero_screen_analysis.profiling import profile_stage, profiled
 from omero_screen_analysis.utils import save_fig
 
 
+@profiled
 def normalize_cell_counts(df, agent1, agent2):
     df1 = (
         df.groupby(["well", agent1, agent2])
@@ -23,6 +25,7 @@ def normalize_cell_counts(df, agent1, agent2):
     return df1, df_pivot.astype(float)
 
 
+@profiled
 def bliss_analysis(df, agent1, agent2):
     _, df_pivot = normalize_cell_counts(df, agent1, agent2)
 
@@ -55,6 +58,7 @@ def bliss_analysis(df, agent1, agent2):
     return synergy_scores
 
 
+@profiled
 def hsa_analysis(df, agent1, agent2):
     df1, df_pivot = normalize_cell_counts(df, agent1, agent2)
     max_single_agent = pd.DataFrame(
@@ -69,6 +73,7 @@ def hsa_analysis(df, agent1, agent2):
     return df_pivot - max_single_agent
 
 
+@profiled
 def plot_synergies(df, agent1, agent2, title=None, save=False, path=None):
     if len(df.cell_line.unique()) > 1:
         raise ValueError("More than one cell line in the data")
@@ -77,51 +82,170 @@ def plot_synergies(df, agent1, agent2, title=None, save=False, path=None):
     df_hsa = hsa_analysis(df, agent1, agent2)
     _, df_pivot = normalize_cell_counts(df, agent1, agent2)
     fig, ax = plt.subplots(ncols=3, figsize=(15, 6))
-    sns.heatmap(
-        df_pivot,
-        ax=ax[0],
-        annot=True,
-        cmap="viridis",
-        cbar_kws={"label": "Cell Count"},
+    with profile_stage("draw"):
+        sns.heatmap(
+            df_pivot,
+            ax=ax[0],
+            annot=True,
+            cmap="viridis",
+            cbar_kws={"label": "Cell Count"},
+        )
+        ax[0].set_title("Observed Normalized Cell Counts", size=7)
+        ax[0].set_xlabel(agent2)
+        ax[0].set_ylabel(agent1)
+        sns.heatmap(
+            df_hsa,
+            annot=True,
+            cmap="RdYlBu_r",
+            vmin=-1,  # Set minimum value
+            vmax=1,  # Set maximum value
+            center=0,
+            cbar_kws={"label": "HSA Synergy Score"},
+            ax=ax[1],
+        )
+        ax[1].set_title("HSA Synergy Scores", size=8, weight="regular")
+        ax[1].set_xlabel(agent2)
+        ax[1].set_ylabel(agent1)
+
+        # Second heatmap: Bliss synergy scores
+        sns.heatmap(
+            df_bliss,
+            annot=True,
+            cmap="coolwarm",
+            vmin=-1,  # Set minimum value
+            vmax=1,  # Set maximum value
+            center=0,
+            cbar_kws={"label": "Bliss Synergy Score"},
+            ax=ax[2],
+        )
+        ax[2].set_title("Bliss Synergy Scores", size=8, weight="regular")
+        ax[2].set_xlabel(agent2)
+        ax[2].set_ylabel(agent1)
+    if title is None:
+        title = f"{agent1} and {agent2} Synergy Analysis in {cell_line}"
+    fig.suptitle(title, size=10, weight="bold", x=0.13)
+
+    with profile_stage("tight_layout"):
+        plt.tight_layout()
+    if save and path:
+        save_fig(fig, path, title)
+    elif save:
+        raise ValueError("Path must be provided if save is True")
+    else:
+        return fig
+
+
+@profiled
+def screen_synergy(df, agent1, agent2, by=("cell_line", "plate_id")):
+    """
+    Bliss and HSA synergy scores for every cell line and replicate plate.
+
+    Cells are counted per well in one pass, and the normalized counts and
+    scores of all partitions are computed together, with the same
+    definitions as normalize_cell_counts, bliss_analysis and hsa_analysis.
+    Wells of the same combination within a partition are averaged.
+
+    Returns
+    -------
+    scores : pd.DataFrame
+        One row per partition and combination with the cell count, the
+        normalized count (effect), and the Bliss and HSA scores.
+    summary : pd.DataFrame
+        Mean and standard error of the mean of the effect and scores over
+        the replicate plates, one row per cell line and combination.
+    """
+    by = list(by)
+    wells = (
+        df.groupby([*by, "well", agent1, agent2], observed=True)
+        .size()
+        .reset_index(name="cell_count")
+    )
+    counts = wells.groupby(by, observed=True)["cell_count"]
+    max_cells = counts.transform("max")
+    min_cells = counts.transform("min")
+    wells["effect"] = (max_cells - wells["cell_count"]) / (
+        max_cells - min_cells
+    )
+    scores = (
+        wells.groupby([*by, agent1, agent2], observed=True)[
+            ["cell_count", "effect"]
+        ]
+        .mean()
+        .reset_index()
+    )
+
+    # single agent effects of the same partition
+    alone1 = scores.loc[scores[agent2] == 0, [*by, agent1, "effect"]]
+    alone2 = scores.loc[scores[agent1] == 0, [*by, agent2, "effect"]]
+    scores = scores.merge(
+        alone1.rename(columns={"effect": "effect1"}), on=[*by, agent1], how="left"
+    ).merge(
+        alone2.rename(columns={"effect": "effect2"}), on=[*by, agent2], how="left"
     )
-    ax[0].set_title("Observed Normalized Cell Counts", size=7)
-    ax[0].set_xlabel(agent2)
-    ax[0].set_ylabel(agent1)
-    sns.heatmap(
-        df_hsa,
-        annot=True,
-        cmap="RdYlBu_r",
-        vmin=-1,  # Set minimum value
-        vmax=1,  # Set maximum value
-        center=0,
-        cbar_kws={"label": "HSA Synergy Score"},
-        ax=ax[1],
+    expected = scores["effect1"] + scores["effect2"] - (
+        scores["effect1"] * scores["effect2"]
     )
-    ax[1].set_title("HSA Synergy Scores", size=8, weight="regular")
-    ax[1].set_xlabel(agent2)
-    ax[1].set_ylabel(agent1)
-
-    # Second heatmap: Bliss synergy scores
-    sns.heatmap(
-        df_bliss,
-        annot=True,
-        cmap="coolwarm",
-        vmin=-1,  # Set minimum value
-        vmax=1,  # Set maximum value
-        center=0,
-        cbar_kws={"label": "Bliss Synergy Score"},
-        ax=ax[2],
+    single = (scores[agent1] == 0) | (scores[agent2] == 0)
+    bliss = scores["effect"] - expected.where(~single, scores["effect"])
+    scores["bliss"] = bliss.replace([np.inf, -np.inf], np.nan).fillna(0)
+    scores["hsa"] = scores["effect"] - scores[["effect1", "effect2"]].max(
+        axis=1, skipna=False
     )
-    ax[2].set_title("Bliss Synergy Scores", size=8, weight="regular")
-    ax[2].set_xlabel(agent2)
-    ax[2].set_ylabel(agent1)
+    scores = scores.drop(columns=["effect1", "effect2"])
+
+    groups = [col for col in by if col != "plate_id"]
+    summary = scores.groupby([*groups, agent1, agent2], observed=True)[
+        ["effect", "bliss", "hsa"]
+    ].agg(["mean", "sem"])
+    summary.columns = [f"{col}_{stat}" for col, stat in summary.columns]
+    summary["plates"] = scores.groupby(
+        [*groups, agent1, agent2], observed=True
+    ).size()
+    return scores, summary.reset_index()
+
+
+@profiled
+def plot_synergy_grid(
+    summary, agent1, agent2, title=None, save=False, path=None
+):
+    """Heatmaps of the mean effect, HSA and Bliss scores, one row per cell line."""
+    cell_lines = summary.cell_line.unique()
+    panels = [
+        ("effect_mean", "Observed Normalized Cell Counts", "viridis", None),
+        ("hsa_mean", "HSA Synergy Scores", "RdYlBu_r", (-1, 1)),
+        ("bliss_mean", "Bliss Synergy Scores", "coolwarm", (-1, 1)),
+    ]
+    fig, axes = plt.subplots(
+        nrows=len(cell_lines),
+        ncols=3,
+        figsize=(15, 5 * len(cell_lines)),
+        squeeze=False,
+    )
+    for row, cell_line in enumerate(cell_lines):
+        data = summary[summary.cell_line == cell_line]
+        for ax, (col, label, cmap, limits) in zip(axes[row], panels):
+            pivot = data.pivot(index=agent1, columns=agent2, values=col)
+            with profile_stage("draw"):
+                sns.heatmap(
+                    pivot.astype(float),
+                    annot=True,
+                    cmap=cmap,
+                    vmin=limits[0] if limits else None,
+                    vmax=limits[1] if limits else None,
+                    center=0 if limits else None,
+                    ax=ax,
+                )
+            ax.set_title(f"{label} {cell_line}", size=8, weight="regular")
+            ax.set_xlabel(agent2)
+            ax.set_ylabel(agent1)
     if title is None:
-        title = f"{agent1} and {agent2} Synergy Analysis in {cell_line}"
+        title = f"{agent1} and {agent2} Synergy Analysis"
     fig.suptitle(title, size=10, weight="bold", x=0.13)
 
-    plt.tight_layout()
+    with profile_stage("tight_layout"):
+        plt.tight_layout()
     if save and path:
-        save_fig(fig, path, title)
+        save_fig(fig, path, title.replace(" ", "_"))
     elif save:
         raise ValueError("Path must be provided if save is True")
     else:
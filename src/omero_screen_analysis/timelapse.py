@@ -0,0 +1,218 @@
+"""
+Aggregation and kinetics plots for multi-timepoint screens.
+
+Live-cell exports hold one row per cell and timepoint. TimelapseAggregator
+computes cell counts, cell cycle phase percentages and feature medians per
+plate, cell line, condition and timepoint, and accepts the data in chunks so
+that a long time course never has to be held in memory at once::
+
+    aggregator = TimelapseAggregator(features=["area_nucleus"])
+    for chunk in pd.read_csv("timelapse.csv", chunksize=500_000):
+        aggregator.update(chunk)
+    summary = aggregator.summary(norm_control="NT")
+
+Feature medians come from mergeable quantile sketches (see sketch): they are
+exact for groups of up to k cells and approximate, with a rank error of about
+1.7 / k, for larger groups. The sketches are seeded, so the same chunks give
+the same medians on every run.
+"""
+
+from collections.abc import Hashable, Iterable, Sequence
+from pathlib import Path
+from typing import Optional
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.sketch import QuantileSketch, sketch_groups
+from omero_screen_analysis.utils import save_fig
+
+current_dir = Path(__file__).parent
+style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
+plt.style.use(style_path)
+prop_cycle = plt.rcParams["axes.prop_cycle"]
+COLORS = prop_cycle.by_key()["color"]
+
+height = 3 / 2.54  # 3 cm
+
+
+class TimelapseAggregator:
+    """
+    Incremental per-timepoint summary of per-cell data.
+
+    Parameters
+    ----------
+    condition_col : str, optional
+        The column holding the conditions (default is 'condition').
+    time_col : str, optional
+        The column holding the timepoints (default is 'timepoint').
+    features : sequence of str, optional
+        Feature columns whose median is tracked over time.
+    phase_col : str, optional
+        The column holding the cell cycle phases; None skips the phase
+        percentages (default is 'cell_cycle').
+    k : int, optional
+        Size of the median sketches; groups of up to k cells get exact
+        medians (default is 512).
+    random_state : int, optional
+        Seed of the median sketches (default is 0).
+    """
+
+    def __init__(
+        self,
+        condition_col: str = "condition",
+        time_col: str = "timepoint",
+        features: Sequence[str] = (),
+        phase_col: Optional[str] = "cell_cycle",
+        k: int = 512,
+        random_state: Optional[int] = 0,
+    ) -> None:
+        self.condition_col = condition_col
+        self.time_col = time_col
+        self.features = list(features)
+        self.phase_col = phase_col
+        self.k = k
+        self.random_state = random_state
+        self.keys = ["plate_id", "cell_line", condition_col, time_col]
+        self._well_counts: Optional[pd.Series] = None
+        self._phase_counts: Optional[pd.Series] = None
+        self._sketches: dict[str, dict[Hashable, QuantileSketch]] = {
+            feature: {} for feature in self.features
+        }
+
+    @staticmethod
+    def _add(total: Optional[pd.Series], counts: pd.Series) -> pd.Series:
+        return counts if total is None else total.add(counts, fill_value=0)
+
+    @profiled
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Add the cells of chunk, which may hold any mix of timepoints."""
+        well_counts = chunk.groupby([*self.keys, "well"]).size()
+        self._well_counts = self._add(self._well_counts, well_counts)
+        if self.phase_col:
+            phase_counts = chunk.groupby([*self.keys, self.phase_col]).size()
+            self._phase_counts = self._add(self._phase_counts, phase_counts)
+        for feature in self.features:
+            sketches = self._sketches[feature]
+            chunk_sketches = sketch_groups(
+                chunk, feature, self.keys, self.k, self.random_state
+            )
+            for key, sketch in chunk_sketches.items():
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = sketch
+
+    @profiled
+    def summary(self, norm_control: Optional[str] = None) -> pd.DataFrame:
+        """
+        Tabulate the aggregates, one row per plate, cell line, condition
+        and timepoint.
+
+        The table holds the number of cells, the mean cell count per well,
+        the count normalised to norm_control on the same plate and timepoint
+        if given, the percentage of cells in each phase and the (sketched)
+        median of each feature.
+        """
+        if self._well_counts is None:
+            raise ValueError("No data has been added")
+        wells = self._well_counts.groupby(level=self.keys)
+        summary = pd.DataFrame({"cells": wells.sum(), "count": wells.mean()})
+        if norm_control is not None:
+            counts = summary["count"]
+            conditions = counts.index.get_level_values(self.condition_col)
+            if norm_control not in conditions:
+                raise ValueError(
+                    f"Control {norm_control} not in {self.condition_col}"
+                )
+            control = counts.xs(norm_control, level=self.condition_col)
+            # plates or timepoints without the control are left as NaN
+            summary["normalized_count"] = (
+                counts
+                / control.reindex(
+                    counts.index.droplevel(self.condition_col)
+                ).to_numpy()
+            )
+        if self._phase_counts is not None:
+            percent = (
+                self._phase_counts
+                / self._phase_counts.groupby(level=self.keys).transform("sum")
+                * 100
+            )
+            phases = percent.unstack(self.phase_col, fill_value=0)
+            summary = summary.join(phases)
+        for feature, sketches in self._sketches.items():
+            medians = pd.Series(
+                {key: sketch.median() for key, sketch in sketches.items()},
+                name=f"{feature}_median",
+            )
+            medians.index.names = self.keys
+            summary = summary.join(medians)
+        return summary.reset_index()
+
+
+def timepoint_summary(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    condition_col: str = "condition",
+    time_col: str = "timepoint",
+    features: Sequence[str] = (),
+    norm_control: Optional[str] = None,
+) -> pd.DataFrame:
+    """Summarise a DataFrame or chunks of one per timepoint."""
+    aggregator = TimelapseAggregator(condition_col, time_col, features)
+    for chunk in [df] if isinstance(df, pd.DataFrame) else df:
+        aggregator.update(chunk)
+    return aggregator.summary(norm_control)
+
+
+@profiled
+def kinetics_plot(
+    summary: pd.DataFrame,
+    y_col: str,
+    conditions: list[str],
+    condition_col: str = "condition",
+    time_col: str = "timepoint",
+    selector_col: Optional[str] = "cell_line",
+    selector_val: Optional[str] = None,
+    title: Optional[str] = None,
+    colors: list[str] = COLORS,
+    save: bool = True,
+    path: Optional[Path] = None,
+) -> None:
+    """Plot a timepoint summary column over time, one line per condition"""
+    data = summary[summary[condition_col].isin(conditions)]
+    if selector_col and selector_val:
+        data = data[data[selector_col] == selector_val]
+    elif selector_col:
+        raise ValueError(f"selector_val for {selector_col} must be provided")
+    fig, ax = plt.subplots(figsize=(height * 1.5, height))
+    with profile_stage("draw"):
+        sns.lineplot(
+            data=data,
+            x=time_col,
+            y=y_col,
+            hue=condition_col,
+            hue_order=conditions,
+            palette=colors[: len(conditions)],
+            errorbar="sd",
+            marker="o",
+            markersize=3,
+            ax=ax,
+        )
+    ax.set_xlabel(time_col)
+    ax.set_ylabel(y_col)
+    ax.legend(fontsize=6, bbox_to_anchor=(1.05, 1), loc="upper left")
+    if not title:
+        title = f"{y_col} kinetics {selector_val}"
+    fig.suptitle(title, fontsize=7, weight="bold", x=0, y=1.05, ha="left")
+    file_name = title.replace(" ", "_")
+    if save and path:
+        save_fig(
+            fig,
+            path,
+            file_name,
+            tight_layout=False,
+            fig_extension="pdf",
+        )
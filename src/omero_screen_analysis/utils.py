@@ -1,12 +1,20 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
 
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.preview import preview_dpi, preview_path
+from omero_screen_analysis.profiling import profile_stage, profiled
+from omero_screen_analysis.writer import active_writer
+
 current_dir = Path(__file__).parent
 style_path = (current_dir / "../../hhlab_style01.mplstyle").resolve()
 plt.style.use(style_path)
@@ -14,6 +22,7 @@ prop_cycle = plt.rcParams["axes.prop_cycle"]
 COLORS = prop_cycle.by_key()["color"]
 
 
+@profiled
 def save_fig(
     fig: Figure,
     path: Path,
@@ -21,7 +30,8 @@ def save_fig(
     tight_layout: bool = True,
     fig_extension: str = "pdf",
     resolution: int = 300,
-) -> None:
+    close: bool = False,
+) -> Path:
     """
     Save a matplotlib figure to a file.
 
@@ -39,30 +49,69 @@ def save_fig(
         The file extension for the saved figure (default is 'pdf').
     resolution : int, optional
         The resolution of the saved figure in dpi (default is 300).
+    close : bool, optional
+        Whether to close the figure after saving it (default is False).
+        Long batch runs should close figures to release their memory.
+        Inside a FigureWriter block the figure is rendered to memory and
+        written in the background; the writer decides whether to close it.
+        In preview mode the figure is saved to path/preview instead.
 
     Returns
     -------
-    None
-        Saves the figure in the specified format.
+    Path
+        The path of the saved file.
     """
 
-    dest = path / f"{fig_id}.{fig_extension}"
+    dest = preview_path(path) / f"{fig_id}.{fig_extension}"
     print("Saving figure", fig_id)
     if tight_layout:
-        fig.tight_layout()
-    plt.savefig(
-        dest,
-        format=fig_extension,
-        dpi=resolution,
-        facecolor="white",
-        edgecolor="white",
-    )
+        with profile_stage("tight_layout"):
+            fig.tight_layout()
+    resolution = preview_dpi(resolution)
+    writer = active_writer()
+    if writer is not None:
+        # rendered now, written to disk in the background
+        with profile_stage("render"):
+            writer.submit(fig, dest, fig_extension, resolution)
+        return dest
+    with profile_stage("savefig"):
+        fig.savefig(
+            dest,
+            format=fig_extension,
+            dpi=resolution,
+            facecolor="white",
+            edgecolor="white",
+        )
+    if close:
+        plt.close(fig)
+    return dest
 
 
+@profiled
 def selector_val_filter(
-    df: pd.DataFrame, selector_col: Optional[str], selector_val: Optional[str], condition_col: Optional[str], conditions: Optional[list[str]]
+    df: pd.DataFrame, selector_col: Optional[str], selector_val: Optional[str], condition_col: Optional[str], conditions: Optional[list[str]], index: Optional[GroupIndex] = None
 ) -> Optional[pd.DataFrame]:
-    """Check if selector_val is provided for selector_col and filter df"""
+    """Check if selector_val is provided for selector_col and filter df
+
+    If an index of df by condition_col and selector_col is given, the rows
+    are gathered from it instead of comparing every row. It must have been
+    built for df as it is; an index of a frame that was filtered since
+    would select the wrong rows.
+    """
+    if index is not None:
+        if index.n_rows != len(df):
+            raise ValueError(
+                f"The index was built for {index.n_rows} rows but df has "
+                f"{len(df)}; rebuild it for this DataFrame"
+            )
+        selection: dict[str, str | list[str]] = {}
+        if condition_col and conditions:
+            selection[condition_col] = conditions
+        if selector_col and selector_val:
+            selection[selector_col] = selector_val
+        elif selector_col:
+            raise ValueError(f"selector_val for {selector_col} must be provided")
+        return index.select(df, **selection).copy()
     if condition_col and conditions:
         df = df[df[condition_col].isin(conditions)].copy()
     if selector_col and selector_val:
@@ -104,17 +153,129 @@ def show_repeat_points(
     )
 
 
+@profiled
 def select_datapoints(
     df: pd.DataFrame, conditions: list[str], condition_col: str, n: int = 30
 ) -> pd.DataFrame:
     """Select 30 random datapoints per category and plate-id"""
-    df_sampled = pd.DataFrame()
-    for condition in conditions:
-        for plate_id in df.plate_id.unique():
-            df_sub = df[
-                (df[condition_col] == condition) & (df.plate_id == plate_id)
-            ]
-            if len(df_sub) > n:
-                df_sub = df_sub.sample(n=n, random_state=1)
-                df_sampled = pd.concat([df_sampled, df_sub])
-    return df_sampled
+    index = GroupIndex.from_frame(df, [condition_col, "plate_id"])
+    samples = []
+    for group_id in index.group_ids(**{condition_col: conditions}):
+        df_sub = df.iloc[index.group_positions(group_id)]
+        if len(df_sub) > n:
+            df_sub = df_sub.sample(n=n, random_state=1)
+        samples.append(df_sub)
+    return pd.concat(samples) if samples else pd.DataFrame()
+
+
+@dataclass
+class StackedProportions:
+    """Mean and standard deviation of proportions per condition and category."""
+
+    conditions: list[Any]
+    categories: list[Any]
+    mean: np.ndarray  # conditions x categories
+    std: np.ndarray
+    replicates: np.ndarray
+
+    def frames(
+        self, condition_name: str, category_name: str
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """The mean and std as DataFrames indexed by ordered categoricals."""
+        index = pd.CategoricalIndex(
+            self.conditions, self.conditions, ordered=True, name=condition_name
+        )
+        columns = pd.CategoricalIndex(
+            self.categories, self.categories, ordered=True, name=category_name
+        )
+        return (
+            pd.DataFrame(self.mean, index=index, columns=columns),
+            pd.DataFrame(self.std, index=index, columns=columns),
+        )
+
+
+@profiled
+def stacked_proportions(
+    df: pd.DataFrame,
+    condition_col: str,
+    category_col: str,
+    value_col: str,
+    conditions: Sequence[Any],
+    categories: Sequence[Any],
+) -> StackedProportions:
+    """
+    Mean and standard deviation of value_col over the replicate rows of each
+    condition and category, e.g. the per-plate percentages of each cell
+    cycle phase.
+
+    Both are computed with bincounts on a dense conditions x categories
+    grid; combinations without rows are NaN, as is the std of a single
+    replicate. Rows of other conditions or categories are ignored.
+    """
+    conditions, categories = list(conditions), list(categories)
+    n_cat = len(categories)
+    shape = (len(conditions), n_cat)
+    cond = pd.Index(conditions).get_indexer(df[condition_col])
+    cat = pd.Index(categories).get_indexer(df[category_col])
+    values = df[value_col].to_numpy(dtype=float)
+    valid = (cond >= 0) & (cat >= 0) & ~np.isnan(values)
+    cell = cond[valid] * n_cat + cat[valid]
+    values = values[valid]
+    size = shape[0] * n_cat
+    n = np.bincount(cell, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(cell, weights=values, minlength=size) / n
+        squares = np.bincount(
+            cell, weights=(values - mean[cell]) ** 2, minlength=size
+        )
+        std = np.sqrt(squares / (n - 1))
+    std[n < 2] = np.nan
+    return StackedProportions(
+        conditions,
+        categories,
+        mean.reshape(shape),
+        std.reshape(shape),
+        n.reshape(shape),
+    )
+
+
+@profiled
+def stacked_bars(
+    ax: Axes,
+    mean: np.ndarray,
+    std: Optional[np.ndarray],
+    categories: Sequence[str],
+    colors: Optional[Sequence[str]] = None,
+    width: float = 0.75,
+) -> list[Any]:
+    """
+    Draw a conditions x categories array as stacked bars, one ax.bar call
+    per category, with each error bar at the top of its segment.
+
+    Missing values stack as 0 and have no error bar. Ticks are placed at
+    0 .. n-1; set their labels afterwards. Returns the bar containers.
+    """
+    mean = np.nan_to_num(np.asarray(mean, dtype=float))
+    x = np.arange(mean.shape[0])
+    bottom = np.zeros(mean.shape[0])
+    colors = colors or COLORS
+    containers = []
+    for k, category in enumerate(categories):
+        yerr = None
+        if std is not None:
+            yerr = np.nan_to_num(np.asarray(std, dtype=float)[:, k])
+        containers.append(
+            ax.bar(
+                x,
+                mean[:, k],
+                width,
+                bottom=bottom,
+                yerr=yerr,
+                label=category,
+                color=colors[k % len(colors)],
+            )
+        )
+        bottom = bottom + mean[:, k]
+    ax.set_xticks(x)
+    ax.set_xlim(-0.5, len(x) - 0.5)
+    return containers
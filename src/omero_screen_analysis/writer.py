@@ -0,0 +1,196 @@
+"""
+Asynchronous figure export.
+
+Inside a ``FigureWriter`` block, ``save_fig`` renders each figure into an
+in-memory buffer and hands the bytes to a background thread pool that writes
+them to disk, so file system latency overlaps with the aggregation and
+drawing of the next figure. The encoding itself, and the page of the bundle
+PDF, still run on the calling thread: matplotlib does not support drawing
+figures from several threads::
+
+    with FigureWriter(bundle=out / "report.pdf") as writer:
+        for cell_line in cell_lines:
+            count_plot(df, "NT", conditions, selector_val=cell_line, path=out)
+    print(writer.results)
+
+At most max_pending figures are held in memory; further calls to save_fig
+block until a write has finished.
+"""
+
+import io
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+_active: ContextVar[Optional["FigureWriter"]] = ContextVar(
+    "figure_writer", default=None
+)
+
+
+def active_writer() -> Optional["FigureWriter"]:
+    """The FigureWriter of the enclosing with block, if any."""
+    return _active.get()
+
+
+@dataclass
+class ExportResult:
+    """Outcome of writing one file."""
+
+    dest: Path
+    nbytes: int
+    render_seconds: float
+    write_seconds: float
+    error: Optional[str] = None
+
+
+class ExportError(RuntimeError):
+    """Raised when some figures could not be written."""
+
+    def __init__(self, failed: list[ExportResult]) -> None:
+        self.failed = failed
+        names = ", ".join(r.dest.name for r in failed)
+        super().__init__(f"{len(failed)} figure(s) failed to export: {names}")
+
+
+def _write(dest: Path, data: bytes) -> float:
+    start = time.perf_counter()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    dest.write_bytes(data)
+    return time.perf_counter() - start
+
+
+class FigureWriter:
+    """
+    Background writer for rendered figures.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of writer threads (default is 2).
+    max_pending : int, optional
+        Maximum number of rendered figures waiting to be written before
+        submit blocks (default is 8).
+    bundle : Path, optional
+        Also collect every figure as a page of this multi-page PDF, once
+        however many formats it is saved in.
+    close_figures : bool, optional
+        Close each figure once it is rendered (default is True).
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 8,
+        bundle: Optional[Path] = None,
+        close_figures: bool = True,
+    ) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="figure-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: list[tuple[Path, int, float, Future[float]]] = []
+        self.close_figures = close_figures
+        self.bundle = bundle
+        self._bundle_buffer = io.BytesIO() if bundle else None
+        self._pdf = PdfPages(self._bundle_buffer) if bundle else None
+        self._bundled: weakref.WeakSet[Figure] = weakref.WeakSet()
+        self._token: Optional[Token[Optional[FigureWriter]]] = None
+        self._closed = False
+
+    def submit(
+        self,
+        fig: Figure,
+        dest: Path,
+        fig_extension: str = "pdf",
+        resolution: int = 300,
+    ) -> Future[float]:
+        """
+        Render fig on this thread and queue the bytes to be written to dest
+        in the background.
+        """
+        if self._closed:
+            raise RuntimeError("FigureWriter is closed")
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        fig.savefig(
+            buffer,
+            format=fig_extension,
+            dpi=resolution,
+            facecolor="white",
+            edgecolor="white",
+        )
+        if self._pdf is not None and fig not in self._bundled:
+            self._pdf.savefig(fig, facecolor="white", edgecolor="white")
+            self._bundled.add(fig)
+        if self.close_figures:
+            plt.close(fig)
+        data = buffer.getvalue()
+        render_seconds = time.perf_counter() - start
+
+        self._slots.acquire()
+        future = self._executor.submit(_write, Path(dest), data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._jobs.append((Path(dest), len(data), render_seconds, future))
+        return future
+
+    @property
+    def results(self) -> list[ExportResult]:
+        """Results of the writes that have finished, in submission order."""
+        results = []
+        for dest, nbytes, render_seconds, future in self._jobs:
+            if not future.done():
+                continue
+            error = future.exception()
+            results.append(
+                ExportResult(
+                    dest=dest,
+                    nbytes=nbytes,
+                    render_seconds=render_seconds,
+                    write_seconds=0.0 if error else future.result(),
+                    error=f"{type(error).__name__}: {error}" if error else None,
+                )
+            )
+        return results
+
+    def close(self, raise_errors: bool = True) -> list[ExportResult]:
+        """Wait for all writes, write the bundle and report the results."""
+        if not self._closed:
+            self._closed = True
+            if self._pdf is not None and self.bundle is not None:
+                assert self._bundle_buffer is not None
+                self._pdf.close()
+                data = self._bundle_buffer.getvalue()
+                self._jobs.append(
+                    (
+                        self.bundle,
+                        len(data),
+                        0.0,
+                        self._executor.submit(_write, self.bundle, data),
+                    )
+                )
+            self._executor.shutdown(wait=True)
+        results = self.results
+        failed = [r for r in results if r.error]
+        if failed and raise_errors:
+            raise ExportError(failed)
+        return results
+
+    def __enter__(self) -> "FigureWriter":
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, exc_type: object, *exc: object) -> None:
+        if self._token is not None:
+            _active.reset(self._token)
+            self._token = None
+        # don't mask an exception raised inside the block
+        self.close(raise_errors=exc_type is None)
@@ -31,3 +31,25 @@ def signficance_data(cell_cycle_data):
     # TODO Return a df with the two dfs concatenated
     
     return cell_cycle_data
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--perf",
+        action="store_true",
+        help="run the performance budget tests in tests/perf",
+    )
+    parser.addoption(
+        "--update-baselines",
+        action="store_true",
+        help="record the measured performance as the new baselines",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--perf"):
+        return
+    skip = pytest.mark.skip(reason="performance budgets run with --perf")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import pytest
+
+from omero_screen_analysis.benchmark import (
+    BENCHMARKS,
+    check_budget,
+    load_baselines,
+    run_benchmark,
+    save_baselines,
+)
+
+BASELINES = Path(__file__).parent / "baselines.json"
+
+pytestmark = pytest.mark.perf
+
+
+@pytest.mark.parametrize("name", sorted(BENCHMARKS))
+def test_performance_budget(name, request):
+    result = run_benchmark(name)
+    if request.config.getoption("--update-baselines"):
+        save_baselines([result], BASELINES)
+        return
+    baselines = load_baselines(BASELINES)
+    if name not in baselines:
+        pytest.fail(f"No baseline for {name}, run with --update-baselines")
+    exceeded = check_budget(result, baselines)
+    assert not exceeded, "; ".join(exceeded)
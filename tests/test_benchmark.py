@@ -0,0 +1,56 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.benchmark import (
+    BenchmarkResult,
+    _peak_rss,
+    _reset_peak_rss,
+    check_budget,
+    load_baselines,
+    save_baselines,
+    synthetic_screen,
+)
+
+BASELINES = {
+    "count_plot": {"seconds": 1.0, "peak_increase_mb": 20.0, "calibration": 0.1}
+}
+
+
+def test_synthetic_screen_is_reproducible():
+    df = synthetic_screen(n_cells=1000)
+    pd.testing.assert_frame_equal(df, synthetic_screen(n_cells=1000))
+    assert df.groupby(["plate_id", "condition"]).well.nunique().eq(2).all()
+
+
+def test_check_budget_scales_with_machine_speed():
+    slow_machine = BenchmarkResult("count_plot", 2.5, 25.0, 0.2)
+    assert check_budget(slow_machine, BASELINES) == []
+    regression = BenchmarkResult("count_plot", 2.5, 25.0, 0.1)
+    (exceeded,) = check_budget(regression, BASELINES)
+    assert exceeded.startswith("count_plot took 2.50 s, budget 1.50 s")
+    memory = BenchmarkResult("count_plot", 1.0, 40.0, 0.1)
+    (exceeded,) = check_budget(memory, BASELINES)
+    assert "peaked 40 MB above its baseline memory, budget 30 MB" in exceeded
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="peak reset is Linux only")
+def test_peak_rss_is_measured_from_reset():
+    _reset_peak_rss()
+    before = _peak_rss()
+    block = np.ones(50 * 2**20 // 8)
+    del block
+    assert _peak_rss() - before > 40 * 2**20
+    _reset_peak_rss()
+    assert _peak_rss() - before < 40 * 2**20
+
+
+def test_save_baselines(tmp_path):
+    path = tmp_path / "baselines.json"
+    assert load_baselines(path) == {}
+    save_baselines([BenchmarkResult("count_plot", 1.0, 20.0, 0.1)], path)
+    save_baselines([BenchmarkResult("comb_plot", 3.0, 30.0, 0.1)], path)
+    assert load_baselines(path)["count_plot"] == BASELINES["count_plot"]
+    assert set(load_baselines(path)) == {"count_plot", "comb_plot"}
@@ -1,6 +1,14 @@
 import matplotlib.pyplot as plt
+import numpy as np
+import pytest
 
-from omero_screen_analysis.cellcycleplot import cc_phase, cellcycle_plot
+from omero_screen_analysis.cellcycleplot import (
+    cc_phase,
+    cellcycle_plot,
+    prop_pivot,
+    stacked_barplot,
+)
+from omero_screen_analysis.utils import stacked_bars
 
 
 def test_cc_phase(filtered_data):
@@ -20,3 +28,35 @@ def test_cellcycle_plots(filtered_data):
         save=False,
     )
     plt.close("all")
+
+
+def test_prop_pivot_matches_groupby(filtered_data):
+    df_mean, df_std = prop_pivot(filtered_data, "condition", ["SCR", "NT"])
+    expected = cc_phase(filtered_data).groupby(["condition", "cell_cycle"])[
+        "percent"
+    ].agg(["mean", "std"])
+    assert list(df_mean.index) == ["SCR", "NT"]
+    assert list(df_mean.columns) == ["Sub-G1", "G1", "S", "G2/M", "Polyploid"]
+    long = df_mean.stack(future_stack=True)
+    for (condition, phase), row in expected.iterrows():
+        assert long[(condition, phase)] == pytest.approx(row["mean"])
+
+
+def test_stacked_bars_cumulative():
+    mean = np.array([[20.0, 80.0], [np.nan, 50.0]])
+    std = np.array([[1.0, 2.0], [np.nan, np.nan]])
+    fig, ax = plt.subplots()
+    bars = stacked_bars(ax, mean, std, ["a", "b"])
+    assert [p.get_y() for p in bars[1].patches] == [20.0, 0.0]
+    assert [p.get_height() for p in bars[1].patches] == [80.0, 50.0]
+    plt.close(fig)
+
+
+def test_stacked_barplot_many_conditions(filtered_data):
+    df = filtered_data.copy()
+    df["condition"] = df["well"].astype(str) + "_" + df["condition"]
+    conditions = sorted(df["condition"].unique())
+    stacked_barplot(df, conditions, selector_val="RPE-1_WT", save=False)
+    ax = plt.gca()
+    assert len(ax.get_xticklabels()) == len(conditions)
+    plt.close("all")
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.classification_plot import (
+    class_count_matrix,
+    classification_summary,
+    plot_classification,
+    quantify_classification,
+)
+
+
+@pytest.fixture
+def class_data():
+    return pd.read_csv(Path(__file__).parent / "test_data.csv")
+
+
+def test_class_count_matrix(class_data):
+    matrix = class_count_matrix(class_data, "condition")
+    assert list(matrix.classes) == ["collapsed", "micro", "normal"]
+    assert matrix.counts.shape == (class_data.well_id.nunique(), 3)
+    assert matrix.counts.sum() == len(class_data)
+    np.testing.assert_allclose(matrix.percentages.sum(axis=1), 100)
+
+
+def test_classification_summary_matches_groupby(class_data):
+    summary = classification_summary(class_data, "condition")
+    keys = ["plate_id", "cell_line", "condition", "Class"]
+    well_pct = (
+        class_data.groupby(["well_id", *keys]).size()
+        / class_data.groupby("well_id").size()
+        * 100
+    ).rename("percentage")
+    expected = well_pct.groupby(keys).agg(["mean", "std"])
+    result = summary.set_index(keys).loc[expected.index]
+    # every well here holds cells of each class it contributes to
+    present = result.wells == well_pct.groupby(keys).size()
+    np.testing.assert_allclose(
+        result.percentage[present], expected["mean"][present]
+    )
+    assert (summary.groupby(keys[:3]).weighted_percentage.sum() == 100).all()
+
+
+def test_quantify_classification_single_plate(class_data):
+    one_plate = class_data[class_data.plate_id == 1938]
+    mean, std = quantify_classification(one_plate, "condition")
+    assert (std.percentage == 0).all()
+    assert list(mean.columns) == [
+        "plate_id",
+        "cell_line",
+        "condition",
+        "Class",
+        "percentage",
+    ]
+
+
+def test_plot_classification(class_data):
+    plot_classification(
+        class_data,
+        classes=["normal", "micro", "collapsed"],
+        conditions=["ctr", "palb"],
+        selector_val="RPE1wt",
+        save=False,
+    )
+    plt.close("all")
@@ -0,0 +1,90 @@
+import pickle
+from pathlib import Path
+
+from omero_screen_analysis.cli import ReportConfig, build_specs, main
+from omero_screen_analysis.shared import SharedFrame
+
+CONFIG = """
+conditions = ["NT", "SCR"]
+cell_lines = ["RPE-1_WT"]
+formats = ["png"]
+
+[count]
+norm_control = "NT"
+
+[cellcycle]
+
+[feature]
+features = ["intensity_mean_p21_nucleus"]
+
+[export]
+format = "csv"
+
+[qc]
+gates = { area_nucleus = [50, 5000] }
+min_cells = 10
+"""
+
+
+def test_report_config(tmp_path):
+    config_path = tmp_path / "report.toml"
+    config_path.write_text(CONFIG)
+    config = ReportConfig.from_file(config_path)
+    assert config.cell_lines == ["RPE-1_WT"]
+    assert set(config.figures) == {"count", "cellcycle", "feature"}
+
+
+def test_build_specs_send_shared_data(filtered_data, tmp_path):
+    config_path = tmp_path / "report.toml"
+    config_path.write_text(CONFIG)
+    config = ReportConfig.from_file(config_path)
+    with SharedFrame(filtered_data) as shared:
+        specs = list(build_specs({"RPE-1_WT": shared}, config, tmp_path))
+        assert len(specs) == 3
+        for spec in specs:
+            assert spec.kwargs["df"] is shared
+            assert len(pickle.dumps(spec)) < 20_000
+
+
+def test_cli_report_resumes(tmp_path, capsys):
+    config_path = tmp_path / "report.toml"
+    config_path.write_text(CONFIG)
+    data = Path(__file__).parent / "example_data.csv"
+    output = tmp_path / "figures"
+    args = [str(data), "-c", str(config_path), "-o", str(output), "-j", "2"]
+
+    assert main(args) == 0
+    assert {p.name for p in output.glob("*.png")} == {
+        "RPE-1_WT_counts.png",
+        "RPE-1_WT_cellcycle.png",
+        "RPE-1_WT_intensity_mean_p21_nucleus.png",
+    }
+    assert (output / "summary" / "counts.csv").exists()
+    assert (output / "summary" / "cell_cycle.csv").exists()
+    assert (output / "summary" / "qc_wells.csv").exists()
+    assert (
+        output / "export" / "counts" / "screen=example_data" / "provenance.json"
+    ).exists()
+
+    (output / "RPE-1_WT_counts.png").unlink()
+    capsys.readouterr()
+    assert main(args) == 0
+    out = capsys.readouterr().out
+    assert out.count("Skipping") == 2
+    assert "Rendered RPE-1_WT_counts" in out
+
+
+def test_cli_report_rerenders_after_qc_change(tmp_path, capsys):
+    config_path = tmp_path / "report.toml"
+    config_path.write_text(CONFIG)
+    data = Path(__file__).parent / "example_data.csv"
+    output = tmp_path / "figures"
+    args = [str(data), "-c", str(config_path), "-o", str(output)]
+    assert main(args) == 0
+
+    config_path.write_text(CONFIG.replace("[50, 5000]", "[100, 5000]"))
+    capsys.readouterr()
+    assert main(args) == 0
+    out = capsys.readouterr().out
+    assert "Skipping" not in out
+    assert out.count("Rendered") == 3
@@ -21,3 +21,21 @@ def test_combplot_with_real_data(filtered_data, tmp_path):
         path=None,
     )
     plt.close("all")
+
+
+def test_comb_plot_without_cells(filtered_data):
+    # a condition without cells, and no rows at all, give empty panels
+    for data, conditions in [
+        (filtered_data, ["NT", "SCR", "missing"]),
+        (iter([]), ["NT"]),
+    ]:
+        comb_plot(
+            data,
+            conditions,
+            "area_nucleus",
+            8000,
+            selector_val="RPE-1_WT",
+            save=False,
+        )
+        assert len(plt.gcf().axes) == 3 * len(conditions)
+        plt.close("all")
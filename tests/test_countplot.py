@@ -1,13 +1,93 @@
 import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
 
 from omero_screen_analysis.countplot import count_plot, norm_count
 
 
+def plates_without_control():
+    """Plate 1 has NT and SCR wells, plate 2 only SCR."""
+    wells = [
+        (1, "NT", "A1", 100),
+        (1, "NT", "A2", 120),
+        (1, "SCR", "A3", 55),
+        (2, "SCR", "B1", 80),
+        (2, "SCR", "B2", 60),
+    ]
+    return pd.DataFrame(
+        [
+            (plate, condition, well, "exp")
+            for plate, condition, well, n in wells
+            for _ in range(n)
+        ],
+        columns=["plate_id", "condition", "well", "experiment"],
+    )
+
+
 def test_norm_count(filtered_data):
     df = norm_count(filtered_data, norm_control="NT")
     assert df["normalized_count"].sum() == 2.0
 
 
+def test_norm_count_missing_control():
+    df = plates_without_control()
+    with pytest.warns(UserWarning, match="Plates without NT"):
+        counts = norm_count(df, "NT")
+    assert counts.plate_id.tolist() == [1, 2, 1, 2]
+    assert counts["count"].tolist()[2:] == [55, 70]
+    assert counts.normalized_count.tolist()[2] == pytest.approx(0.5)
+    missing = counts.normalized_count.isna()
+    assert missing.tolist() == [False, True, False, True]
+
+    with pytest.raises(ValueError, match="Plates without NT: 2"):
+        norm_count(df, "NT", missing_control="raise")
+    dropped = norm_count(df, "NT", missing_control="drop")
+    assert dropped.plate_id.tolist() == [1, 1]
+    pooled = norm_count(df, "NT", mode="percent", missing_control="pooled")
+    percent = pooled.normalized_count.tolist()[2:]
+    assert percent == pytest.approx([50, 70 / 1.1])
+
+
+def test_norm_count_zscore():
+    counts = norm_count(
+        plates_without_control(), "NT", mode="zscore", control_scope="pooled"
+    )
+    # control wells of 100 and 120 cells: mean 110, sd sqrt(200)
+    scr = counts[counts.condition == "SCR"].normalized_count
+    expected = [(55 - 110) / 200**0.5, (70 - 110) / 200**0.5]
+    assert scr.tolist() == pytest.approx(expected)
+
+
+def test_norm_count_pooled_over_control_wells():
+    df = pd.concat(
+        [
+            plates_without_control(),
+            pd.DataFrame(
+                {
+                    "plate_id": 2,
+                    "condition": "NT",
+                    "well": "B3",
+                    "experiment": "exp",
+                },
+                index=range(40),
+            ),
+        ],
+        ignore_index=True,
+    )
+    pooled = norm_count(df, "NT", control_scope="pooled")
+    scr = pooled[pooled.condition == "SCR"].normalized_count
+    # three control wells of 100, 120 and 40 cells
+    assert scr.tolist() == pytest.approx([55 / (260 / 3), 70 / (260 / 3)])
+
+    with pytest.warns(UserWarning, match="fewer than two wells or no spread on plates 2"):
+        zscores = norm_count(df, "NT", mode="zscore")
+    scr = zscores[zscores.condition == "SCR"].normalized_count
+    assert scr.tolist()[0] == pytest.approx((55 - 110) / 200**0.5)
+    assert pd.isna(scr.tolist()[1])
+    with pytest.raises(ValueError, match="fewer than two wells"):
+        norm_count(df, "NT", mode="zscore", missing_control="raise")
+
+
 def test_count_fig(filtered_data):
     count_plot(
         filtered_data,
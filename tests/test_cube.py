@@ -0,0 +1,56 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from omero_screen_analysis.cube import ScreenCube, build_cube, plot_hits
+
+
+@pytest.fixture
+def cube(cell_cycle_data):
+    return build_cube(cell_cycle_data, features=["area_nucleus"], norm_control="NT")
+
+
+def test_build_cube_matches_groupby(cell_cycle_data, cube):
+    keys = ["condition", "cell_line"]
+    grouped = cell_cycle_data.groupby(keys)
+    table = cube.frame()
+    np.testing.assert_array_equal(
+        table.loc[grouped.size().index, "cells"], grouped.size()
+    )
+    np.testing.assert_allclose(
+        table.loc[grouped.size().index, "median_area_nucleus"],
+        grouped.area_nucleus.median(),
+    )
+    phases = [m for m in cube.metrics if m.startswith("phase_")]
+    assert phases[:2] == ["phase_Sub-G1", "phase_G1"]
+    np.testing.assert_allclose(table[phases].sum(axis=1), 100)
+    assert (cube.metric("relative_count").loc["NT"] == 1).all()
+
+
+def test_cube_selection_and_ranking(cube):
+    sub = cube.sel(["SCR", "NT"], "RPE-1_WT", ["phase_S", "cells"])
+    assert sub.shape == (2, 1, 2)
+    assert sub.values[0, 0, 1] == cube.metric("cells").loc["SCR", "RPE-1_WT"]
+    ranked = cube.rank("phase_S", "RPE-1_WT")
+    assert cube.top_k("phase_S", 2, "RPE-1_WT") == ranked.index[:2].tolist()
+    assert cube.top_k("phase_S", 10, "RPE-1_WT", ascending=True, exclude=["NT"])[
+        0
+    ] == ranked.index[-1]
+    with pytest.raises(KeyError):
+        cube.sel(conditions=["unknown"])
+
+
+def test_cube_robust_z_and_save(cube, tmp_path):
+    scored = cube.add_robust_z(["phase_S"], control="NT")
+    assert (scored.metric("phase_S_z").loc["NT"] == 0).all()
+    scored.save(tmp_path / "cube.npz")
+    loaded = ScreenCube.load(tmp_path / "cube.npz")
+    np.testing.assert_array_equal(loaded.values, scored.values)
+    assert loaded.conditions.equals(scored.conditions)
+    assert loaded.conditions.name == "condition"
+
+
+def test_plot_hits(cube, tmp_path):
+    plot_hits(cube, "phase_G2/M", "RPE-1_WT", k=2, controls=["NT"], path=tmp_path)
+    assert (tmp_path / "hits_phase_G2_M_RPE-1_WT.pdf").exists()
+    plt.close("all")
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.embedding import (
+    PhenotypeEmbedding,
+    cluster_profile,
+    plot_density_maps,
+)
+from omero_screen_analysis.featurestore import FeatureStore
+
+
+def phenotypes(n=6000, p=12, seed=0):
+    """Three phenotypes in p correlated features, one per condition."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 3, n)
+    centres = rng.normal(0, 4, (3, p))
+    values = centres[labels] + rng.normal(0, 1, (n, p))
+    df = pd.DataFrame(values * 100 + 1000, columns=[f"f{i}" for i in range(p)])
+    df["condition"] = np.array(["NT", "A", "B"])[labels]
+    df["plate_id"] = 1
+    df["cell_line"] = "RPE-1_WT"
+    return df
+
+
+def test_chunked_pca_matches_full_pca():
+    df = phenotypes()
+    features = [f"f{i}" for i in range(12)]
+    embedding = PhenotypeEmbedding(
+        features, n_components=3, n_clusters=0, chunksize=700
+    ).fit(df)
+    standardised = (df[features] - df[features].mean()) / df[features].std()
+    _, s, vt = np.linalg.svd(standardised.to_numpy(), full_matrices=False)
+    for component, expected in zip(embedding.components_, vt[:3]):
+        assert abs(component @ expected) == pytest.approx(1, abs=1e-6)
+    ratio = s[:3] ** 2 / (s**2).sum()
+    assert embedding.explained_variance_ratio_ == pytest.approx(ratio)
+
+
+def test_embedding_clusters_and_density(tmp_path):
+    df = phenotypes()
+    df.loc[5, "f3"] = np.nan
+    features = [f"f{i}" for i in range(12)]
+    store = FeatureStore.build(df, tmp_path / "cells.fs", float_dtype="float32")
+    embedding = PhenotypeEmbedding(
+        features, n_components=4, n_clusters=3, chunksize=1000, random_state=0
+    ).fit(store)
+    cells = embedding.embed(store)
+    assert cells.dtypes["PC1"] == np.float32
+    assert cells.loc[5, "cluster"] == -1
+
+    profile = cluster_profile(cells)
+    # every phenotype falls into a single cluster
+    assert (profile.max(axis=1) > 99).all()
+
+    plot_density_maps(cells, ["NT", "A", "B"], control="NT", path=tmp_path)
+    assert (tmp_path / "embedding_vs_NT.pdf").exists()
@@ -0,0 +1,57 @@
+import sys
+
+import pytest
+
+from omero_screen_analysis.export import (
+    export_summaries,
+    read_provenance,
+    read_summary,
+)
+
+
+def test_export_summaries_csv(cell_cycle_data, tmp_path):
+    written = export_summaries(
+        cell_cycle_data,
+        tmp_path,
+        screen="screen 1",
+        conditions=["NT", "SCR"],
+        norm_control="NT",
+        input_hash="abc",
+        fmt="csv",
+    )
+    assert set(written) == {"counts", "cell_cycle", "cell_cycle_summary"}
+    counts = read_summary(tmp_path, "counts", cell_line="RPE-1_WT")
+    assert set(counts.cell_line) == {"RPE-1_WT"}
+    assert set(counts.screen) == {"screen 1"}
+    assert (counts[counts.condition == "NT"].normalized_count == 1).all()
+
+    summary = read_summary(tmp_path, "cell_cycle_summary")
+    totals = summary.groupby(["cell_line", "condition"]).percent_mean.sum()
+    assert totals.to_numpy() == pytest.approx(100)
+
+    (record,) = read_provenance(tmp_path, "counts")
+    assert record["input_hash"] == "abc"
+    assert record["parameters"]["norm_control"] == "NT"
+    assert record["rows"] == len(read_summary(tmp_path, "counts"))
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_export_summaries_columnar(filtered_data, tmp_path, fmt):
+    pytest.importorskip("pyarrow")
+    written = export_summaries(
+        filtered_data, tmp_path, "s1", ["NT", "SCR"], fmt=fmt
+    )
+    assert written["cell_cycle"][0].suffix == f".{fmt}"
+    cell_cycle = read_summary(tmp_path, "cell_cycle", screen="s1")
+    assert {"plate_id", "condition", "percent"} <= set(cell_cycle.columns)
+
+
+def test_export_falls_back_to_csv_without_pyarrow(
+    filtered_data, tmp_path, monkeypatch
+):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.warns(UserWarning, match="pyarrow"):
+        written = export_summaries(filtered_data, tmp_path, "s1", ["NT", "SCR"])
+    assert written["cell_cycle"][0].name == "part-0.csv.gz"
+    (record,) = read_provenance(tmp_path, "cell_cycle")
+    assert record["format"] == "csv"
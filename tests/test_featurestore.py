@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.combplot import comb_plot
+from omero_screen_analysis.featureplot import feature_plot
+from omero_screen_analysis.featurestore import FeatureStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    data = Path(__file__).parent / "example_data.csv"
+    return FeatureStore.build(data, tmp_path / "store", chunksize=1000)
+
+
+def test_store_selection_matches_dataframe(store, cell_cycle_data):
+    columns = ["plate_id", "condition", "intensity_mean_p21_nucleus"]
+    df = store.frame(columns, cell_line="RPE-1_WT", condition=["NT", "SCR"])
+    expected = cell_cycle_data[
+        (cell_cycle_data.cell_line == "RPE-1_WT")
+        & cell_cycle_data.condition.isin(["NT", "SCR"])
+    ]
+    assert (df.index == expected.index).all()
+    np.testing.assert_array_equal(df[columns], expected[columns])
+    s_phase = store.rows(cell_cycle="S", plate_id=1860)
+    assert len(s_phase) == (cell_cycle_data.cell_cycle == "S").sum()
+
+
+def test_store_reopens_and_chunks(store, cell_cycle_data):
+    reopened = FeatureStore(store.path)
+    assert reopened.n_rows == len(cell_cycle_data)
+    chunks = list(reopened.iter_chunks(["area_nucleus"], chunksize=1500))
+    assert [len(c) for c in chunks] == [1500, 1500, 1000]
+    assert "Unnamed: 0" not in reopened.columns
+
+
+def test_plots_read_from_store(store):
+    feature_plot(
+        store,
+        "intensity_mean_p21_nucleus",
+        ["NT", "SCR"],
+        selector_val="RPE-1_WT",
+        save=False,
+    )
+    comb_plot(
+        store,
+        ["NT", "SCR"],
+        "intensity_mean_p21_nucleus",
+        8000,
+        selector_val="RPE-1_WT",
+        cell_number=200,
+        save=False,
+    )
+    plt.close("all")
+
+
+def test_store_unknown_values_select_nothing(tmp_path):
+    df = pd.DataFrame(
+        {
+            "plate_id": [1, 1, 2],
+            "condition": ["NT", "SCR", "NT"],
+            "cell_line": "RPE-1_WT",
+            "cell_cycle": ["G1", None, "S"],
+            "area_nucleus": [1.0, 2.0, 3.0],
+        }
+    )
+    store = FeatureStore.build(df, tmp_path / "store")
+    assert len(store.rows(cell_cycle="G3")) == 0
+    assert len(store.rows(condition="siCTRL")) == 0
+    assert store.rows(cell_cycle=["G3", "S"]).tolist() == [2]
@@ -1,5 +1,7 @@
 import matplotlib.pyplot as plt
+import pandas as pd
 
+from omero_screen_analysis import featureplot
 from omero_screen_analysis.featureplot import feature_plot
 
 conditions = ["NT", "SCR"]
@@ -16,3 +18,23 @@ def test_feature_plot(filtered_data):
         )
     plt.close("all")
 
+
+
+def test_feature_plot_exact_plate_medians(filtered_data, monkeypatch):
+    feature = "intensity_mean_p21_nucleus"
+    shown = []
+    monkeypatch.setattr(
+        featureplot, "show_repeat_points", lambda df, *args: shown.append(df)
+    )
+    for _ in range(2):
+        feature_plot(
+            filtered_data, feature, conditions, selector_col=None, save=False
+        )
+    expected = (
+        filtered_data.groupby(["plate_id", "condition"])[feature]
+        .median()
+        .reset_index()
+    )
+    for df_median in shown:
+        pd.testing.assert_frame_equal(df_median, expected)
+    plt.close("all")
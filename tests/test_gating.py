@@ -0,0 +1,110 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.cellcycleplot import cc_phase
+from omero_screen_analysis.combplot import comb_plot
+from omero_screen_analysis.gating import (
+    COLUMNS,
+    GatingFile,
+    GatingWriter,
+    write_gating,
+)
+
+
+@pytest.mark.parametrize("compression", ["zstd", "zlib"])
+def test_gating_round_trip(cell_cycle_data, tmp_path, compression):
+    path = tmp_path / "screen.gating"
+    gating = write_gating(
+        cell_cycle_data, path, chunksize=1500, compression=compression
+    )
+    df = gating.frame()
+    columns = [c for c in COLUMNS if c in cell_cycle_data]
+    assert gating.columns == columns
+    assert len(gating) == len(cell_cycle_data)
+    expected = cell_cycle_data[columns]
+    for column in columns:
+        if df[column].dtype == np.float32:
+            np.testing.assert_allclose(
+                df[column], expected[column], rtol=1e-6, equal_nan=True
+            )
+        else:
+            pd.testing.assert_series_equal(
+                df[column], expected[column], check_dtype=False
+            )
+    assert df["cell_cycle"].dtype == expected["cell_cycle"].dtype
+
+
+def test_gating_float64_is_exact(cell_cycle_data, tmp_path):
+    gating = write_gating(
+        cell_cycle_data, tmp_path / "screen.gating", float_dtype="float64"
+    )
+    pd.testing.assert_series_equal(
+        gating.frame(["integrated_int_DAPI_norm"])["integrated_int_DAPI_norm"],
+        cell_cycle_data["integrated_int_DAPI_norm"],
+    )
+
+
+def test_gating_selection(cell_cycle_data, tmp_path):
+    gating = write_gating(cell_cycle_data, tmp_path / "screen.gating")
+    plate = gating.plates[0]
+    df = gating.frame(["condition"], plate_id=plate, condition=["NT", "SCR"])
+    expected = cell_cycle_data[
+        (cell_cycle_data.plate_id == plate)
+        & cell_cycle_data.condition.isin(["NT", "SCR"])
+    ]
+    assert df.index.tolist() == expected.index.tolist()
+    assert gating.frame(condition="unknown").empty
+
+
+def test_gating_feeds_plots(filtered_data, tmp_path):
+    gating = write_gating(
+        filtered_data, tmp_path / "screen.gating", extra=["area_nucleus"]
+    )
+    assert (tmp_path / "screen.gating").stat().st_size * 5 < len(
+        filtered_data[gating.columns].to_csv(index=False)
+    )
+    pd.testing.assert_frame_equal(
+        cc_phase(GatingFile(tmp_path / "screen.gating").frame()),
+        cc_phase(filtered_data),
+    )
+    comb_plot(
+        gating,
+        ["NT", "SCR"],
+        "area_nucleus",
+        8000,
+        selector_val="RPE-1_WT",
+        save=False,
+    )
+    plt.close("all")
+
+
+def test_gating_unsorted_plates(tmp_path):
+    df = pd.DataFrame(
+        {
+            "plate_id": [2, 1, 2, 1],
+            "condition": ["a", None, "a", "b"],
+            "integrated_int_DAPI_norm": [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+    gating = write_gating(df, tmp_path / "screen.gating")
+    pd.testing.assert_frame_equal(gating.frame(), df, check_dtype=False)
+    selected = gating.frame(plate_id=1)
+    assert selected.index.tolist() == [1, 3]
+    assert selected.condition.isna().tolist() == [True, False]
+
+
+def test_gating_keeps_missing_keys_apart(tmp_path):
+    df = pd.DataFrame({"condition": ["nan", None, "NT", np.nan]})
+    df = write_gating(df, tmp_path / "screen.gating").frame()
+    assert df.condition.isna().tolist() == [False, True, False, True]
+    assert df.condition[0] == "nan"
+
+
+def test_gating_writer_error_removes_file(cell_cycle_data, tmp_path):
+    path = tmp_path / "screen.gating"
+    with pytest.raises(RuntimeError), GatingWriter(path) as writer:
+        writer.write(cell_cycle_data[["plate_id", "condition"]].iloc[:500])
+        raise RuntimeError("interrupted")
+    assert not path.exists()
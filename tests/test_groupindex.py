@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.groupindex import GroupIndex
+from omero_screen_analysis.utils import select_datapoints, selector_val_filter
+
+
+def test_positions_match_boolean_masks(cell_cycle_data):
+    df = cell_cycle_data
+    index = GroupIndex.from_frame(df, ["plate_id", "condition", "cell_line"])
+    assert len(index) == df.groupby(index.keys).ngroups
+    expected = np.flatnonzero(
+        df.condition.isin(["NT", "SCR"]) & (df.cell_line == "RPE-1_WT")
+    )
+    result = index.positions(condition=["NT", "SCR"], cell_line="RPE-1_WT")
+    np.testing.assert_array_equal(result, expected)
+    assert len(index.positions(condition="missing")) == 0
+
+
+def test_missing_keys_form_their_own_group():
+    df = pd.DataFrame({"condition": ["a", None, "a", "b"]})
+    index = GroupIndex.from_frame(df, ["condition"])
+    groups = dict(index.groups())
+    np.testing.assert_array_equal(groups[("a",)], [0, 2])
+    assert index.positions(condition="b").tolist() == [3]
+    assert index.n_rows == 4
+
+
+def test_categorical_keys_index_observed_values():
+    df = pd.DataFrame(
+        {"condition": pd.Categorical(["SCR", "NT", "SCR"], ["CDK4", "NT", "SCR"])}
+    )
+    index = GroupIndex.from_frame(df, ["condition"])
+    assert index.groups_table["condition"].tolist() == ["NT", "SCR"]
+    assert index.positions(condition="SCR").tolist() == [0, 2]
+
+
+def test_helpers_use_index(cell_cycle_data):
+    index = GroupIndex.from_frame(cell_cycle_data, ["condition", "cell_line"])
+    args = ("cell_line", "RPE-1_WT", "condition", ["NT", "SCR"])
+    indexed = selector_val_filter(cell_cycle_data, *args, index=index)
+    masked = selector_val_filter(cell_cycle_data, *args)
+    pd.testing.assert_frame_equal(indexed, masked)
+
+    sampled = select_datapoints(masked, ["NT", "SCR"], "condition", n=30)
+    sizes = sampled.groupby(["condition", "plate_id"]).size()
+    assert (sizes <= 30).all()
+    assert set(sizes.index.get_level_values(0)) == {"NT", "SCR"}
+
+
+def test_stale_index_is_rejected(cell_cycle_data):
+    index = GroupIndex.from_frame(cell_cycle_data, ["condition", "cell_line"])
+    filtered = cell_cycle_data[cell_cycle_data.condition != "NT"]
+    with pytest.raises(ValueError, match="rebuild"):
+        selector_val_filter(
+            filtered, "cell_line", "RPE-1_WT", "condition", ["SCR"], index=index
+        )
@@ -0,0 +1,115 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.featureplot import feature_plot
+from omero_screen_analysis.hierarchical import (
+    compare_conditions,
+    condition_pvalues,
+    fdr_bh,
+)
+
+
+def simulated_screen(seed=0, effect=0.5):
+    """3 plates x 4 wells x 100 cells with plate, well and cell noise."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for plate in range(3):
+        plate_shift = rng.normal(0, 2)
+        for condition, shift in [("NT", 0), ("hit", effect), ("null", 0)]:
+            for well in range(4):
+                well_shift = rng.normal(0, 0.2)
+                frames.append(
+                    pd.DataFrame(
+                        {
+                            "cell_line": "RPE-1_WT",
+                            "plate_id": plate,
+                            "condition": condition,
+                            "well": f"{condition}{well}",
+                            "feature": plate_shift
+                            + shift
+                            + well_shift
+                            + rng.normal(0, 1, 100),
+                        }
+                    )
+                )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_compare_conditions_recovers_effect():
+    result = compare_conditions(simulated_screen(), ["feature"], control="NT")
+    result = result.set_index("condition")
+    assert result.loc["hit", "estimate"] == pytest.approx(0.5, abs=0.3)
+    assert result.loc["hit", "qvalue"] < 0.05
+    assert result.loc["null", "pvalue"] > 0.05
+    assert result.loc["hit", "sigma2_cell"] == pytest.approx(1, abs=0.1)
+    assert result.loc["hit", ["plates", "wells"]].tolist() == [3, 24]
+
+
+def null_screens(n, plates, seed=0, wells=3, cells=10):
+    """n screens without any effect, told apart by cell_line."""
+    rng = np.random.default_rng(seed)
+    shape = (n, plates, 2, wells, cells)
+    y = (
+        rng.normal(0, 1, shape[:2])[:, :, None, None, None]  # plate
+        + rng.normal(0, 0.3, shape[:3])[..., None, None]  # plate x condition
+        + rng.normal(0, 0.2, shape[:4])[..., None]  # well
+        + rng.normal(0, 1, shape)  # cell
+    )
+    screen, plate, condition, well, _ = np.indices(shape).reshape(5, -1)
+    return pd.DataFrame(
+        {
+            "cell_line": screen,
+            "plate_id": plate,
+            "condition": np.array(["NT", "null"])[condition],
+            "well": condition * wells + well,
+            "feature": y.ravel(),
+        }
+    )
+
+
+@pytest.mark.parametrize("plates", [2, 3])
+def test_compare_conditions_false_positive_rate(plates):
+    result = compare_conditions(
+        null_screens(1000, plates, seed=plates), ["feature"], control="NT"
+    )
+    assert (result.df == plates - 1).all()
+    assert 0.03 < (result.pvalue < 0.05).mean() < 0.07
+
+
+def test_compare_conditions_example_data(filtered_data):
+    features = ["area_nucleus", "intensity_mean_DAPI_nucleus"]
+    result = compare_conditions(filtered_data, features, control="NT")
+    assert len(result) == 4  # 2 cell lines x 2 features x SCR
+    assert set(result.condition) == {"SCR"}
+    assert result.pvalue.between(0, 1).all()
+
+
+def test_condition_pvalues_feed_feature_plot(filtered_data):
+    result = compare_conditions(filtered_data, ["area_nucleus"], control="NT")
+    pvalues = condition_pvalues(
+        result, ["NT", "SCR", "missing"], "area_nucleus", cell_line="RPE-1_WT"
+    )
+    expected = result[result.cell_line == "RPE-1_WT"].pvalue.item()
+    assert pvalues[0] == pytest.approx(expected)
+    assert np.isnan(pvalues[1])
+
+    # one plate: the marks are only drawn from the given p-values
+    feature_plot(
+        filtered_data,
+        "area_nucleus",
+        ["NT", "SCR"],
+        selector_val="RPE-1_WT",
+        pvalues=[0.001],
+        save=False,
+    )
+    texts = [t.get_text() for t in plt.gcf().axes[0].texts]
+    assert "***" in texts
+    plt.close("all")
+
+
+def test_fdr_bh():
+    q = fdr_bh([0.01, 0.04, np.nan, 0.03])
+    assert q[[0, 1, 3]] == pytest.approx([0.03, 0.04, 0.04])
+    assert np.isnan(q[2])
@@ -0,0 +1,46 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from scipy.stats import gaussian_kde
+
+from omero_screen_analysis.kde import (
+    fft_kde2d,
+    iso_proportion_levels,
+    kde_contours,
+)
+
+
+def test_fft_kde_matches_gaussian_kde(cell_cycle_data):
+    x = cell_cycle_data["integrated_int_DAPI_norm"].to_numpy()
+    y = cell_cycle_data["intensity_mean_EdU_nucleus_norm"].to_numpy()
+    result = fft_kde2d(x, y, log=(True, True))
+    xx, yy = np.meshgrid(np.log(result.x), np.log(result.y))
+    kde = gaussian_kde([np.log(x), np.log(y)])
+    expected = kde([xx.ravel(), yy.ravel()]).reshape(xx.shape)
+    assert np.abs(result.density - expected).max() < 0.01 * expected.max()
+    proportions = np.linspace(0.05, 1, 10)
+    np.testing.assert_allclose(
+        iso_proportion_levels(result.density, proportions),
+        iso_proportion_levels(expected, proportions),
+        rtol=0.02,
+    )
+
+
+def test_fft_kde_degenerate_input():
+    assert fft_kde2d([1.0], [2.0]) is None
+    assert fft_kde2d([1.0, 2.0, 3.0], [1.0, 1.0, 1.0]) is None
+    assert fft_kde2d([-1.0, 0.0, 2.0], [1.0, 2.0, 3.0], log=(True, False)) is None
+
+
+def test_kde_contours_follow_axis_scale(cell_cycle_data):
+    fig, ax = plt.subplots()
+    ax.set_xscale("log")
+    ax.set_yscale("log", base=2)
+    contours = kde_contours(
+        ax,
+        cell_cycle_data["integrated_int_DAPI_norm"],
+        cell_cycle_data["intensity_mean_EdU_nucleus_norm"],
+        alpha=0.3,
+    )
+    assert len(contours.levels) == 10
+    assert contours.get_alpha() == 0.3
+    plt.close(fig)
@@ -0,0 +1,110 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.benchmark import synthetic_screen
+from omero_screen_analysis.export import export_summaries, read_summary
+from omero_screen_analysis.meta import (
+    forest_plot,
+    meta_analysis,
+    plate_values,
+    pool_effects,
+    screen_effects,
+    summary_index,
+)
+
+
+@pytest.fixture
+def exports(tmp_path):
+    """Three screens in which siCDK4 doubles the nuclear area."""
+    for seed in range(3):
+        df = synthetic_screen(6000, seed=seed)
+        df.loc[df.condition == "siCDK4", "area_nucleus"] *= 2
+        if seed == 2:
+            df["condition"] = df["condition"].replace({"siCDK4": "CDK4"})
+        export_summaries(
+            df,
+            tmp_path,
+            f"screen_{seed}",
+            sorted(df.condition.unique()),
+            norm_control="NT",
+            features=["area_nucleus"],
+            fmt="csv",
+        )
+    return tmp_path
+
+
+def test_summary_index(exports):
+    index = summary_index(exports)
+    assert set(index.screen) == {"screen_0", "screen_1", "screen_2"}
+    counts = index[index.table == "counts"]
+    assert set(counts.norm_control) == {"NT"}
+    features = read_summary(exports, "features", screen="screen_0")
+    assert {"cells", "mean", "median", "std"} <= set(features.columns)
+
+
+def test_meta_analysis(exports):
+    meta = meta_analysis(exports, aliases={"CDK4": "siCDK4"})
+    pooled = meta.pooled.set_index(["metric", "condition"])
+    area = pooled.loc[("median_area_nucleus", "siCDK4")]
+    assert area.screens == 3
+    assert area.qvalue < 0.05
+    assert area.ci_low > 0
+    assert 0 <= area.I2 < 1
+    phases = pooled.loc["phase_S"]
+    assert (phases.qvalue > 0.05).all()
+    assert not (meta.effects.condition == "NT").any()
+
+    values = plate_values(exports, tables=["counts"], screens=["screen_1"])
+    assert set(values.metric) == {"relative_count"}
+    assert set(values.screen) == {"screen_1"}
+
+
+def test_pool_effects_matches_dersimonian_laird():
+    y = np.array([0.1, 0.5, 0.9, 0.3])
+    v = np.array([0.04, 0.09, 0.05, 0.02])
+    effects = pd.DataFrame(
+        {
+            "screen": list("abcd"),
+            "cell_line": "RPE-1_WT",
+            "metric": "phase_S",
+            "condition": "siCDK4",
+            "effect": y,
+            "variance": v,
+        }
+    )
+    (row,) = pool_effects(effects).to_dict("records")
+
+    w = 1 / v
+    fixed = (w * y).sum() / w.sum()
+    q = (w * (y - fixed) ** 2).sum()
+    tau2 = max(0, (q - 3) / (w.sum() - (w**2).sum() / w.sum()))
+    w_random = 1 / (v + tau2)
+    assert row["fixed"] == pytest.approx(fixed)
+    assert row["Q"] == pytest.approx(q)
+    assert row["tau2"] == pytest.approx(tau2)
+    assert row["I2"] == pytest.approx(max(0, (q - 3) / q))
+    assert row["effect"] == pytest.approx((w_random * y).sum() / w_random.sum())
+    assert row["se"] == pytest.approx(np.sqrt(1 / w_random.sum()))
+
+
+def test_screen_effects_single_plate(cell_cycle_data, tmp_path):
+    export_summaries(
+        cell_cycle_data, tmp_path, "s1", ["NT", "SCR"], norm_control="NT", fmt="csv"
+    )
+    effects = screen_effects(plate_values(tmp_path), control="NT")
+    # one plate per cell line: effects but no variance to pool
+    assert (effects.plates == 1).all()
+    assert effects.variance.isna().all()
+    with pytest.raises(ValueError, match="control"):
+        screen_effects(plate_values(tmp_path), control={"s2": "NT"})
+
+
+def test_forest_plot(exports, tmp_path):
+    meta = meta_analysis(exports, aliases={"CDK4": "siCDK4"})
+    forest_plot(
+        meta, "median_area_nucleus", ["siCDK4", "SCR"], "RPE-1_WT", path=tmp_path
+    )
+    assert (tmp_path / "meta_median_area_nucleus_RPE-1_WT.pdf").exists()
+    plt.close("all")
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from omero_screen_analysis.normalise import normalisation_factors, normalise
+
+
+def test_mode_normalisation_puts_g1_at_2(cell_cycle_data):
+    df = cell_cycle_data.drop(columns="integrated_int_DAPI_norm")
+    normalise(df, ["integrated_int_DAPI"], method="mode", target=2)
+    # one scale factor per plate and cell line
+    ratio = df["integrated_int_DAPI"] / df["integrated_int_DAPI_norm"]
+    spread = ratio.groupby([df.plate_id, df.cell_line]).agg(["min", "max"])
+    assert spread["min"].to_numpy() == pytest.approx(spread["max"].to_numpy())
+    phases = df.groupby(["cell_line", "cell_cycle"])["integrated_int_DAPI_norm"]
+    medians = phases.median().unstack()
+    assert medians["G1"].to_numpy() == pytest.approx(2, rel=0.05)
+    assert medians["G2/M"].to_numpy() == pytest.approx(4, rel=0.1)
+
+
+def test_median_and_zscore(cell_cycle_data):
+    features = ["area_nucleus", "intensity_mean_DAPI_nucleus"]
+    df = normalise(cell_cycle_data.copy(), features, method="median", by=["plate_id", "well"])
+    medians = df.groupby(["plate_id", "well"])["area_nucleus_norm"].median()
+    assert medians.to_numpy() == pytest.approx(1)
+
+    normalise(df, features, method="zscore", control="NT", suffix="_z")
+    control = df[df.condition == "NT"].groupby(["plate_id", "cell_line"])
+    assert control["area_nucleus_z"].median().to_numpy() == pytest.approx(0)
+    mad = control["area_nucleus_z"].apply(lambda x: np.median(np.abs(x)))
+    assert mad.to_numpy() == pytest.approx(1 / 1.4826)
+
+    factors = normalisation_factors(df, features, "zscore", control="NT")
+    assert len(factors) == 2 * df.cell_line.nunique()
+    with pytest.raises(ValueError):
+        normalise(df, features, method="zscore")
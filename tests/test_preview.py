@@ -0,0 +1,38 @@
+import matplotlib.pyplot as plt
+
+from omero_screen_analysis.combplot import comb_plot
+from omero_screen_analysis.preview import (
+    preview,
+    preview_sample,
+    preview_settings,
+)
+
+
+def test_preview_sample(filtered_data):
+    assert preview_sample(filtered_data, ["condition"]) is filtered_data
+    with preview(cells=50):
+        sample = preview_sample(filtered_data, ["plate_id", "condition"])
+    assert sample.groupby(["plate_id", "condition"]).size().max() == 50
+    assert preview_settings() is None
+
+
+def test_preview_comb_plot(filtered_data, tmp_path):
+    dpi = plt.rcParams["figure.dpi"]
+    kwargs = {
+        "df": filtered_data,
+        "conditions": ["NT", "SCR"],
+        "feature_col": "area_nucleus",
+        "feature_y_lim": 8000,
+        "selector_val": "RPE-1_WT",
+        "path": tmp_path,
+        "title": "combplot",
+    }
+    comb_plot(**kwargs)
+    with preview(dpi=50):
+        assert plt.rcParams["figure.dpi"] == 50
+        comb_plot(**kwargs)
+    assert plt.rcParams["figure.dpi"] == dpi
+    small = plt.imread(tmp_path / "preview" / "combplot.png")
+    full = plt.imread(tmp_path / "combplot.png")
+    assert small.shape[0] * 5 < full.shape[0]
+    plt.close("all")
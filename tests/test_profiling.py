@@ -0,0 +1,46 @@
+import matplotlib.pyplot as plt
+
+from omero_screen_analysis.countplot import count_plot
+from omero_screen_analysis.profiling import (
+    profile_records,
+    profiling,
+    summarize_profile,
+)
+
+
+def test_profiling_disabled_records_nothing(filtered_data):
+    profile_records(clear=True)
+    count_plot(
+        filtered_data,
+        "NT",
+        ["NT", "SCR"],
+        selector_val="RPE-1_WT",
+        save=False,
+    )
+    plt.close("all")
+    assert profile_records() == []
+
+
+def test_profiling_records_stages(filtered_data, tmp_path):
+    profile_records(clear=True)
+    log = tmp_path / "profile.jsonl"
+    with profiling(log):
+        count_plot(
+            filtered_data,
+            "NT",
+            ["NT", "SCR"],
+            selector_val="RPE-1_WT",
+            path=tmp_path,
+        )
+    plt.close("all")
+    summary = summarize_profile(log)
+    stages = set(zip(summary.function, summary.stage, strict=True))
+    assert {
+        ("count_plot", "total"),
+        ("count_plot/selector_val_filter", "total"),
+        ("count_plot/norm_count", "total"),
+        ("count_plot", "draw"),
+        ("count_plot/save_fig", "savefig"),
+    } <= stages
+    assert summary.loc[summary.stage == "total", "calls"].eq(1).all()
+    assert len(summarize_profile()) == len(summary)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from omero_screen_analysis.qc import Gate, qc_filter
+
+
+def test_gates(cell_cycle_data):
+    gate = Gate("area_nucleus", min=cell_cycle_data.area_nucleus.quantile(0.1))
+    df, report = qc_filter(cell_cycle_data, [gate], mad_threshold=None)
+    assert len(df) == (cell_cycle_data.area_nucleus >= gate.min).sum()
+    assert report.gates.cells.tolist() == [len(cell_cycle_data) - len(df)]
+    assert not report.wells.excluded.any()
+    assert report.wells.kept_cells.sum() == len(df)
+
+
+def test_outlier_wells_are_excluded_with_reason(tmp_path):
+    counts = {"A1": 100, "A2": 104, "A3": 97, "A4": 101, "A5": 12}
+    df = pd.DataFrame(
+        {
+            "plate_id": 1,
+            "cell_line": "RPE-1_WT",
+            "condition": "NT",
+            "well": np.repeat(list(counts), list(counts.values())),
+            "area_nucleus": 300.0,
+        }
+    )
+    df.loc[df.well == "A2", "area_nucleus"] = 5.0  # debris only
+    filtered, report = qc_filter(
+        df,
+        [Gate("area_nucleus", min=50)],
+        min_cells=20,
+        max_gated_fraction=0.5,
+    )
+    reasons = report.wells.set_index("well").reason
+    assert reasons["A5"] == "low count outlier; fewer than 20 cells"
+    assert reasons["A2"] == (
+        "low count outlier; fewer than 20 cells; over 50% of objects gated"
+    )
+    assert set(filtered.well) == {"A1", "A3", "A4"}
+
+    report.save(tmp_path)
+    saved = pd.read_csv(tmp_path / "qc_wells.csv")
+    assert saved.excluded.sum() == 2
@@ -0,0 +1,39 @@
+import matplotlib.pyplot as plt
+
+from omero_screen_analysis.render import PlotSpec, RenderPool, render
+
+
+def count_spec(filtered_data, path, fig_id="counts"):
+    return PlotSpec(
+        plot="count_plot",
+        kwargs={
+            "df": filtered_data,
+            "norm_control": "NT",
+            "conditions": ["NT", "SCR"],
+            "selector_val": "RPE-1_WT",
+        },
+        fig_id=fig_id,
+        path=path,
+        formats=("pdf", "png"),
+    )
+
+
+def test_render_closes_figure(filtered_data, tmp_path):
+    result = render(count_spec(filtered_data, tmp_path))
+    assert [f.name for f in result.files] == ["counts.pdf", "counts.png"]
+    assert all(f.exists() for f in result.files)
+    assert result.seconds > 0
+    assert result.rss > 0
+    assert plt.get_fignums() == []
+
+
+def test_render_pool(filtered_data, tmp_path):
+    specs = [
+        count_spec(filtered_data, tmp_path),
+        PlotSpec(plot="count_plot", kwargs={}, fig_id="bad", path=tmp_path),
+    ]
+    with RenderPool(workers=1) as pool:
+        good, bad = pool.map(specs)
+    assert good.error is None
+    assert (tmp_path / "counts.png").exists()
+    assert bad.error is not None and bad.files == []
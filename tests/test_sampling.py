@@ -0,0 +1,24 @@
+import pandas as pd
+
+from omero_screen_analysis.sampling import (
+    StratifiedReservoir,
+    stratified_sample,
+)
+
+
+def test_stratified_sample(filtered_data):
+    sample = stratified_sample(filtered_data, "condition", 50, random_state=0)
+    assert sample.groupby("condition").size().to_dict() == {"NT": 50, "SCR": 50}
+    assert list(sample.columns) == list(filtered_data.columns)
+
+
+def test_stratified_reservoir_chunks_keep_small_groups():
+    df = pd.DataFrame({"group": ["a"] * 1000 + ["b"] * 5, "x": range(1005)})
+    reservoir = StratifiedReservoir("group", 20, random_state=1)
+    for start in range(0, len(df), 100):
+        reservoir.update(df.iloc[start : start + 100])
+    groups = reservoir.groups()
+    assert len(groups["a"]) == 20
+    assert sorted(groups["b"].x) == [1000, 1001, 1002, 1003, 1004]
+    assert groups["a"].x.is_unique
+
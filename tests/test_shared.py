@@ -0,0 +1,95 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.cellcycleplot import cc_phase
+from omero_screen_analysis.render import PlotSpec, RenderPool
+from omero_screen_analysis.shared import SharedFrame
+
+
+def test_shared_frame_round_trip(filtered_data):
+    with SharedFrame(filtered_data) as shared:
+        frame = shared.frame()
+        assert frame.columns.tolist() == filtered_data.columns.tolist()
+        for column in filtered_data.columns:
+            np.testing.assert_array_equal(
+                np.asarray(frame[column]),
+                filtered_data[column].to_numpy(),
+            )
+
+
+def test_shared_frame_attaches_without_copy(filtered_data, tmp_path):
+    for path in (None, tmp_path):
+        with SharedFrame(filtered_data, ["area_nucleus", "condition"], path) as shared:
+            attached = pickle.loads(pickle.dumps(shared))
+            assert len(pickle.dumps(shared)) < 2000
+            area = attached.frame()["area_nucleus"].to_numpy()
+            assert np.shares_memory(area, attached.array("area_nucleus"))
+            assert not area.flags.writeable
+            assert set(attached.frame()["condition"]) == {"NT", "SCR"}
+            attached.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_shared_frame_keeps_text_dtypes(filtered_data):
+    df = filtered_data.assign(
+        experiment=filtered_data["experiment"].astype(object),
+        phase=pd.Categorical(filtered_data["cell_cycle"]),
+    )
+    with SharedFrame(df) as shared:
+        # text as Categoricals over the shared codes, decoded on request
+        codes = shared.frame()["condition"].array.codes
+        assert np.shares_memory(codes, shared.array("condition"))
+        frame = shared.frame(decode=True)
+        assert frame["condition"].dtype == df["condition"].dtype
+        assert frame["experiment"].dtype == object
+        assert isinstance(frame["phase"].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(cc_phase(frame), cc_phase(filtered_data))
+
+
+def test_shared_frame_extension_dtypes():
+    df = pd.DataFrame(
+        {
+            "count": pd.array([1, None, 3], dtype="Int64"),
+            "flag": pd.array([True, False, True], dtype="boolean"),
+        }
+    )
+    with SharedFrame(df) as shared:
+        frame = shared.frame()
+        np.testing.assert_array_equal(frame["count"], [1, np.nan, 3])
+        assert frame["flag"].dtype == bool
+    stamps = pd.DataFrame({"t": pd.date_range("2024", periods=3, tz="UTC")})
+    with pytest.raises(TypeError, match="cannot be shared"):
+        SharedFrame(stamps)
+
+
+def test_closed_shared_frame_cannot_be_sent():
+    shared = SharedFrame(pd.DataFrame({"x": [1.0, 2.0]}))
+    shared.close()
+    with pytest.raises(ValueError):
+        pickle.dumps(shared)
+
+
+def test_render_pool_with_shared_frame(filtered_data, tmp_path):
+    kwargs = {
+        "conditions": ["NT", "SCR"],
+        "selector_val": "RPE-1_WT",
+    }
+    with SharedFrame(filtered_data) as shared, RenderPool(workers=2) as pool:
+        results = pool.map(
+            [
+                PlotSpec(
+                    "cellcycle_plot", {"df": shared, **kwargs}, "cc", tmp_path
+                ),
+                PlotSpec(
+                    "feature_plot",
+                    {"df": shared, "feature": "area_nucleus", **kwargs},
+                    "area",
+                    tmp_path,
+                ),
+            ]
+        )
+    assert [r.error for r in results] == [None, None]
+    assert (tmp_path / "cc.pdf").exists() and (tmp_path / "area.pdf").exists()
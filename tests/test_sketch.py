@@ -0,0 +1,43 @@
+import numpy as np
+
+from omero_screen_analysis.sketch import (
+    QuantileSketch,
+    grouped_quantiles,
+    merge_sketch_groups,
+    sketch_groups,
+)
+
+
+def test_sketch_exact_for_small_inputs():
+    values = np.arange(100.0)
+    sketch = QuantileSketch(k=200).update(values)
+    assert sketch.exact
+    assert sketch.quantile(0.99) == np.quantile(values, 0.99)
+
+
+def test_sketch_rank_error_and_merge():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=200_000)
+    parts = np.array_split(values, 4)
+    sketch = QuantileSketch(random_state=0).update(parts[0])
+    for part in parts[1:]:
+        sketch.merge(QuantileSketch(random_state=1).update(part))
+    assert sketch.count == len(values)
+    assert len(sketch) < 5_000
+    qs = np.array([0.01, 0.5, 0.99])
+    ranks = np.searchsorted(np.sort(values), sketch.quantile(qs)) / len(values)
+    assert np.all(np.abs(ranks - qs) < 0.01)
+
+
+def test_grouped_sketches(cell_cycle_data):
+    by = ["plate_id", "condition"]
+    half = len(cell_cycle_data) // 2
+    sketches = merge_sketch_groups(
+        sketch_groups(cell_cycle_data.iloc[:half], "area_nucleus", by),
+        sketch_groups(cell_cycle_data.iloc[half:], "area_nucleus", by),
+    )
+    medians = grouped_quantiles(sketches, by, 0.5, "area_nucleus")
+    expected = cell_cycle_data.groupby(by)["area_nucleus"].median()
+    result = medians.set_index(by)["area_nucleus"].sort_index()
+    assert (result.index == expected.index).all()
+    np.testing.assert_allclose(result, expected, rtol=0.05)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.synergy import (
+    bliss_analysis,
+    hsa_analysis,
+    plot_synergy_grid,
+    screen_synergy,
+)
+
+
+def combination_screen(seed=0):
+    """Two cell lines x two plates with one well per combination."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for cell_line in ["RPE-1_WT", "RPE-1_P53KO"]:
+        for plate_id in [1, 2]:
+            for drug in [0, 1, 2]:
+                for inhibitor in [0, 10]:
+                    cells = 200 - 40 * drug - 5 * inhibitor
+                    cells += int(rng.integers(0, 20))
+                    well = f"{drug}{inhibitor}"
+                    rows += [(cell_line, plate_id, well, drug, inhibitor)] * cells
+    return pd.DataFrame(
+        rows, columns=["cell_line", "plate_id", "well", "drug", "inhibitor"]
+    )
+
+
+def test_screen_synergy_matches_single_partition():
+    df = combination_screen()
+    scores, summary = screen_synergy(df, "drug", "inhibitor")
+    part = df[(df.cell_line == "RPE-1_WT") & (df.plate_id == 2)]
+    expected = pd.concat(
+        {
+            "bliss": bliss_analysis(part, "drug", "inhibitor").stack(),
+            "hsa": hsa_analysis(part, "drug", "inhibitor").stack(),
+        },
+        axis=1,
+    )
+    got = scores[
+        (scores.cell_line == "RPE-1_WT") & (scores.plate_id == 2)
+    ].set_index(["drug", "inhibitor"])
+    assert got.bliss.to_numpy() == pytest.approx(expected.bliss.to_numpy())
+    assert got.hsa.to_numpy() == pytest.approx(expected.hsa.to_numpy())
+
+    assert len(summary) == 2 * 6
+    assert (summary.plates == 2).all()
+    assert summary.bliss_sem.notna().all()
+
+
+def test_plot_synergy_grid(tmp_path):
+    _, summary = screen_synergy(combination_screen(), "drug", "inhibitor")
+    plot_synergy_grid(summary, "drug", "inhibitor", save=True, path=tmp_path)
+    assert (tmp_path / "drug_and_inhibitor_Synergy_Analysis.pdf").exists()
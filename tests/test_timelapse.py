@@ -0,0 +1,77 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+from omero_screen_analysis.countplot import norm_count
+from omero_screen_analysis.timelapse import (
+    TimelapseAggregator,
+    kinetics_plot,
+    timepoint_summary,
+)
+
+
+@pytest.fixture
+def timelapse_data(filtered_data):
+    frames = [filtered_data.assign(timepoint=t) for t in range(3)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def chunked_summary(df, **kwargs):
+    aggregator = TimelapseAggregator(features=["area_nucleus"], **kwargs)
+    for start in range(0, len(df), 1000):
+        aggregator.update(df.iloc[start : start + 1000])
+    return aggregator.summary(norm_control="NT")
+
+
+def test_chunked_summary_matches_snapshot(timelapse_data, filtered_data):
+    shuffled = timelapse_data.sample(frac=1, random_state=0)
+    summary = chunked_summary(shuffled)
+    # seeded sketches: the same chunks give the same medians
+    pd.testing.assert_frame_equal(summary, chunked_summary(shuffled))
+    assert sorted(summary.timepoint.unique()) == [0, 1, 2]
+
+    wt = filtered_data[filtered_data.cell_line == "RPE-1_WT"]
+    first = summary[
+        (summary.timepoint == 0) & (summary.cell_line == "RPE-1_WT")
+    ].sort_values(["plate_id", "condition"])
+    expected = norm_count(wt, "NT").dropna().sort_values(
+        ["plate_id", "condition"]
+    )
+    np.testing.assert_allclose(first["count"], expected["count"])
+    np.testing.assert_allclose(
+        first["normalized_count"], expected["normalized_count"]
+    )
+    phases = ["G1", "S", "G2/M", "Polyploid", "Sub-G1"]
+    np.testing.assert_allclose(first[phases].sum(axis=1), 100)
+    medians = wt.groupby(["plate_id", "condition"])[
+        "area_nucleus"
+    ].median()
+    np.testing.assert_allclose(
+        first["area_nucleus_median"], medians.to_numpy(), rtol=0.01
+    )
+    # groups of up to k cells get exact medians
+    exact = chunked_summary(shuffled, k=100_000)
+    first = exact[
+        (exact.timepoint == 0) & (exact.cell_line == "RPE-1_WT")
+    ].sort_values(["plate_id", "condition"])
+    np.testing.assert_allclose(first["area_nucleus_median"], medians)
+
+
+def test_summary_missing_control(timelapse_data):
+    aggregator = TimelapseAggregator()
+    aggregator.update(timelapse_data)
+    with pytest.raises(ValueError, match="Control siCTRL"):
+        aggregator.summary(norm_control="siCTRL")
+
+
+def test_kinetics_plot(timelapse_data):
+    summary = timepoint_summary(timelapse_data, norm_control="NT")
+    kinetics_plot(
+        summary,
+        "normalized_count",
+        ["NT", "SCR"],
+        selector_val="RPE-1_WT",
+        save=False,
+    )
+    plt.close("all")
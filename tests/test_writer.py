@@ -0,0 +1,49 @@
+import re
+
+import matplotlib.pyplot as plt
+import pytest
+
+from omero_screen_analysis.countplot import count_plot
+from omero_screen_analysis.utils import save_fig
+from omero_screen_analysis.writer import ExportError, FigureWriter
+
+
+def test_writer_exports_in_background(filtered_data, tmp_path):
+    bundle = tmp_path / "report.pdf"
+    with FigureWriter(max_pending=1, bundle=bundle) as writer:
+        for cell_line in ["RPE-1_WT", "RPE-1_P53KO"]:
+            count_plot(
+                filtered_data,
+                "NT",
+                ["NT", "SCR"],
+                selector_val=cell_line,
+                path=tmp_path,
+            )
+    results = writer.results
+    assert [r.dest.name for r in results] == [
+        "counts_RPE-1_WT.pdf",
+        "counts_RPE-1_P53KO.pdf",
+        "report.pdf",
+    ]
+    assert all(r.error is None and r.dest.stat().st_size == r.nbytes for r in results)
+    assert len(re.findall(rb"/Type\s*/Page\b", bundle.read_bytes())) == 2
+    assert plt.get_fignums() == []
+
+
+def test_writer_bundles_each_figure_once(tmp_path):
+    bundle = tmp_path / "report.pdf"
+    with FigureWriter(bundle=bundle):
+        fig, _ = plt.subplots()
+        for extension in ["pdf", "png", "svg"]:
+            save_fig(fig, tmp_path, "figure", fig_extension=extension)
+    assert len(re.findall(rb"/Type\s*/Page\b", bundle.read_bytes())) == 1
+    assert (tmp_path / "figure.svg").exists()
+
+
+def test_writer_reports_errors(tmp_path):
+    (tmp_path / "blocked").write_text("not a directory")
+    fig, _ = plt.subplots()
+    with pytest.raises(ExportError) as excinfo:
+        with FigureWriter():
+            save_fig(fig, tmp_path / "blocked", "figure", fig_extension="png")
+    assert excinfo.value.failed[0].dest.name == "figure.png"